@@ -0,0 +1,299 @@
+# api.py
+# HTTP/JSON API lokal untuk submit request IN/OUT/RETURN secara batch, cek stok, dan approve/reject.
+# Berjalan di samping UI Streamlit, memakai aturan normalisasi/validasi & storage brand yang sama.
+#
+#   python api.py --host 127.0.0.1 --port 8600 [--auto-approve]
+#
+# Autentikasi: HTTP Basic dengan user yang sama seperti login UI (user_store), dibatasi brand yang diizinkan.
+# Approve/reject hanya untuk role admin.
+#   GET  /api/<brand>/stock[?code=ITM-0001]
+#   GET  /api/<brand>/pending[?type=OUT&user=..&event=..&trans_type=..&location=..&date_from=..&date_to=..
+#                             &item=..&page=1&page_size=100]    (admin; filter boleh diulang)
+#   GET  /api/<brand>/history?after=<seq>&limit=1000[&action=APPROVE_&action=REJECT_]   (admin; change feed,
+#        simpan "next_cursor" sebagai `after` berikutnya)
+#   POST /api/<brand>/requests  {"type": "OUT", "lines": [...], "all_or_nothing": false}
+#        tiap line boleh berisi "location" (default: Gudang Utama); OUT dicek terhadap stok tersedia per lokasi
+#        (on-hand - OUT yang masih pending)
+#        IN juga wajib "do_number" dan "attachment": {"filename": "sj.pdf", "content_base64": "..."}
+#   POST /api/<brand>/approve   {"ids": ["..."]} | {"filter": {"type": "RETURN", "event": "X"}}   (admin)
+#   POST /api/<brand>/reject    {"ids": ["..."]} | {"filter": {...}}                              (admin)
+import argparse
+import base64
+import binascii
+import json
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pandas as pd
+
+import inventory_core as core
+import auto_approve
+import attachment_store
+import history_feed
+
+log = logging.getLogger("gltkims.api")
+
+MAX_BODY_BYTES = 50 * 1024 * 1024
+DEFAULT_PAGE_SIZE = 100
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _save_attachment(att, username):
+    """Simpan lampiran base64 ke attachment store (streaming, dedup berdasarkan isi)."""
+    if not isinstance(att, dict) or not att.get("content_base64"):
+        raise ApiError(400, "Lampiran PDF Surat Jalan wajib diisi (attachment.content_base64).")
+    try:
+        return attachment_store.put_base64(att["content_base64"], att.get("filename", "file.pdf"), username,
+                                           att.get("content_type"))
+    except (binascii.Error, ValueError):
+        raise ApiError(400, "attachment.content_base64 bukan base64 yang valid.")
+    except attachment_store.AttachmentError as e:
+        raise ApiError(413, str(e))
+
+
+def submit_requests(brand, username, payload):
+    """Validasi & simpan satu batch request sebagai pending. Satu lock, satu load, satu save."""
+    req_type = core._norm_req_type(payload.get("type"))
+    lines = payload.get("lines")
+    if req_type not in core.REQ_TYPES:
+        raise ApiError(400, f"type harus salah satu dari {', '.join(core.REQ_TYPES)}.")
+    if not isinstance(lines, list) or not lines:
+        raise ApiError(400, "lines wajib berupa list dan tidak kosong.")
+
+    do_number, attachment = None, None
+    if req_type == "IN":
+        do_number = core._clean_str(payload.get("do_number"))
+        if not do_number:
+            raise ApiError(400, "Nomor Surat Jalan (do_number) wajib diisi.")
+
+    with core.brand_lock(brand):
+        data = core.load_data(brand)
+        records, errors = core.validate_request_rows(data, req_type, lines, username, start_line=1, do_number=do_number)
+        if payload.get("all_or_nothing") and errors:
+            return {"accepted": 0, "ids": [], "errors": errors}
+        if records and req_type == "IN":
+            attachment = _save_attachment(payload.get("attachment"), username)
+            for rec in records:
+                rec["attachment"] = attachment
+        pending = [core.make_pending(rec, req_type) for rec in records]
+        if pending:
+            core.add_pending(data, pending)
+            core.save_data(data, brand)
+            if attachment:
+                attachment_store.add_refs(attachment, [p["id"] for p in pending])
+    return {"accepted": len(pending), "ids": [p["id"] for p in pending], "errors": errors}
+
+
+# Filter antrean pending: nama parameter query / kunci "filter" -> argumen core.filter_pending
+PENDING_FILTER_KEYS = {"type": "types", "user": "users", "event": "events", "trans_type": "trans_types",
+                       "location": "locs", "date_from": "date_from", "date_to": "date_to", "item": "item"}
+_LIST_FILTERS = {"types", "users", "events", "trans_types", "locs"}
+
+
+def _pending_filter(params):
+    """kwargs core.filter_pending dari dict (nilai tunggal atau list)."""
+    out = {}
+    for key, arg in PENDING_FILTER_KEYS.items():
+        val = params.get(key)
+        if val in (None, "", []):
+            continue
+        vals = val if isinstance(val, list) else [val]
+        if any(isinstance(v, (dict, list)) for v in vals):
+            raise ApiError(400, f"filter {key} harus berupa teks atau list teks.")
+        if arg in ("date_from", "date_to"):
+            try:
+                vals = [pd.Timestamp(str(vals[0]))]
+            except (ValueError, TypeError):
+                raise ApiError(400, f"{key} bukan tanggal yang valid (format YYYY-MM-DD): {vals[0]}")
+            if pd.isna(vals[0]):
+                raise ApiError(400, f"{key} bukan tanggal yang valid (format YYYY-MM-DD).")
+        if arg == "types":
+            vals = [core._norm_req_type(v) for v in vals]
+        out[arg] = vals if arg in _LIST_FILTERS else vals[0]
+    return out
+
+
+def decide_requests(brand, ids=None, approve=True, filters=None):
+    """Approve/reject berdasarkan `ids`, atau seluruh hasil `filters` (satu batch, satu save)."""
+    if filters is None and (not isinstance(ids, list) or not ids):
+        raise ApiError(400, "ids wajib berupa list dan tidak kosong (atau kirim \"filter\").")
+    if filters is None and not all(isinstance(i, str) for i in ids):
+        raise ApiError(400, "ids wajib berupa list teks.")
+    if filters is not None and not isinstance(filters, dict):
+        raise ApiError(400, "filter wajib berupa object.")
+    with core.brand_lock(brand):
+        data = core.load_data(brand)
+        if filters is not None:
+            kwargs = _pending_filter(filters)
+            if not kwargs:
+                raise ApiError(400, "filter tidak boleh kosong.")
+            ids = core.filter_pending(core.pending_frame(data), **kwargs)["id"].tolist()
+        done = (core.approve_requests if approve else core.reject_requests)(data, ids)
+        if done:
+            core.save_data(data, brand)
+    done_ids = {r["id"] for r in done}
+    key = "approved" if approve else "rejected"
+    return {key: sorted(done_ids), "not_processed": [i for i in ids if i not in done_ids]}
+
+
+def get_stock(brand, code=None):
+    data = core.load_data(brand)
+    inv = data.get("inventory", {})
+    stock = core.location_stock(data)
+    codes = [code] if code else list(inv.keys())
+    return {"items": [
+        {"code": c, "name": inv[c].get("name"), "qty": int(inv[c].get("qty", 0)),
+         "unit": inv[c].get("unit", "-"), "category": inv[c].get("category", "Uncategorized"),
+         "locations": stock.by_location(c) if stock is not None else {}}
+        for c in codes if c in inv
+    ]}
+
+
+def get_pending(brand, query=None):
+    """Antrean pending tersaring; `page`/`page_size` opsional (tanpa itu semua baris dikembalikan)."""
+    query = query or {}
+    data = core.load_data(brand)
+    df = core.filter_pending(core.pending_frame(data), **_pending_filter(query))
+    total = len(df)
+    page = pages = 1
+    if query.get("page") or query.get("page_size"):
+        try:
+            page = int((query.get("page") or [1])[0])
+            page_size = int((query.get("page_size") or [DEFAULT_PAGE_SIZE])[0])
+        except ValueError:
+            raise ApiError(400, "page/page_size harus angka.")
+        if page_size <= 0:
+            raise ApiError(400, "page_size harus > 0.")
+        df, pages = core.page_of(df, page, page_size)
+        page = min(max(1, page), pages)
+    # kembalikan record asli (tanpa kolom kosong tambahan dari DataFrame)
+    by_id = {p.get("id"): p for p in data.get("pending_requests", [])}
+    return {"pending": [by_id[i] for i in df["id"]], "total": total, "page": page, "pages": pages}
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    server_version = "GLTKIMS-API/1.0"
+
+    def log_message(self, fmt, *args):
+        log.info("%s - %s", self.address_string(), fmt % args)
+
+    def _send(self, status, body):
+        raw = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _auth(self):
+        header = self.headers.get("Authorization", "")
+        if not header.startswith("Basic "):
+            raise ApiError(401, "Butuh autentikasi Basic.")
+        try:
+            username, _, password = base64.b64decode(header[6:]).decode("utf-8").partition(":")
+        except (binascii.Error, UnicodeDecodeError):
+            raise ApiError(401, "Header Authorization tidak valid.")
+        user = core.authenticate(username, password)
+        if not user:
+            raise ApiError(401, "Username atau password salah.")
+        return username, user
+
+    def _route(self):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        if len(parts) != 3 or parts[0] != "api":
+            raise ApiError(404, "Endpoint tidak ditemukan.")
+        brand, action = parts[1], parts[2]
+        if brand not in core.DATA_FILES:
+            raise ApiError(404, f"Brand '{brand}' tidak dikenal.")
+        return brand, action, parse_qs(url.query)
+
+    def _body(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            raise ApiError(400, "Content-Length tidak valid.")
+        if length < 0:
+            raise ApiError(400, "Content-Length tidak valid.")
+        if length > MAX_BODY_BYTES:
+            raise ApiError(413, "Body terlalu besar.")
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            raise ApiError(400, f"JSON tidak valid: {e}")
+        if not isinstance(body, dict):
+            raise ApiError(400, "body harus object")
+        return body
+
+    def _handle(self, method):
+        try:
+            brand, action, query = self._route()
+            username, user = self._auth()
+            if brand not in core.user_brands(user):
+                raise ApiError(403, f"Tidak punya akses ke brand '{brand}'.")
+            is_admin = user.get("role") == "admin"
+            if method == "GET" and action == "stock":
+                return self._send(200, get_stock(brand, (query.get("code") or [None])[0]))
+            if method == "GET" and action == "pending":
+                if not is_admin: raise ApiError(403, "Hanya admin.")
+                return self._send(200, get_pending(brand, query))
+            if method == "GET" and action == "history":
+                if not is_admin: raise ApiError(403, "Hanya admin.")
+                try:
+                    after = int((query.get("after") or [0])[0])
+                    limit = int((query.get("limit") or [history_feed.DEFAULT_LIMIT])[0])
+                except ValueError:
+                    raise ApiError(400, "after/limit harus angka.")
+                if limit <= 0:
+                    raise ApiError(400, "limit harus > 0.")
+                return self._send(200, history_feed.read(brand, after, limit, query.get("action")))
+            if method == "POST" and action == "requests":
+                return self._send(200, submit_requests(brand, username, self._body()))
+            if method == "POST" and action in ("approve", "reject"):
+                if not is_admin: raise ApiError(403, "Hanya admin.")
+                body = self._body()
+                return self._send(200, decide_requests(brand, body.get("ids"), approve=(action == "approve"),
+                                                       filters=body.get("filter")))
+            raise ApiError(404, "Endpoint tidak ditemukan.")
+        except ApiError as e:
+            self._send(e.status, {"error": e.message})
+        except Exception as e:
+            log.exception("Gagal memproses %s %s", method, self.path)
+            self._send(500, {"error": str(e)})
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="GLTKIMS HTTP/JSON API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--auto-approve", action="store_true", help="jalankan worker auto-approve di proses ini")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if args.auto_approve:
+        auto_approve.start_worker()
+    core.start_outbox_worker()
+    server = ThreadingHTTPServer((args.host, args.port), ApiHandler)
+    log.info("API berjalan di http://%s:%s", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,34 @@
 # app.py
 import streamlit as st
-import json
 import os
 from datetime import datetime
 import pandas as pd
 import base64
 from io import BytesIO
 
+import inventory_core as core
+import history_store
+import auto_approve
+import perf
+import forecast
+import precompute
+import kpi
+import search
+import out_ledger
+import attachment_store
+import locations
+import sheets_io
+import sheets_outbox
+import artifact_cache
+import stock_card
+import reconcile
+import frame_cache
+from locations import DEFAULT_LOCATION
+from inventory_core import (
+    UPLOADS_DIR, TRANS_TYPES, HISTORY_COLS,
+    timestamp, normalize_out_record, normalize_return_record, make_pending,
+)
+
 # Optional grafik
 try:
     import altair as alt
@@ -14,24 +36,9 @@ try:
 except Exception:
     _ALT_OK = False
 
-# ====== Konfigurasi Multi-Brand ======
-DATA_FILES = {
-    "gulavit": "gulavit_data.json",
-    "takokak": "takokak_data.json"
-}
-UPLOADS_DIR = "uploads"
 BANNER_URL = "https://media.licdn.com/dms/image/v2/D563DAQFDri8xlKNIvg/image-scale_191_1128/image-scale_191_1128/0/1678337293506/pesona_inti_rasa_cover?e=2147483647&v=beta&t=vHi0xtyAZsT9clHb0yBYPE8M9IaO2dNY6Cb_Vs3Ddlo"
 ICON_URL = "https://i.ibb.co/7C96T9y/favicon.png"
 
-TRANS_TYPES = ["Support", "Penjualan"]  # tipe transaksi OUT
-
-# ==== Storage backend (Google Sheets opsional) ====
-USE_SHEETS = False  # True jika ingin pakai Sheets; jika belum siap, set False
-SHEET_IDS = {
-    "gulavit": "SPREADSHEET_ID_GULAVIT",  # ganti jika USE_SHEETS=True
-    "takokak": "SPREADSHEET_ID_TAKOKAK",
-}
-
 # Pastikan folder uploads ada
 if not os.path.exists(UPLOADS_DIR):
     os.makedirs(UPLOADS_DIR)
@@ -64,9 +71,6 @@ st.markdown("""
 # ====== Utilitas ======
 ID_MONTHS = ["Januari","Februari","Maret","April","Mei","Juni","Juli","Agustus","September","Oktober","November","Desember"]
 
-def timestamp():
-    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
 def dataframe_to_excel_bytes(df: pd.DataFrame, sheet_name="Sheet1") -> bytes:
     output = BytesIO()
     with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
@@ -75,9 +79,9 @@ def dataframe_to_excel_bytes(df: pd.DataFrame, sheet_name="Sheet1") -> bytes:
     return output.read()
 
 def make_out_template_bytes(data) -> bytes:
-    """Template Excel OUT: Tanggal | Kode Barang | Nama Barang | Qty | Event | Tipe"""
+    """Template Excel OUT: Tanggal | Kode Barang | Nama Barang | Qty | Event | Tipe | Lokasi"""
     today = pd.Timestamp.now().strftime("%Y-%m-%d")
-    cols = ["Tanggal", "Kode Barang", "Nama Barang", "Qty", "Event", "Tipe"]
+    cols = ["Tanggal", "Kode Barang", "Nama Barang", "Qty", "Event", "Tipe", "Lokasi"]
     rows = []
     inv_items = list(data.get("inventory", {}).items())
     if inv_items:
@@ -88,7 +92,8 @@ def make_out_template_bytes(data) -> bytes:
                 "Nama Barang": item.get("name", ""),
                 "Qty": 1,
                 "Event": "Contoh event",
-                "Tipe": "Support"
+                "Tipe": "Support",
+                "Lokasi": DEFAULT_LOCATION
             })
     else:
         rows.append({
@@ -97,28 +102,33 @@ def make_out_template_bytes(data) -> bytes:
             "Nama Barang": "Contoh Produk",
             "Qty": 1,
             "Event": "Contoh event",
-            "Tipe": "Support"
+            "Tipe": "Support",
+            "Lokasi": DEFAULT_LOCATION
         })
     df_tmpl = pd.DataFrame(rows, columns=cols)
     return dataframe_to_excel_bytes(df_tmpl, "Template OUT")
 
 def make_return_template_bytes(data) -> bytes:
-    """Template Excel Retur: Tanggal | Kode Barang | Nama Barang | Qty | Event"""
+    """Template Excel Retur: Tanggal | Kode Barang | Nama Barang | Qty | Event | Lokasi"""
     today = pd.Timestamp.now().strftime("%Y-%m-%d")
-    cols = ["Tanggal", "Kode Barang", "Nama Barang", "Qty", "Event"]
+    cols = ["Tanggal", "Kode Barang", "Nama Barang", "Qty", "Event", "Lokasi"]
     rows = []
     inv_items = list(data.get("inventory", {}).items())
     if inv_items:
         for (code, item) in inv_items[:2]:
             rows.append({
                 "Tanggal": today, "Kode Barang": code, "Nama Barang": item.get("name", ""),
-                "Qty": 1, "Event": "Contoh event dari OUT"
+                "Qty": 1, "Event": "Contoh event dari OUT", "Lokasi": DEFAULT_LOCATION
             })
     else:
-        rows.append({"Tanggal": today, "Kode Barang": "ITM-0001", "Nama Barang": "Contoh Produk", "Qty": 1, "Event": "Contoh event dari OUT"})
+        rows.append({"Tanggal": today, "Kode Barang": "ITM-0001", "Nama Barang": "Contoh Produk", "Qty": 1, "Event": "Contoh event dari OUT", "Lokasi": DEFAULT_LOCATION})
     df_tmpl = pd.DataFrame(rows, columns=cols)
     return dataframe_to_excel_bytes(df_tmpl, "Template Retur")
 
+# Kolom Excel OUT/Retur -> kunci record request
+# Kolom "Lokasi" opsional (kosong = Gudang Utama)
+EXCEL_REQ_COLS = {"Tanggal": "date", "Kode Barang": "code", "Nama Barang": "item", "Qty": "qty", "Event": "event", "Tipe": "trans_type", "Lokasi": "location"}
+
 def make_master_template_bytes() -> bytes:
     """Template Excel Master: Kode Barang | Nama Barang | Qty | Satuan | Kategori"""
     cols = ["Kode Barang", "Nama Barang", "Qty", "Satuan", "Kategori"]
@@ -127,285 +137,199 @@ def make_master_template_bytes() -> bytes:
     }], columns=cols)
     return dataframe_to_excel_bytes(df_tmpl, "Template Master")
 
-# ===== Normalisasi record agar kolom seragam =====
-STD_REQ_COLS = ["date","code","item","qty","unit","event","trans_type","do_number","attachment","user","timestamp"]
+def cached_artifact(data, kind, params, build) -> bytes:
+    """Bytes unduhan lewat artifact_cache (kunci brand aktif + jenis + parameter + versi data)."""
+    version = artifact_cache.STATIC if data is None else data.get("_version")
+    return artifact_cache.get_or_build(st.session_state.current_brand, kind, params, version, build)
 
-def _to_date_str(val):
-    if val is None or str(val).strip() == "":
-        return datetime.now().strftime("%Y-%m-%d")
-    try:
-        return pd.to_datetime(val, errors="coerce").strftime("%Y-%m-%d")
-    except Exception:
-        return datetime.now().strftime("%Y-%m-%d")
-
-def _norm_event(s):
-    return str(s).strip() if s is not None else "-"
-
-def _norm_trans_type(s):
-    s = "" if s is None else str(s).strip().lower()
-    if s == "support": return "Support"
-    if s == "penjualan": return "Penjualan"
-    return None
-
-def normalize_out_record(base: dict) -> dict:
-    """Samakan kolom OUT, baik dari manual maupun Excel."""
-    rec = {k: None for k in STD_REQ_COLS}
-    rec.update({
-        "date": _to_date_str(base.get("date")),
-        "code": base.get("code", "-") or "-",
-        "item": base.get("item", "-") or "-",
-        "qty": int(pd.to_numeric(base.get("qty", 0), errors="coerce") or 0),
-        "unit": base.get("unit", "-") or "-",
-        "event": _norm_event(base.get("event", "-")),
-        "trans_type": _norm_trans_type(base.get("trans_type")),
-        "do_number": base.get("do_number", "-") or "-",
-        "attachment": base.get("attachment"),
-        "user": base.get("user", st.session_state.get("username", "-")),
-        "timestamp": base.get("timestamp", timestamp()),
-    })
-    return rec
-
-def normalize_return_record(base: dict) -> dict:
-    """Samakan kolom RETURN (manual/Excel)."""
-    rec = {k: None for k in STD_REQ_COLS}
-    rec.update({
-        "date": _to_date_str(base.get("date")),
-        "code": base.get("code", "-") or "-",
-        "item": base.get("item", "-") or "-",
-        "qty": int(pd.to_numeric(base.get("qty", 0), errors="coerce") or 0),
-        "unit": base.get("unit", "-") or "-",
-        "event": _norm_event(base.get("event", "-")),
-        "trans_type": None,
-        "do_number": "-",
-        "attachment": None,
-        "user": base.get("user", st.session_state.get("username", "-")),
-        "timestamp": base.get("timestamp", timestamp()),
-    })
-    return rec
-
-# ========= Google Sheets adapter =========
-def _gs_client():
-    import gspread
-    from google.oauth2.service_account import Credentials
-    scopes = [
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive",
-    ]
-    creds = Credentials.from_service_account_info(
-        dict(st.secrets.get("gcp_service_account", {})), scopes=scopes
-    )
-    return gspread.authorize(creds)
-
-def _gs_open(brand_key):
-    import gspread
-    client = _gs_client()
-    sid = SHEET_IDS.get(brand_key)
-    if not sid:
-        raise RuntimeError(f"Spreadsheet ID untuk brand '{brand_key}' belum diisi.")
-    sh = client.open_by_key(sid)
-
-    def ensure_ws(title, headers):
-        try:
-            ws = sh.worksheet(title)
-        except gspread.exceptions.WorksheetNotFound:
-            ws = sh.add_worksheet(title=title, rows=1000, cols=max(10, len(headers)))
-            ws.append_row(headers)
-        # pastikan header
-        values = ws.get_values("1:1")
-        if not values or values[0] != headers:
-            ws.clear()
-            ws.append_row(headers)
-        return ws
-
-    ws_users   = ensure_ws("users",   ["username","password","role"])
-    ws_inv     = ensure_ws("inventory", ["code","name","qty","unit","category"])
-    ws_pending = ensure_ws("pending_requests", ["type"] + STD_REQ_COLS)
-    ws_history = ensure_ws("history",
-                           ["action","item","qty","stock","unit","user","event",
-                            "do_number","attachment","timestamp","date","code","trans_type"])
-    return sh, ws_users, ws_inv, ws_pending, ws_history
-
-def _df_from_ws(ws):
-    rows = ws.get_all_records()
-    return pd.DataFrame(rows)
-
-def _write_df(ws, df: pd.DataFrame, headers):
-    df = df.copy()
-    for h in headers:
-        if h not in df.columns:
-            df[h] = None
-    df = df[headers]
-    ws.clear()
-    ws.append_row(headers)
-    if len(df) > 0:
-        ws.append_rows(df.astype(object).where(pd.notna(df), None).values.tolist())
-
-def load_data_sheets(brand_key):
-    _, ws_users, ws_inv, ws_pending, ws_history = _gs_open(brand_key)
-    df_users   = _df_from_ws(ws_users)
-    df_inv     = _df_from_ws(ws_inv)
-    df_pending = _df_from_ws(ws_pending)
-    df_history = _df_from_ws(ws_history)
-
-    users = {}
-    if not df_users.empty:
-        for _, r in df_users.iterrows():
-            users[str(r["username"])] = {"password": str(r["password"]), "role": str(r["role"])}
-
-    if not users:
-        users = {
-            "admin": {"password": st.secrets.get("passwords", {}).get("admin"), "role": "admin"},
-            "user":  {"password": st.secrets.get("passwords", {}).get("user"),  "role": "user"},
-        }
-
-    inventory = {}
-    if not df_inv.empty:
-        for _, r in df_inv.iterrows():
-            code = str(r["code"])
-            inventory[code] = {
-                "name": str(r.get("name", "")),
-                "qty": int(pd.to_numeric(r.get("qty", 0), errors="coerce") or 0),
-                "unit": str(r.get("unit", "-")) if pd.notna(r.get("unit")) else "-",
-                "category": str(r.get("category", "Uncategorized")) if pd.notna(r.get("category")) else "Uncategorized",
-            }
-
-    pending_requests = df_pending.to_dict(orient="records") if not df_pending.empty else []
-    history = df_history.to_dict(orient="records") if not df_history.empty else []
-
-    return {
-        "users": users,
-        "inventory": inventory,
-        "item_counter": 0,
-        "pending_requests": pending_requests,
-        "history": history,
-    }
+def out_template_bytes(data) -> bytes:
+    # template memuat tanggal hari ini -> tanggal ikut kunci
+    return cached_artifact(data, "template_out", (pd.Timestamp.now().strftime("%Y-%m-%d"),), lambda: make_out_template_bytes(data))
 
-def save_data_sheets(data, brand_key):
-    _, ws_users, ws_inv, ws_pending, ws_history = _gs_open(brand_key)
-    users_rows = []
-    for uname, info in data.get("users", {}).items():
-        users_rows.append({"username": uname, "password": info.get("password",""), "role": info.get("role","user")})
-    _write_df(ws_users, pd.DataFrame(users_rows), ["username","password","role"])
-
-    inv_rows = []
-    for code, it in data.get("inventory", {}).items():
-        inv_rows.append({
-            "code": code, "name": it.get("name",""), "qty": int(it.get("qty",0)),
-            "unit": it.get("unit","-"), "category": it.get("category","Uncategorized"),
-        })
-    _write_df(ws_inv, pd.DataFrame(inv_rows), ["code","name","qty","unit","category"])
-    _write_df(ws_pending, pd.DataFrame(data.get("pending_requests", [])), ["type"] + STD_REQ_COLS)
-    _write_df(ws_history, pd.DataFrame(data.get("history", [])),
-              ["action","item","qty","stock","unit","user","event","do_number","attachment","timestamp","date","code","trans_type"])
+def return_template_bytes(data) -> bytes:
+    return cached_artifact(data, "template_retur", (pd.Timestamp.now().strftime("%Y-%m-%d"),), lambda: make_return_template_bytes(data))
 
-# ====== Wrapper load/save (Sheets -> fallback JSON) ======
+def master_template_bytes() -> bytes:
+    return cached_artifact(None, "template_master", (), make_master_template_bytes)
+
+# ====== Wrapper load/save (Sheets -> fallback JSON), peringatan tampil di UI ======
 def load_data(brand_key):
-    if USE_SHEETS:
-        try:
-            return load_data_sheets(brand_key)
-        except Exception as e:
-            st.warning(f"Gagal membaca Google Sheets: {e}. Pakai data lokal sementara.")
-    # fallback JSON
-    data_file = DATA_FILES[brand_key]
-    if os.path.exists(data_file):
-        try:
-            with open(data_file, "r") as f:
-                data = json.load(f)
-                for code, item in data.get("inventory", {}).items():
-                    if "category" not in item:
-                        item["category"] = "Uncategorized"
-                return data
-        except (json.JSONDecodeError, FileNotFoundError):
-            pass
-    return {
-        "users": {
-            "admin": {"password": st.secrets.get("passwords", {}).get("admin"), "role": "admin"},
-            "user":  {"password": st.secrets.get("passwords", {}).get("user"),  "role": "user"},
-        },
-        "inventory": {},
-        "item_counter": 0,
-        "pending_requests": [],
-        "history": [],
-    }
+    with perf.span("load_data"):
+        return core.load_data(brand_key, warn=st.warning)
+
+def mutate_data(brand_key, fn):
+    """Ubah data brand lewat core.mutate: data terbaru dimuat ulang di bawah kunci brand, fn(data) dijalankan, lalu disimpan.
+
+    Snapshot `data` milik rerun ini hanya untuk tampilan & validasi awal; jangan disimpan langsung (bisa menimpa
+    penulisan session lain / worker auto-approve). Mengembalikan hasil fn.
+    """
+    with perf.span("save_data"):
+        _, result = core.mutate(brand_key, fn, warn=st.warning)
+    precompute.notify()
+    return result
 
-def save_data(data, brand_key):
-    if USE_SHEETS:
-        try:
-            save_data_sheets(data, brand_key)
-        except Exception as e:
-            st.warning(f"Gagal menulis ke Google Sheets: {e}. Menyimpan cadangan lokal.")
-    # simpan cadangan JSON lokal
-    data_file = DATA_FILES[brand_key]
-    with open(data_file, "w") as f:
-        json.dump(data, f, indent=4)
+# ====== Pencarian item (indeks prefix + trigram per versi inventory) ======
+PICKER_LIMIT = 200
+
+def _search_index(data):
+    return search.get_index(st.session_state.current_brand, data.get("_version"), data.get("inventory", {}))
+
+def _inventory_table(data, query="", category=None, location=None):
+    """Tabel stok (Kode, Nama Barang, Qty, Satuan, Kategori); bila ada query, urut relevansi dari indeks.
+
+    Qty = stok di `location` bila diberikan, selain itu total semua lokasi.
+    """
+    base = frame_cache.get_or_build(st.session_state.current_brand, "inventory_table", data.get("_version"),
+                                    lambda: _inventory_base(data, location), params=(location,))
+    if query:
+        df = base.loc[[c for c in _search_index(data).search(query, category=category) if c in base.index]]
+    elif category is not None:
+        df = base[base["Kategori"] == category]
+    else:
+        df = base
+    return df.reset_index(drop=True)
+
+def _inventory_base(data, location=None):
+    """Tabel stok lengkap (index = kode, urut master) untuk frame_cache; difilter per query/kategori oleh pemanggil."""
+    inv = data.get("inventory", {})
+    return pd.DataFrame([
+        {"Kode": c, "Nama Barang": it["name"], "Qty": core.stock_at(data, c, location), "Satuan": it.get("unit", "-"), "Kategori": it.get("category", "Uncategorized")}
+        for c, it in inv.items()
+    ], columns=["Kode", "Nama Barang", "Qty", "Satuan", "Kategori"], index=pd.Index(list(inv), dtype=object))
+
+def _item_picker(data, key, label_fmt):
+    """Pilih barang lewat kotak cari terindeks + selectbox hasil (maks PICKER_LIMIT). Return (kode, item)."""
+    inv = data["inventory"]
+    q = st.text_input("Cari Barang (nama / kode)", key=f"{key}_q")
+    codes = _search_index(data).search(q, limit=PICKER_LIMIT) if q else []
+    if q and not codes:
+        st.warning("Barang tidak ditemukan, menampilkan daftar awal.")
+    if not codes:
+        codes = list(inv.keys())[:PICKER_LIMIT]
+        if len(inv) > PICKER_LIMIT:
+            st.caption(f"Menampilkan {PICKER_LIMIT} dari {len(inv):,} barang — ketik untuk mencari.")
+    code = st.selectbox("Pilih Barang", codes, format_func=lambda c: label_fmt(inv[c]), key=f"{key}_sel")
+    return code, inv[code]
+
+def _location_picker(data, key, label="Lokasi"):
+    """Pilih lokasi stok; tanpa widget bila brand hanya punya satu lokasi."""
+    names = core.location_names(data)
+    if len(names) == 1:
+        return names[0]
+    return st.selectbox(label, names, key=key)
+
+# ====== Draft request & pilihan approval (fragment: rerun lokal, hanya session state) ======
+def _draft_editor(kind, title, cols=None):
+    """Daftar draft `req_<kind>_items` + flag pilih `<kind>_select_flags`. Dipanggil di dalam fragment halaman request.
+
+    Pilih/hapus hanya me-rerun fragment; load/simpan data terjadi saat submit (rerun penuh).
+    """
+    items_key, flags_key = f"req_{kind}_items", f"{kind}_select_flags"
+    items = st.session_state[items_key]
+    if items:
+        st.subheader(title)
+        if flags_key not in st.session_state or len(st.session_state[flags_key]) != len(items):
+            st.session_state[flags_key] = [False] * len(items)
+
+        c1, c2 = st.columns([1,1])
+        if c1.button("Pilih semua", key=f"{kind}_sel_all"): st.session_state[flags_key] = [True] * len(items)
+        if c2.button("Kosongkan pilihan", key=f"{kind}_sel_none"): st.session_state[flags_key] = [False] * len(items)
+
+        df = pd.DataFrame(items)
+        if cols:
+            df = df[[c for c in cols if c in df.columns]]
+        df["Pilih"] = st.session_state[flags_key]
+        edited = st.data_editor(df, key=f"editor_{kind}", use_container_width=True, hide_index=True)
+        st.session_state[flags_key] = edited["Pilih"].fillna(False).tolist()
+
+        if st.button("Hapus Item Terpilih", key=f"delete_{kind}"):
+            mask = st.session_state[flags_key]
+            if any(mask):
+                st.session_state[items_key] = [rec for rec, keep in zip(items, [not x for x in mask]) if keep]
+                st.session_state[flags_key] = [False] * len(st.session_state[items_key])
+                st.rerun(scope="fragment")
+            else:
+                st.info("Tidak ada baris yang dipilih.")
+    # bagian submit di luar fragment hanya ikut berubah pada rerun penuh (daftar kosong <-> berisi)
+    if bool(st.session_state[items_key]) != st.session_state.get(f"{kind}_submit_shown"):
+        st.rerun()
+
+APPROVE_PAGE_SIZE = 50
+
+def _approve_notice(n_done, n_wanted):
+    """Notifikasi hasil approve; OUT yang melebihi stok on-hand lokasinya tetap pending."""
+    if n_done < n_wanted:
+        return {"type": "warning", "message": f"{n_done} request di-approve, {n_wanted - n_done} tetap pending (stok tidak cukup)."}
+    return {"type": "success", "message": f"{n_done} request di-approve."}
+
+@st.fragment
+def _approve_selector(df_page):
+    """Checkbox pilih request pada satu halaman antrean; id terpilih (lintas halaman) di `approve_selected_ids`."""
+    selected = st.session_state.setdefault("approve_selected_ids", set())
+    ids = df_page["id"].tolist()
+
+    csel1, csel2 = st.columns([1,1])
+    if csel1.button("Pilih semua (halaman ini)"):
+        selected.update(ids); st.session_state.approve_rev = st.session_state.get("approve_rev", 0) + 1
+    if csel2.button("Kosongkan pilihan"):
+        selected.clear(); st.session_state.approve_rev = st.session_state.get("approve_rev", 0) + 1
+
+    df_page = df_page.copy()
+    df_page["Pilih"] = pd.Series([i in selected for i in ids], index=df_page.index, dtype=bool)
+    # editor di-key per isi halaman & revisi pilihan agar edit lama tidak menimpa baris lain
+    col_cfg = {"Pilih": st.column_config.CheckboxColumn("Pilih", default=False)}
+    for c in df_page.columns:
+        if c != "Pilih": col_cfg[c] = st.column_config.TextColumn(c, disabled=True)
+    edited_df = st.data_editor(df_page, key=f"editor_admin_approve_{hash(tuple(ids))}_{st.session_state.get('approve_rev', 0)}", use_container_width=True, hide_index=True, column_config=col_cfg)
+    for rid, flag in zip(ids, edited_df["Pilih"].fillna(False)):
+        (selected.add if flag else selected.discard)(rid)
+    st.caption(f"{len(selected)} request dipilih.")
+
+# ===================== RIWAYAT LENGKAP =====================
+def _history_full_frame(data: dict) -> pd.DataFrame:
+    """History semua kolom untuk tabel Riwayat Lengkap: teks kosong -> "-", tanggal string, date_only, link Lampiran."""
+    df_history_full = history_store.history_frame(data["history"], HISTORY_COLS)
+    for k in HISTORY_COLS:
+        if k not in df_history_full.columns: df_history_full[k] = None
+    for k in ["do_number","event","unit"]:
+        df_history_full[k] = history_store.fillna_str(df_history_full[k], "-")
+    for k, fmt in [("timestamp", "%Y-%m-%d %H:%M:%S"), ("date", "%Y-%m-%d")]:
+        if pd.api.types.is_datetime64_any_dtype(df_history_full[k]):
+            df_history_full[k] = df_history_full[k].dt.strftime(fmt)
+    df_history_full['date_only'] = pd.to_datetime(df_history_full['date'].fillna(df_history_full['timestamp']), errors="coerce", format="mixed").dt.date
+
+    links = {}
+    def get_download_link(path):
+        # lampiran yang sama (dedup) dipakai banyak baris: baca & encode sekali per path
+        if path in links:
+            return links[path]
+        link = 'Tidak Ada'
+        status = attachment_store.status(path)
+        if status == "hot":
+            with open(path, "rb") as f:
+                bytes_data = f.read()
+            b64 = base64.b64encode(bytes_data).decode()
+            link = f'<a href="data:application/pdf;base64,{b64}" download="{attachment_store.download_name(path)}">Unduh</a>'
+        elif status == "archived":
+            # arsip tidak diekstrak saat render; diambil lewat tombol di bawah tabel
+            link = f'Arsip: {attachment_store.download_name(path)}'
+        links[path] = link
+        return link
+
+    with perf.span("history.download_links"):
+        df_history_full['Lampiran'] = df_history_full['attachment'].apply(get_download_link)
+    return df_history_full
 
 # ===================== DATA PREP UNTUK DASHBOARD =====================
+@perf.timed("prepare_history_df")
 def _prepare_history_df(data: dict) -> pd.DataFrame:
     """History rapi: hanya APPROVE_* dengan tanggal efektif & tipe."""
-    hist = data.get("history", [])
-    df = pd.DataFrame(hist)
-    if df.empty:
-        return df
-
-    df["qty"] = pd.to_numeric(df.get("qty", 0), errors="coerce").fillna(0).astype(int)
-    s_date = pd.to_datetime(df["date"], errors="coerce") if "date" in df.columns else pd.Series(pd.NaT, index=df.index)
-    s_ts = pd.to_datetime(df["timestamp"], errors="coerce") if "timestamp" in df.columns else pd.Series(pd.NaT, index=df.index)
-    df["date_eff"] = s_date.fillna(s_ts).dt.floor("D")
-
-    act = df.get("action", "").astype(str).str.upper()
-    df["type_norm"] = "-"
-    df.loc[act.str.contains("APPROVE_IN"), "type_norm"] = "IN"
-    df.loc[act.str.contains("APPROVE_OUT"), "type_norm"] = "OUT"
-    df.loc[act.str.contains("APPROVE_RETURN"), "type_norm"] = "RETURN"
-
-    for col in ["item", "event", "trans_type", "unit"]:
-        if col not in df.columns:
-            df[col] = None
-    df["event"] = df["event"].fillna("-").astype(str)
-    df["trans_type"] = df["trans_type"].fillna("-").astype(str)
-
-    df = df[df["type_norm"].isin(["IN","OUT","RETURN"])].copy()
-    df = df.dropna(subset=["date_eff"])
-    return df
-
-def _calc_kpi(df_hist: pd.DataFrame, df_inv: pd.DataFrame, start_date, end_date):
-    """KPI berbasis qty (bukan rupiah). Sales = OUT Penjualan."""
+    return precompute.prepare_history_df(data)
+
+def _calc_kpi(kpi_index: kpi.KpiIndex, df_inv: pd.DataFrame, start_date, end_date):
+    """KPI berbasis qty (bukan rupiah). Sales = OUT Penjualan. Periode & periode sebelumnya via prefix sum."""
     total_units = int(df_inv["Current Stock"].sum()) if not df_inv.empty else 0
-    total_skus  = int(len(df_inv)) if not df_inv.empty else 0
-
-    mask = (df_hist["date_eff"] >= pd.Timestamp(start_date)) & (df_hist["date_eff"] <= pd.Timestamp(end_date)) if not df_hist.empty else pd.Series([], dtype=bool)
-    df_cur = df_hist.loc[mask] if not df_hist.empty else pd.DataFrame(columns=df_hist.columns)
-    df_prev = pd.DataFrame(columns=df_hist.columns)
-    if not df_hist.empty:
-        period_days = (pd.Timestamp(end_date) - pd.Timestamp(start_date)).days + 1
-        prev_end = pd.Timestamp(start_date) - pd.Timedelta(days=1)
-        prev_start = prev_end - pd.Timedelta(days=period_days-1)
-        prev_mask = (df_hist["date_eff"] >= prev_start) & (df_hist["date_eff"] <= prev_end)
-        df_prev = df_hist.loc[prev_mask]
-
-    # Sales qty = OUT Penjualan
-    cur_sales_qty  = int(df_cur[(df_cur["type_norm"]=="OUT") & (df_cur["trans_type"]=="Penjualan")]["qty"].sum()) if not df_cur.empty else 0
-    prev_sales_qty = int(df_prev[(df_prev["type_norm"]=="OUT") & (df_prev["trans_type"]=="Penjualan")]["qty"].sum()) if not df_prev.empty else 0
-
-    # Turnover ratio ~ sales / avg inventory (disederhanakan → sales / persediaan sekarang)
-    turnover = (cur_sales_qty / total_units) if total_units > 0 else 0.0
-
-    # Inventory to Sales ratio
-    inv_to_sales = (total_units / cur_sales_qty) if cur_sales_qty > 0 else 0.0
-
-    # Avg Days of Supply ≈ persediaan sekarang / rata-rata penjualan per hari (di periode)
-    days = 0.0
-    if cur_sales_qty > 0:
-        days = total_units / (cur_sales_qty / max(1, (pd.Timestamp(end_date) - pd.Timestamp(start_date)).days + 1))
-    return {
-        "total_units": total_units,
-        "total_skus": total_skus,
-        "cur_sales": cur_sales_qty,
-        "prev_sales": prev_sales_qty,
-        "turnover": turnover,
-        "inv_to_sales": inv_to_sales,
-        "days_supply": days
-    }
+    return kpi_index.period_kpis(start_date, end_date, total_units, len(df_inv))
 
 # ===================== DASHBOARD PRO (mirip referensi) =====================
 def _kpi_card(title, value, change_text=None):
@@ -439,45 +363,45 @@ def _gauge(value, max_value, title):
     except Exception:
         st.metric(title, f"{value:.2f}")
 
-def render_dashboard_pro(data: dict, brand_label: str, allow_download=True):
+def render_dashboard_pro(data: dict, brand_label: str, allow_download=True, brand_key=None):
     """Dashboard interaktif:
        - KPI ringkas (Total SKU, Total Qty, IN/OUT/RETUR periode)
        - 3 grafik sejajar: IN / OUT / RETURN per bulan (urut & batang tebal)
        - Top 10 Current Stock (nama item)
-       - Top 5 Event OUT
-       - Reorder insight berdasar OUT 3 bulan terakhir
+       - Top 5 Event OUT (+ ringkasan stok per lokasi bila lebih dari satu lokasi)
+       - Reorder insight berdasar forecast OUT per SKU
+    Hasil precompute (versi data sama) dipakai dulu; dihitung di tempat hanya bila basi atau filter diubah.
     """
-    df_hist = _prepare_history_df(data)
-    inv_records = [
-        {"Kode": code, "Nama Barang": it.get("name","-"), "Current Stock": int(it.get("qty",0)), "Unit": it.get("unit","-")}
-        for code, it in data.get("inventory", {}).items()
-    ]
-    df_inv = pd.DataFrame(inv_records)
+    laps = perf.Laps("dashboard")
+    brand_key = brand_key or brand_label.lower()
+    pre = precompute.get(brand_key, data.get("_version"))
+    perf.set_context(precomputed=pre is not None)
+    if pre is not None:
+        df_hist, df_inv, kpi_index = pre["df_hist"], pre["df_inv"], pre["kpi"]
+    else:
+        df_hist = frame_cache.get_or_build(brand_key, "history_approved", data.get("_version"), lambda: _prepare_history_df(data))
+        df_inv = frame_cache.get_or_build(brand_key, "inventory_dashboard", data.get("_version"), lambda: precompute.inventory_frame(data))
+        kpi_index = kpi.KpiIndex(df_hist)
+    laps.mark("prep")
 
     st.markdown(f"## Dashboard — {brand_label}")
     st.caption("Semua metrik berbasis jumlah (qty). *Sales* = OUT dengan tipe **Penjualan**.")
     st.divider()
 
     # -------- Filter global (default 12 bulan terakhir) --------
-    today = pd.Timestamp.today().normalize()
-    default_start = (today - pd.DateOffset(months=11)).replace(day=1)
+    default_start, today = precompute.default_range()
     colF1, colF2 = st.columns(2)
     start_date = colF1.date_input("Tanggal mulai", value=default_start.date())
     end_date   = colF2.date_input("Tanggal akhir", value=today.date())
 
-    # Data pada rentang
-    if not df_hist.empty:
-        mask = (df_hist["date_eff"] >= pd.Timestamp(start_date)) & (df_hist["date_eff"] <= pd.Timestamp(end_date))
-        df_range = df_hist.loc[mask].copy()
-    else:
-        df_range = pd.DataFrame(columns=["date_eff","type_norm","qty","item","event","trans_type"])
+    # Data pada rentang (rentang default -> pakai hasil precompute)
+    use_pre = pre is not None and pd.Timestamp(start_date) == pre["start"] and pd.Timestamp(end_date) == pre["end"]
+    df_range = pre["df_range"] if use_pre else precompute.filter_range(df_hist, start_date, end_date)
 
-    # ====== KPI / Summary ======
-    total_sku = int(len(df_inv)) if not df_inv.empty else 0
-    total_qty = int(df_inv["Current Stock"].sum()) if not df_inv.empty else 0
-    tot_in  = int(df_range.loc[df_range["type_norm"]=="IN", "qty"].sum()) if not df_range.empty else 0
-    tot_out = int(df_range.loc[df_range["type_norm"]=="OUT", "qty"].sum()) if not df_range.empty else 0
-    tot_ret = int(df_range.loc[df_range["type_norm"]=="RETURN", "qty"].sum()) if not df_range.empty else 0
+    # ====== KPI / Summary (prefix sum: O(1) per rentang) ======
+    k = _calc_kpi(kpi_index, df_inv, start_date, end_date)
+    total_sku, total_qty = k["total_skus"], k["total_units"]
+    tot_in, tot_out, tot_ret = k["cur_in"], k["cur_out"], k["cur_ret"]
 
     k1, k2, k3, k4 = st.columns(4)
     _kpi_card("Total SKU", f"{total_sku:,}", f"Brand {brand_label}")
@@ -485,22 +409,47 @@ def render_dashboard_pro(data: dict, brand_label: str, allow_download=True):
     _kpi_card("Total IN (periode)", f"{tot_in:,}", None)
     _kpi_card("Total OUT / Retur", f"{tot_out:,} / {tot_ret:,}", None)
 
+    # Sales vs periode sebelumnya + gauge rasio
+    if k["prev_sales"]:
+        sales_change = f"{(k['cur_sales'] - k['prev_sales']) / k['prev_sales'] * 100:+.1f}% vs periode lalu ({k['prev_sales']:,})"
+    else:
+        sales_change = f"Periode lalu: {k['prev_sales']:,}"
+    g0, g1, g2, g3 = st.columns(4)
+    with g0:
+        _kpi_card("Sales (OUT Penjualan)", f"{k['cur_sales']:,}", sales_change)
+    with g1:
+        _gauge(k["turnover"], 5, "Turnover (Sales / Stock)")
+    with g2:
+        _gauge(k["inv_to_sales"], 10, "Inventory to Sales")
+    with g3:
+        _gauge(k["days_supply"], 365, "Avg Days of Supply")
+
+    with st.expander("Perbandingan periode"):
+        end_ts = pd.Timestamp(end_date).normalize()
+        windows = [
+            ("Periode terpilih", pd.Timestamp(start_date), end_ts),
+            ("30 hari", end_ts - pd.Timedelta(days=29), end_ts),
+            ("90 hari", end_ts - pd.Timedelta(days=89), end_ts),
+            ("Bulan berjalan", end_ts.replace(day=1), end_ts),
+            ("Tahun berjalan", end_ts.replace(month=1, day=1), end_ts),
+            ("12 bulan", end_ts - pd.DateOffset(years=1) + pd.Timedelta(days=1), end_ts),
+        ]
+        item_opts = ["Semua barang"] + sorted(df_inv["Nama Barang"].astype(str).unique()) if not df_inv.empty else ["Semua barang"]
+        cmp_item = st.selectbox("Barang", item_opts, key="kpi_compare_item")
+        st.caption("Setiap periode dibandingkan dengan periode sebelumnya yang sama panjang.")
+        if cmp_item == "Semua barang":
+            df_cmp = kpi_index.compare(windows, total_qty, total_sku)
+        else:
+            item_qty = int(df_inv.loc[df_inv["Nama Barang"].astype(str) == cmp_item, "Current Stock"].sum())
+            df_cmp = kpi_index.compare(windows, item_qty, 1, item=cmp_item)
+        st.dataframe(df_cmp, use_container_width=True, hide_index=True)
+    laps.mark("kpi")
+
     st.divider()
 
-    # Helper agregasi bulanan (urut) + label & index untuk sort tegas
-    def month_agg(df, tipe):
-        d = df[df["type_norm"]==tipe].copy()
-        if d.empty:
-            return pd.DataFrame({"month": [], "qty": [], "Periode": [], "idx": []})
-        d["month"] = d["date_eff"].dt.to_period("M").dt.to_timestamp()  # awal bulan
-        g = d.groupby("month", as_index=False)["qty"].sum().sort_values("month")
-        g["Periode"] = g["month"].dt.strftime("%b %Y")
-        g["idx"] = g["month"].dt.year.astype(int) * 12 + g["month"].dt.month.astype(int)
-        return g
-
-    g_in  = month_agg(df_range, "IN")
-    g_out = month_agg(df_range, "OUT")
-    g_ret = month_agg(df_range, "RETURN")
+    # Agregasi bulanan (urut) + label & index untuk sort tegas
+    months = pre["months"] if use_pre else {t: precompute.month_agg(df_range, t) for t in ("IN", "OUT", "RETURN")}
+    g_in, g_out, g_ret = months["IN"], months["OUT"], months["RETURN"]
 
     # -------- Row 1: IN/OUT/RETURN per month (batang tebal & bulan urut) --------
     c1, c2, c3 = st.columns(3)
@@ -532,6 +481,7 @@ def render_dashboard_pro(data: dict, brand_label: str, allow_download=True):
     _month_bar(c1, g_in,  "IN per Month",    "#22C55E")
     _month_bar(c2, g_out, "OUT per Month",   "#EF4444")
     _month_bar(c3, g_ret, "RETUR per Month", "#0EA5E9")
+    laps.mark("charts")
 
     st.divider()
 
@@ -540,7 +490,7 @@ def render_dashboard_pro(data: dict, brand_label: str, allow_download=True):
     with t1:
         st.markdown('<div class="card"><div class="smallcap">Top 10 Items (Current Stock)</div>', unsafe_allow_html=True)
         if _ALT_OK and not df_inv.empty:
-            top10 = df_inv.sort_values("Current Stock", ascending=False).head(10)
+            top10 = pre["top10"] if pre is not None else df_inv.sort_values("Current Stock", ascending=False).head(10)
             chart = (
                 alt.Chart(top10)
                 .mark_bar(size=22)
@@ -559,10 +509,7 @@ def render_dashboard_pro(data: dict, brand_label: str, allow_download=True):
 
     with t2:
         st.markdown('<div class="card"><div class="smallcap">Top 5 Event by OUT Qty</div>', unsafe_allow_html=True)
-        df_ev = df_range[(df_range["type_norm"]=="OUT") & (df_range["event"].notna())].copy()
-        df_ev = df_ev[df_ev["event"].astype(str).str.strip().ne("-")]
-        ev_top = (df_ev.groupby("event", as_index=False)["qty"].sum()
-                  .sort_values("qty", ascending=False).head(5))
+        ev_top = pre["ev_top"] if use_pre else precompute.top_events(df_range)
         if _ALT_OK and not ev_top.empty:
             chart = (
                 alt.Chart(ev_top)
@@ -580,82 +527,183 @@ def render_dashboard_pro(data: dict, brand_label: str, allow_download=True):
             else: st.dataframe(ev_top.rename(columns={"event":"Event","qty":"Qty"}), use_container_width=True, hide_index=True)
         st.markdown("</div>", unsafe_allow_html=True)
 
+    stock = core.location_stock(data)
+    if stock is not None and len(stock.locations) > 1:
+        with st.expander("Stok per Lokasi"):
+            st.dataframe(stock.summary(), use_container_width=True, hide_index=True)
+    laps.mark("top")
+
     st.divider()
 
-    # -------- Row 3: Reorder insight (OUT 3 bulan terakhir) --------
-    st.subheader("Reorder Insight (berdasarkan OUT 3 bulan terakhir)")
-    st.caption("Menghitung *Days of Cover* ≈ stok saat ini / rata-rata pemakaian harian (dari OUT 3 bulan terakhir).")
-    tgt_days = st.slider("Target Days of Cover", min_value=30, max_value=120, step=15, value=60)
+    # -------- Row 3: Reorder insight (forecast per SKU) --------
+    st.subheader("Reorder Insight (forecast permintaan per SKU)")
+    st.caption("Forecast OUT harian per SKU (SES / Holt / musiman mingguan, dipilih otomatis dari error 4 minggu terakhir). "
+               "*Days of Cover* ≈ stok saat ini / forecast harian; *Saran Order* memperhitungkan safety stock.")
+    colR1, colR2, colR3 = st.columns(3)
+    tgt_days = colR1.slider("Target Days of Cover", min_value=30, max_value=120, step=15, value=precompute.DEFAULT_TARGET_DAYS)
+    lead_time = int(colR2.number_input("Lead time (hari)", min_value=1, max_value=120, value=precompute.DEFAULT_LEAD_TIME, step=1))
+    service_level = colR3.select_slider("Service level", options=[0.80, 0.85, 0.90, 0.95, 0.98, 0.99], value=precompute.DEFAULT_SERVICE_LEVEL)
 
     if df_inv.empty:
         st.info("Inventory kosong.")
         return
 
-    ref_end = pd.Timestamp(end_date)
-    last3_start = (ref_end - pd.DateOffset(months=3)).normalize() + pd.Timedelta(days=1)
-    out3 = df_hist[(df_hist["type_norm"]=="OUT") & (df_hist["date_eff"] >= last3_start) & (df_hist["date_eff"] <= ref_end)]
-    out3_item = out3.groupby("item")["qty"].sum().to_dict()
-
-    rows = []
-    for _, r in df_inv.iterrows():
-        name = r["Nama Barang"]; stock = int(r["Current Stock"]); unit = r.get("Unit","-")
-        last3 = int(out3_item.get(name, 0))
-        avg_m = last3 / 3.0
-        avg_daily = (avg_m / 30.0) if avg_m > 0 else 0.0
-        if avg_daily > 0:
-            doc = stock / avg_daily  # days of cover
-        else:
-            doc = float("inf")
-
-        # rekomendasi
-        if doc == float("inf"):
-            reco, urgency = "OK (tidak ada pemakaian)", 5
-        elif doc < 15:
-            reco, urgency = "Order NOW (Urgent)", 1
-        elif doc < 30:
-            reco, urgency = "Order bulan ini", 2
-        elif doc < 60:
-            reco, urgency = "Order bulan depan", 3
-        elif doc < 90:
-            reco, urgency = "Order 2 bulan lagi", 4
-        else:
-            reco, urgency = "OK (stok aman)", 5
-
-        target_qty = int(max(0, (avg_daily * tgt_days) - stock)) if avg_daily > 0 else 0
-
-        rows.append({
-            "Nama Barang": name,
-            "Unit": unit,
-            "Current Stock": stock,
-            "OUT 3 Bulan": last3,
-            "Avg OUT / Bulan": round(avg_m, 1),
-            "Days of Cover": ("∞" if doc==float("inf") else int(round(doc))),
-            "Rekomendasi": reco,
-            "Saran Order (Qty)": target_qty,
-            "_urgency": urgency
-        })
-
-    df_reorder = pd.DataFrame(rows).sort_values(["_urgency","Days of Cover"], ascending=[True, True]).drop(columns=["_urgency"])
+    if use_pre and pre["reorder"] is not None and (tgt_days, lead_time, service_level) == (
+            precompute.DEFAULT_TARGET_DAYS, precompute.DEFAULT_LEAD_TIME, precompute.DEFAULT_SERVICE_LEVEL):
+        df_reorder = pre["reorder"]
+    else:
+        df_reorder = forecast.cached_reorder_table(
+            brand_key, data.get("_version"), df_hist, data.get("inventory", {}), pd.Timestamp(end_date),
+            target_days=tgt_days, lead_time=lead_time, service_level=service_level,
+        )
     st.dataframe(df_reorder, use_container_width=True, hide_index=True)
+    laps.mark("reorder")
 
     if allow_download:
-        xls = BytesIO()
-        with pd.ExcelWriter(xls, engine="xlsxwriter") as wr:
-            df_reorder.to_excel(wr, sheet_name="Reorder Insight", index=False)
-        xls.seek(0)
+        xls = artifact_cache.get_or_build(
+            brand_key, "reorder", (pd.Timestamp(end_date).strftime("%Y-%m-%d"), tgt_days, lead_time, service_level),
+            data.get("_version"), lambda: dataframe_to_excel_bytes(df_reorder, "Reorder Insight"))
         st.download_button(
             "Unduh Excel Reorder Insight",
-            data=xls.read(),
+            data=xls,
             file_name=f"Reorder_{brand_label.replace(' ','_')}.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
+        laps.mark("download")
+
+def render_stock_card_report(data):
+    """Laporan stock card semua barang untuk satu periode (saldo awal + mutasi + saldo berjalan), unduh Excel."""
+    with st.expander("📑 Laporan stock card semua barang (per periode)"):
+        today = pd.Timestamp.now().normalize()
+        c1, c2, c3 = st.columns([1, 1, 1.2])
+        start = c1.date_input("Dari", value=(today - pd.offsets.MonthBegin(1)).date(), key="sc_report_from")
+        end = c2.date_input("Sampai", value=today.date(), key="sc_report_to")
+        layout = c3.radio("Format", ["Satu sheet (long)", "Satu sheet per barang"], key="sc_report_layout")
+        if start > end:
+            st.warning("Tanggal mulai harus sebelum tanggal akhir.")
+            return
+        params = (str(start), str(end), layout != "Satu sheet (long)")
+        if st.button("Buat laporan", key="sc_report_build"):
+            st.session_state.sc_report_params = params
+        if st.session_state.get("sc_report_params") != params:
+            return
+        brand = st.session_state.current_brand
+        with st.spinner("Menyusun laporan..."):
+            xls = cached_artifact(data, "stock_card_all", params,
+                                  lambda: stock_card.report_bytes(data, start, end, per_sku=params[2], brand_label=brand.capitalize()))
+        st.download_button(
+            "Unduh Excel Stock Card",
+            data=xls,
+            file_name=f"Stock_Card_{brand.capitalize()}_{params[0]}_{params[1]}.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            key="sc_report_download",
+        )
+
+def render_item_stock_card(data):
+    """Stock card per barang (dipilih lewat kode) dari mutasi history, termasuk koreksi rekonsiliasi ADJUST_STOCK."""
+    if not data["history"]:
+        st.info("Belum ada riwayat transaksi.")
+        return
+    if not data["inventory"]:
+        st.info("Belum ada master barang.")
+        return
+    code, _ = _item_picker(data, "pick_card", lambda it: f"{it['name']} (Stok: {it['qty']} {it.get('unit', '-')})")
+    mv = frame_cache.get_or_build(st.session_state.current_brand, "stock_movements", data.get("_version"),
+                                  lambda: stock_card.movements(data))
+    card = stock_card.item_card(mv, code)
+    if card.empty:
+        st.info("Tidak ada riwayat transaksi yang disetujui untuk barang ini.")
+    else:
+        st.dataframe(card, use_container_width=True, hide_index=True)
+
+def render_sheets_sync_panel(brand):
+    """Status outbox Google Sheets brand aktif (admin): antrean, error terakhir, dan penyelesaian konflik."""
+    stat = sheets_outbox.status(brand)
+    conflict = stat["conflict"]
+    with st.sidebar.expander("☁️ Sinkron Google Sheets", expanded=conflict is not None):
+        if conflict:
+            st.error(f"Konflik sejak {conflict['at']}: {conflict['message']} "
+                     f"{stat['pending']} perubahan lokal menunggu.")
+            c1, c2 = st.columns(2)
+            if c1.button("Timpa Sheets dengan data lokal", key="outbox_keep_local"):
+                sheets_outbox.resolve(brand, keep_local=True)
+                st.rerun()
+            if c2.button("Pakai data Sheets", key="outbox_keep_remote", help="Perubahan lokal yang belum terkirim dibuang"):
+                sheets_outbox.resolve(brand, keep_local=False)
+                st.rerun()
+        elif stat["pending"]:
+            st.warning(f"{stat['pending']} perubahan belum sampai ke Google Sheets (dikirim di latar).")
+        else:
+            st.caption("Semua perubahan sudah tersinkron.")
+        if stat["last_error"]:
+            st.caption(f"Error terakhir: {stat['last_error']} (percobaan ke-{stat['attempts']})")
+        if stat["last_synced"]:
+            st.caption(f"Sinkron terakhir: {stat['last_synced']}")
+
+def render_perf_panel(menu):
+    """Panel performa (admin): rerun terakhir, agregat span terlambat, dan profiling on-demand."""
+    with st.sidebar.expander("⏱️ Performa"):
+        if st.button("🔬 Profil rerun berikutnya", key="perf_profile_next", help=f"cProfile satu rerun menu '{menu}'"):
+            st.session_state._profile_menu = menu
+            st.rerun()
+        profiles = perf.saved_profiles()
+        if profiles:
+            labels = [f"{p['ts']} — {p['brand']} / {p['menu']} ({p['menu_ms']:.0f} ms)" for p in profiles][::-1]
+            pick = st.selectbox("Profil tersimpan", range(len(labels)), format_func=lambda i: labels[i], key="perf_profile_pick")
+            prof = profiles[::-1][pick]
+            st.caption(f"File: `{prof['file']}`")
+            st.dataframe(pd.DataFrame(prof["top"]), use_container_width=True, hide_index=True)
+        art = artifact_cache.stats()
+        st.caption(f"Cache unduhan Excel: {art['entries']} file, {art['bytes'] / 1024:.0f} KB / "
+                   f"{art['limit_bytes'] / 1048576:.0f} MB — hit {art['hits']}, miss {art['misses']}, tergusur {art['evictions']}")
+        fc = frame_cache.stats()
+        st.caption(f"Cache DataFrame bersama: {fc['entries']} frame, {fc['bytes'] / 1048576:.1f} / "
+                   f"{fc['limit_bytes'] / 1048576:.0f} MB — hit {fc['hits']}, miss {fc['misses']}, tergusur {fc['evictions']}")
+        if fc["entries"]:
+            st.dataframe(pd.DataFrame(frame_cache.entries()), use_container_width=True, hide_index=True)
+        if core.USE_SHEETS:
+            st.caption("Google Sheets I/O (budget, retry, coalescing)")
+            st.dataframe(pd.DataFrame(sheets_io.metrics().items(), columns=["Metrik", "Nilai"]).astype(str),
+                         use_container_width=True, hide_index=True)
+        runs = perf.recent_runs()
+        if not runs:
+            st.caption("Belum ada rerun tercatat.")
+            return
+        last = runs[-1]
+        st.caption(f"Rerun terakhir: **{last['total_ms']:.0f} ms** — {last.get('menu','-')} / {last.get('brand','-')}")
+        st.dataframe(pd.DataFrame(last["spans"]), use_container_width=True, hide_index=True)
+        st.caption("Agregat per span (urut p95)")
+        df_sum = pd.DataFrame(perf.summary())
+        st.dataframe(df_sum[["span","menu","brand","count","p50_ms","p95_ms","max_ms"]].head(25), use_container_width=True, hide_index=True)
+
+
+# ====== Worker auto-approve (satu per proses server) ======
+@st.cache_resource
+def _start_auto_approve_worker():
+    return auto_approve.start_worker()
 
+_start_auto_approve_worker()
+
+# ====== Precompute dashboard (warm saat start, setelah tulis, dan tiap ganti hari) ======
+@st.cache_resource
+def _start_precompute_worker():
+    return precompute.start_worker()
+
+_start_precompute_worker()
+
+# ====== Outbox Google Sheets (replay tulisan yang belum sampai ke Sheets, termasuk sisa proses sebelumnya) ======
+@st.cache_resource
+def _start_outbox_worker():
+    return core.start_outbox_worker()
+
+_start_outbox_worker()
 
 # ====== Session State ======
 if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
     st.session_state.username = ""
     st.session_state.role = ""
+    st.session_state.brands = []
     st.session_state.current_brand = "gulavit"
 if "req_in_items" not in st.session_state:
     st.session_state.req_in_items = []
@@ -681,12 +729,16 @@ if not st.session_state.logged_in:
     username = st.text_input("Username", placeholder="Masukkan username")
     password = st.text_input("Password", type="password", placeholder="Masukkan password")
     if st.button("Login"):
-        data_login = load_data("gulavit")
-        user = data_login["users"].get(username)
-        if user and user["password"] == password:
+        user = core.authenticate(username, password)
+        brands = core.user_brands(user) if user else []
+        if user and not brands:
+            st.error("❌ User ini belum punya akses ke brand mana pun.")
+        elif user:
             st.session_state.logged_in = True
             st.session_state.username = username
             st.session_state.role = user["role"]
+            st.session_state.brands = brands
+            st.session_state.current_brand = brands[0]
             st.success(f"Login berhasil sebagai {user['role'].upper()}")
             st.rerun()
         else:
@@ -701,14 +753,18 @@ else:
     st.sidebar.caption(f"Role: **{role.upper()}**")
     st.sidebar.divider()
 
-    brand_choice = st.sidebar.selectbox("Pilih Brand", list(DATA_FILES.keys()), format_func=lambda x: x.capitalize())
+    brand_choice = st.sidebar.selectbox("Pilih Brand", st.session_state.brands, format_func=lambda x: x.capitalize())
     st.session_state.current_brand = brand_choice
+    st.session_state._perf_run = perf.begin_rerun(brand_choice, prev=st.session_state.get("_perf_run"), role=role)
     data = load_data(st.session_state.current_brand)
+    perf.set_context(history_rows=len(data.get("history", [])), inventory_rows=len(data.get("inventory", {})),
+                     pending_rows=len(data.get("pending_requests", [])))
 
     if st.sidebar.button("🚪 Logout"):
         st.session_state.logged_in = False
         st.session_state.username = ""
         st.session_state.role = ""
+        st.session_state.brands = []
         st.session_state.current_brand = "gulavit"
         st.rerun()
 
@@ -729,33 +785,30 @@ else:
             "Approve Request",
             "Riwayat Lengkap",
             "Export Laporan ke Excel",
+            "Rekonsiliasi Stok",
             "Reset Database"
         ]
         menu = st.sidebar.radio("📌 Menu Admin", admin_options)
+        perf.menu_started(menu, profile=st.session_state.pop("_profile_menu", None) == menu)
 
         # ===== Dashboard (Admin) =====
         if menu == "Dashboard":
-            render_dashboard_pro(data, brand_label=st.session_state.current_brand.capitalize(), allow_download=False)
+            render_dashboard_pro(data, brand_label=st.session_state.current_brand.capitalize(), allow_download=False, brand_key=st.session_state.current_brand)
 
         elif menu == "Lihat Stok Barang":
             st.markdown(f"## Stok Barang - Brand {st.session_state.current_brand.capitalize()}")
             st.divider()
             if data["inventory"]:
-                df_inventory_full = pd.DataFrame([
-                    {"Kode": code, "Nama Barang": item["name"], "Qty": item["qty"], "Satuan": item.get("unit", "-"), "Kategori": item.get("category", "Uncategorized")}
-                    for code, item in data["inventory"].items()
-                ])
-                unique_categories = ["Semua Kategori"] + sorted(df_inventory_full["Kategori"].unique())
+                unique_categories = ["Semua Kategori"] + sorted({it.get("category", "Uncategorized") for it in data["inventory"].values()})
                 selected_category = st.selectbox("Pilih Kategori", unique_categories)
                 search_query = st.text_input("Cari berdasarkan Nama atau Kode")
-                df_filtered = df_inventory_full.copy()
-                if selected_category != "Semua Kategori":
-                    df_filtered = df_filtered[df_filtered["Kategori"] == selected_category]
-                if search_query:
-                    df_filtered = df_filtered[
-                        df_filtered["Nama Barang"].str.contains(search_query, case=False) |
-                        df_filtered["Kode"].str.contains(search_query, case=False)
-                    ]
+                loc_names = core.location_names(data)
+                selected_loc = st.selectbox("Pilih Lokasi", ["Semua Lokasi"] + loc_names) if len(loc_names) > 1 else "Semua Lokasi"
+                df_filtered = _inventory_table(data, search_query, None if selected_category == "Semua Kategori" else selected_category,
+                                               None if selected_loc == "Semua Lokasi" else selected_loc)
+                if selected_loc == "Semua Lokasi" and len(loc_names) > 1:
+                    # rincian per lokasi digabung dari shard saat ditampilkan
+                    df_filtered = df_filtered.join(core.location_stock(data).frame(df_filtered["Kode"]), on="Kode")
                 st.dataframe(df_filtered, use_container_width=True, hide_index=True)
             else:
                 st.info("Belum ada barang di inventory.")
@@ -763,55 +816,8 @@ else:
         elif menu == "Stock Card":
             st.markdown(f"## Stock Card Barang - Brand {st.session_state.current_brand.capitalize()}")
             st.divider()
-            if not data["history"]:
-                st.info("Belum ada riwayat transaksi.")
-            else:
-                item_names = sorted(list({item["name"] for item in data["inventory"].values()}))
-                if not item_names:
-                    st.info("Belum ada master barang.")
-                else:
-                    selected_item_name = st.selectbox("Pilih Barang", item_names)
-                    if selected_item_name:
-                        filtered_history = [
-                            h for h in data["history"]
-                            if h["item"] == selected_item_name and (h["action"].startswith("APPROVE") or h["action"].startswith("ADD"))
-                        ]
-                        if filtered_history:
-                            stock_card_data = []
-                            current_balance = 0
-                            sorted_history = sorted(filtered_history, key=lambda x: x["timestamp"])
-                            for h in sorted_history:
-                                transaction_in = 0
-                                transaction_out = 0
-                                keterangan = "N/A"
-                                if h["action"] == "ADD_ITEM":
-                                    transaction_in = h["qty"]; current_balance += transaction_in
-                                    keterangan = "Initial Stock"
-                                elif h["action"] == "APPROVE_IN":
-                                    transaction_in = h["qty"]; current_balance += transaction_in
-                                    keterangan = f"Request IN by {h['user']}"
-                                    do_number = h.get('do_number', '-')
-                                    if do_number != '-': keterangan += f" (No. DO: {do_number})"
-                                elif h["action"] == "APPROVE_OUT":
-                                    transaction_out = h["qty"]; current_balance -= transaction_out
-                                    tipe = h.get("trans_type","-")
-                                    keterangan = f"Request OUT ({tipe}) by {h['user']} for event: {h.get('event', '-')}"
-                                elif h["action"] == "APPROVE_RETURN":
-                                    transaction_in = h["qty"]; current_balance += transaction_in
-                                    keterangan = f"Retur by {h['user']} for event: {h.get('event', '-')}"
-                                else:
-                                    continue
-                                stock_card_data.append({
-                                    "Tanggal": h.get("date", h["timestamp"]),
-                                    "Keterangan": keterangan,
-                                    "Masuk (IN)": transaction_in if transaction_in > 0 else "-",
-                                    "Keluar (OUT)": transaction_out if transaction_out > 0 else "-",
-                                    "Saldo Akhir": current_balance
-                                })
-                            df_stock_card = pd.DataFrame(stock_card_data)
-                            st.dataframe(df_stock_card, use_container_width=True, hide_index=True)
-                        else:
-                            st.info("Tidak ada riwayat transaksi yang disetujui untuk barang ini.")
+            render_stock_card_report(data)
+            render_item_stock_card(data)
 
         elif menu == "Tambah Master Barang":
             st.markdown(f"## Tambah Master Barang - Brand {st.session_state.current_brand.capitalize()}")
@@ -833,26 +839,32 @@ else:
                     elif not name.strip():
                         st.error("Nama barang wajib diisi.")
                     else:
-                        data["inventory"][code_input] = {"name": name.strip(), "qty": int(qty), "unit": unit.strip() if unit else "-", "category": category.strip() if category else "Uncategorized"}
-                        data["history"].append({
-                            "action": "ADD_ITEM",
-                            "item": name.strip(),
-                            "qty": int(qty),
-                            "stock": int(qty),
-                            "unit": unit.strip() if unit else "-",
-                            "user": st.session_state.username,
-                            "event": "-",
-                            "timestamp": timestamp()
-                        })
-                        save_data(data, st.session_state.current_brand)
-                        st.success(f"Barang '{name}' berhasil ditambahkan dengan kode {code_input}")
-                        st.rerun()
+                        def add_item(d):
+                            if code_input in d["inventory"]:
+                                return False
+                            d["inventory"][code_input] = {"name": name.strip(), "qty": int(qty), "unit": unit.strip() if unit else "-", "category": category.strip() if category else "Uncategorized"}
+                            d["history"].append({
+                                "action": "ADD_ITEM",
+                                "code": code_input,
+                                "item": name.strip(),
+                                "qty": int(qty),
+                                "stock": int(qty),
+                                "unit": unit.strip() if unit else "-",
+                                "user": st.session_state.username,
+                                "event": "-",
+                                "timestamp": timestamp()
+                            })
+                        if mutate_data(st.session_state.current_brand, add_item) is False:
+                            st.error(f"Kode Barang '{code_input}' sudah ada.")
+                        else:
+                            st.success(f"Barang '{name}' berhasil ditambahkan dengan kode {code_input}")
+                            st.rerun()
 
             with tab2:
                 st.info("Format Excel: **Kode Barang | Nama Barang | Qty | Satuan | Kategori**")
                 st.download_button(
                     label="📥 Unduh Template Master Excel",
-                    data=make_master_template_bytes(),
+                    data=master_template_bytes(),
                     file_name=f"Template_Master_{st.session_state.current_brand.capitalize()}.xlsx",
                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                 )
@@ -871,32 +883,37 @@ else:
                             st.error(f"Kolom berikut belum ada di Excel: {', '.join(missing)}")
                         else:
                             if st.button("Tambah dari Excel (Master)"):
-                                errors, added = [], 0
-                                for idx_row, row in df_new.iterrows():
-                                    code = str(row["Kode Barang"]).strip() if pd.notna(row["Kode Barang"]) else ""
-                                    name = str(row["Nama Barang"]).strip() if pd.notna(row["Nama Barang"]) else ""
-                                    if not code or not name:
-                                        errors.append(f"Baris {idx_row+2}: Kode/Nama wajib.")
-                                        continue
-                                    if code in data["inventory"]:
-                                        errors.append(f"Baris {idx_row+2}: Kode '{code}' sudah ada, dilewati.")
-                                        continue
-                                    qty = int(pd.to_numeric(row["Qty"], errors="coerce") or 0)
-                                    unit = str(row["Satuan"]).strip() if pd.notna(row["Satuan"]) else "-"
-                                    category = str(row["Kategori"]).strip() if pd.notna(row["Kategori"]) else "Uncategorized"
-                                    data["inventory"][code] = {"name": name, "qty": qty, "unit": unit, "category": category}
-                                    data["history"].append({
-                                        "action": "ADD_ITEM",
-                                        "item": name,
-                                        "qty": qty,
-                                        "stock": qty,
-                                        "unit": unit,
-                                        "user": st.session_state.username,
-                                        "event": "-",
-                                        "timestamp": timestamp()
-                                    })
-                                    added += 1
-                                save_data(data, st.session_state.current_brand)
+                                errors = []
+                                def add_master(d):
+                                    errors.clear()
+                                    added = 0
+                                    for idx_row, row in df_new.iterrows():
+                                        code = str(row["Kode Barang"]).strip() if pd.notna(row["Kode Barang"]) else ""
+                                        name = str(row["Nama Barang"]).strip() if pd.notna(row["Nama Barang"]) else ""
+                                        if not code or not name:
+                                            errors.append(f"Baris {idx_row+2}: Kode/Nama wajib.")
+                                            continue
+                                        if code in d["inventory"]:
+                                            errors.append(f"Baris {idx_row+2}: Kode '{code}' sudah ada, dilewati.")
+                                            continue
+                                        qty = int(pd.to_numeric(row["Qty"], errors="coerce") or 0)
+                                        unit = str(row["Satuan"]).strip() if pd.notna(row["Satuan"]) else "-"
+                                        category = str(row["Kategori"]).strip() if pd.notna(row["Kategori"]) else "Uncategorized"
+                                        d["inventory"][code] = {"name": name, "qty": qty, "unit": unit, "category": category}
+                                        d["history"].append({
+                                            "action": "ADD_ITEM",
+                                            "code": code,
+                                            "item": name,
+                                            "qty": qty,
+                                            "stock": qty,
+                                            "unit": unit,
+                                            "user": st.session_state.username,
+                                            "event": "-",
+                                            "timestamp": timestamp()
+                                        })
+                                        added += 1
+                                    return added or False
+                                added = mutate_data(st.session_state.current_brand, add_master)
                                 if added: st.success(f"{added} item master berhasil ditambahkan.")
                                 if errors: st.warning("Beberapa baris dilewati:\n- " + "\n- ".join(errors))
                                 st.rerun()
@@ -904,100 +921,83 @@ else:
         elif menu == "Approve Request":
             st.markdown(f"## Approve / Reject Request Barang - Brand {st.session_state.current_brand.capitalize()}")
             st.divider()
+            auto_rules = auto_approve.load_rules()
+            with st.expander(f"Aturan auto-approve aktif ({len(auto_rules)})"):
+                if auto_rules:
+                    st.dataframe(pd.DataFrame(auto_rules), use_container_width=True, hide_index=True)
+                else:
+                    st.caption(f"Belum ada aturan. Buat file `{auto_approve.AUTO_APPROVE_RULES_FILE}` (lihat auto_approve_rules.example.json).")
             if data["pending_requests"]:
-                processed_requests = []
-                for req in data["pending_requests"]:
-                    temp_req = req.copy()
-                    for k in STD_REQ_COLS: temp_req.setdefault(k, None)
-                    temp_req.setdefault('attachment', None)
-                    temp_req.setdefault('trans_type', None)
-                    processed_requests.append(temp_req)
-
-                df_pending = pd.DataFrame(processed_requests)
-                df_pending["Lampiran"] = df_pending["attachment"].apply(lambda x: "Ada" if x else "Tidak Ada")
-
-                if "approve_select_flags" not in st.session_state or len(st.session_state.approve_select_flags) != len(df_pending):
-                    st.session_state.approve_select_flags = [False] * len(df_pending)
-
-                csel1, csel2 = st.columns([1,1])
-                if csel1.button("Pilih semua"): st.session_state.approve_select_flags = [True]*len(df_pending)
-                if csel2.button("Kosongkan pilihan"): st.session_state.approve_select_flags = [False]*len(df_pending)
-
-                df_pending["Pilih"] = st.session_state.approve_select_flags
-                col_cfg = {"Pilih": st.column_config.CheckboxColumn("Pilih", default=False)}
-                for c in df_pending.columns:
-                    if c != "Pilih": col_cfg[c] = st.column_config.TextColumn(c, disabled=True)
-                edited_df = st.data_editor(df_pending, key="editor_admin_approve", use_container_width=True, hide_index=True, column_config=col_cfg)
-                st.session_state.approve_select_flags = edited_df["Pilih"].fillna(False).tolist()
-                selected_indices = [i for i, v in enumerate(st.session_state.approve_select_flags) if v]
+                df_all = core.pending_frame(data)
+                with st.expander("Filter antrean", expanded=True):
+                    f1, f2, f3 = st.columns(3)
+                    f_types = f1.multiselect("Tipe Request", core.REQ_TYPES)
+                    f_users = f2.multiselect("User", sorted(df_all["user"].dropna().astype(str).unique()))
+                    f_events = f3.multiselect("Event", sorted(set(df_all["event"].dropna().astype(str)) - {"-"}))
+                    f4, f5, f6 = st.columns(3)
+                    f_trans = f4.multiselect("Tipe Transaksi", TRANS_TYPES)
+                    f_locs = f5.multiselect("Lokasi", core.location_names(data))
+                    f_item = f6.text_input("Cari Barang (nama / kode)", key="approve_item_q")
+                    f7, f8 = st.columns(2)
+                    f_from = f7.date_input("Dari Tanggal", value=None, key="approve_from")
+                    f_to = f8.date_input("Sampai Tanggal", value=None, key="approve_to")
+                df_f = core.filter_pending(df_all, types=f_types, users=f_users, events=f_events, trans_types=f_trans,
+                                           locs=f_locs, date_from=f_from, date_to=f_to, item=f_item)
+                n_match = len(df_f)
+                st.caption(f"{n_match:,} dari {len(df_all):,} request pending cocok dengan filter.")
+
+                # hanya satu halaman yang dirender
+                pages = max(1, -(-n_match // APPROVE_PAGE_SIZE))
+                if st.session_state.get("approve_page", 1) > pages:
+                    st.session_state.approve_page = pages
+                page = st.number_input(f"Halaman (dari {pages})", min_value=1, max_value=pages, step=1, key="approve_page")
+                df_page, _ = core.page_of(df_f, page, APPROVE_PAGE_SIZE)
+                df_page = df_page.assign(Lampiran=df_page["attachment"].map(lambda x: "Ada" if x else "Tidak Ada"))
+                _approve_selector(df_page)
+
+                pending_ids = set(df_all["id"])
+                selected_ids = [i for i in st.session_state.approve_selected_ids if i in pending_ids]
 
                 col1, col2 = st.columns(2)
                 if col1.button("Approve Selected"):
-                    if selected_indices:
-                        for i in selected_indices:
-                            req = processed_requests[i]
-                            match_idx = next((ix for ix, r in enumerate(data["pending_requests"])
-                                              if all(r.get(k)==req.get(k) for k in ["item","qty","user","type","timestamp"])), None)
-                            if match_idx is not None:
-                                approved_req = data["pending_requests"].pop(match_idx)
-                                for code, item in data["inventory"].items():
-                                    if item["name"] == approved_req["item"]:
-                                        if approved_req["type"] == "IN": item["qty"] += int(approved_req["qty"])
-                                        elif approved_req["type"] == "OUT": item["qty"] -= int(approved_req["qty"])
-                                        elif approved_req["type"] == "RETURN": item["qty"] += int(approved_req["qty"])
-                                        data["history"].append({
-                                            "action": f"APPROVE_{approved_req['type']}",
-                                            "item": approved_req["item"],
-                                            "qty": int(approved_req["qty"]),
-                                            "stock": int(item["qty"]),
-                                            "unit": item.get("unit", "-"),
-                                            "user": approved_req["user"],
-                                            "event": approved_req.get("event", "-"),
-                                            "do_number": approved_req.get("do_number", "-"),
-                                            "attachment": approved_req.get("attachment"),
-                                            "date": approved_req.get("date", None),
-                                            "code": approved_req.get("code", None),
-                                            "trans_type": approved_req.get("trans_type", None),
-                                            "timestamp": timestamp()
-                                        })
-                        save_data(data, st.session_state.current_brand)
-                        st.session_state.notification = {"type": "success", "message": f"{len(selected_indices)} request di-approve."}
+                    if selected_ids:
+                        approved = mutate_data(st.session_state.current_brand, lambda d: core.approve_requests(d, selected_ids) or False) or []
+                        st.session_state.approve_selected_ids = set()
+                        st.session_state.notification = _approve_notice(len(approved), len(selected_ids))
                         st.rerun()
                     else:
                         st.session_state.notification = {"type": "warning", "message": "Pilih setidaknya satu item untuk di-approve."}
                         st.rerun()
                 
                 if col2.button("Reject Selected"):
-                    if selected_indices:
-                        new_pending_requests = []
-                        rejected_count = 0
-                        for ix, original_req in enumerate(data["pending_requests"]):
-                            if ix in selected_indices:
-                                rejected_count += 1
-                                data["history"].append({
-                                    "action": f"REJECT_{original_req['type']}",
-                                    "item": original_req["item"],
-                                    "qty": int(original_req["qty"]),
-                                    "stock": "-",
-                                    "unit": original_req.get("unit", "-"),
-                                    "user": original_req["user"],
-                                    "event": original_req.get("event", "-"),
-                                    "do_number": original_req.get("do_number", "-"),
-                                    "attachment": original_req.get("attachment"),
-                                    "date": original_req.get("date", None),
-                                    "code": original_req.get("code", None),
-                                    "trans_type": original_req.get("trans_type", None),
-                                    "timestamp": timestamp()
-                                })
-                            else:
-                                new_pending_requests.append(original_req)
-                        data["pending_requests"] = new_pending_requests
-                        save_data(data, st.session_state.current_brand)
-                        st.session_state.notification = {"type": "success", "message": f"{rejected_count} request di-reject."}
+                    if selected_ids:
+                        rejected = mutate_data(st.session_state.current_brand, lambda d: core.reject_requests(d, selected_ids) or False) or []
+                        st.session_state.approve_selected_ids = set()
+                        st.session_state.notification = {"type": "success", "message": f"{len(rejected)} request di-reject."}
                         st.rerun()
                     else:
                         st.session_state.notification = {"type": "warning", "message": "Pilih setidaknya satu item untuk di-reject."}
                         st.rerun()
+
+                # aksi massal: seluruh hasil filter (semua halaman) dalam satu batch & satu save
+                st.divider()
+                st.markdown("#### Aksi Massal (seluruh hasil filter)")
+                bulk_ok = st.checkbox(f"Saya yakin memproses {n_match:,} request hasil filter", key="approve_bulk_confirm")
+                b1, b2 = st.columns(2)
+                bulk_action = None
+                if b1.button(f"Approve semua hasil filter ({n_match:,})", disabled=not (bulk_ok and n_match)):
+                    bulk_action = "approve"
+                if b2.button(f"Reject semua hasil filter ({n_match:,})", disabled=not (bulk_ok and n_match)):
+                    bulk_action = "reject"
+                if bulk_action:
+                    ids = df_f["id"].tolist()
+                    decide = core.approve_requests if bulk_action == "approve" else core.reject_requests
+                    done = mutate_data(st.session_state.current_brand, lambda d: decide(d, ids) or False) or []
+                    st.session_state.approve_selected_ids = set()
+                    st.session_state.pop("approve_bulk_confirm", None)
+                    st.session_state.notification = (_approve_notice(len(done), len(ids)) if bulk_action == "approve" else
+                                                     {"type": "success", "message": f"{len(done)} request di-reject."})
+                    st.rerun()
             else:
                 st.info("Tidak ada pending request.")
 
@@ -1005,26 +1005,8 @@ else:
             st.markdown(f"## Riwayat Lengkap - Brand {st.session_state.current_brand.capitalize()}")
             st.divider()
             if data["history"]:
-                all_keys = ["action","item","qty","stock","unit","user","event","do_number","attachment","timestamp","date","code","trans_type"]
-                processed_history = []
-                for entry in data["history"]:
-                    new_entry = {key: entry.get(key, None) for key in all_keys}
-                    for k, default in [("do_number","-"),("event","-"),("unit","-")]:
-                        if new_entry.get(k) is None: new_entry[k] = default
-                    processed_history.append(new_entry)
-
-                df_history_full = pd.DataFrame(processed_history)
-                df_history_full['date_only'] = pd.to_datetime(df_history_full['date'].fillna(df_history_full['timestamp']), errors="coerce").dt.date
-
-                def get_download_link(path):
-                    if path and os.path.exists(path):
-                        with open(path, "rb") as f:
-                            bytes_data = f.read()
-                        b64 = base64.b64encode(bytes_data).decode()
-                        return f'<a href="data:application/pdf;base64,{b64}" download="{os.path.basename(path)}">Unduh</a>'
-                    return 'Tidak Ada'
-                
-                df_history_full['Lampiran'] = df_history_full['attachment'].apply(get_download_link)
+                df_history_full = frame_cache.get_or_build(st.session_state.current_brand, "history_full", data.get("_version"),
+                                                           lambda: _history_full_frame(data))
 
                 col1, col2 = st.columns(2)
                 start_date = col1.date_input("Tanggal Mulai", value=df_history_full['date_only'].min())
@@ -1049,6 +1031,18 @@ else:
                 show_cols = ["action","date","code","item","qty","unit","stock","trans_type","user","event","do_number","timestamp","Lampiran"]
                 show_cols = [c for c in show_cols if c in df_filtered.columns]
                 st.markdown(df_filtered[show_cols].to_html(escape=False, index=False), unsafe_allow_html=True)
+
+                archived = sorted(set(df_filtered.loc[df_filtered["Lampiran"].str.startswith("Arsip:"), "attachment"].dropna()))
+                if archived:
+                    with st.expander(f"Lampiran arsip ({len(archived)})"):
+                        sel = st.selectbox("Pilih lampiran", archived, format_func=attachment_store.download_name, key="arsip_sel")
+                        if st.button("Ambil dari arsip", key="arsip_get"):
+                            bytes_data = attachment_store.read_bytes(sel)
+                            if bytes_data is None:
+                                st.error("Lampiran tidak ditemukan di arsip.")
+                            else:
+                                st.download_button("Unduh", bytes_data, file_name=attachment_store.download_name(sel),
+                                                   mime="application/pdf", key="arsip_dl")
             else:
                 st.info("Belum ada riwayat.")
 
@@ -1056,32 +1050,15 @@ else:
             st.markdown(f"## Filter dan Unduh Laporan - Brand {st.session_state.current_brand.capitalize()}")
             st.divider()
             if data["inventory"]:
-                df_inventory_full = pd.DataFrame([
-                    {"Kode": code, "Nama Barang": item["name"], "Qty": item["qty"], "Satuan": item.get("unit", "-"), "Kategori": item.get("category", "Uncategorized")}
-                    for code, item in data["inventory"].items()
-                ])
-                unique_categories = ["Semua Kategori"] + sorted(df_inventory_full["Kategori"].unique())
+                unique_categories = ["Semua Kategori"] + sorted({it.get("category", "Uncategorized") for it in data["inventory"].values()})
                 selected_category = st.selectbox("Pilih Kategori", unique_categories)
                 search_query = st.text_input("Cari berdasarkan Nama atau Kode")
-                df_filtered = df_inventory_full.copy()
-                if selected_category != "Semua Kategori":
-                    df_filtered = df_filtered[df_filtered["Kategori"] == selected_category]
-                if search_query:
-                    df_filtered = df_filtered[
-                        df_filtered["Nama Barang"].str.contains(search_query, case=False) |
-                        df_filtered["Kode"].str.contains(search_query, case=False)
-                    ]
+                df_filtered = _inventory_table(data, search_query, None if selected_category == "Semua Kategori" else selected_category)
                 st.markdown("### Preview Laporan")
                 st.dataframe(df_filtered, use_container_width=True, hide_index=True)
                 if not df_filtered.empty:
-                    @st.cache_data
-                    def convert_df_to_excel(df):
-                        output = pd.ExcelWriter(f"{st.session_state.current_brand}_report_filtered.xlsx", engine='xlsxwriter')
-                        df.to_excel(output, sheet_name='Stok Barang Filtered', index=False)
-                        output.close()
-                        with open(f"{st.session_state.current_brand}_report_filtered.xlsx", "rb") as f:
-                            return f.read()
-                    excel_data = convert_df_to_excel(df_filtered)
+                    excel_data = cached_artifact(data, "export_stok", (selected_category, search_query.strip()),
+                                                 lambda: dataframe_to_excel_bytes(df_filtered, "Stok Barang Filtered"))
                     st.download_button(
                         label="Unduh Laporan Excel",
                         data=excel_data,
@@ -1093,17 +1070,44 @@ else:
             else:
                 st.info("Tidak ada data untuk diexport.")
 
+        elif menu == "Rekonsiliasi Stok":
+            st.markdown(f"## Rekonsiliasi Stok - Brand {st.session_state.current_brand.capitalize()}")
+            st.divider()
+            st.caption("Qty master dibandingkan dengan replay mutasi history (ADD_ITEM, APPROVE_*, ADJUST_STOCK) "
+                       "dan `stock` tercatat terakhir. Lompatan = baris history yang stock-nya tidak nyambung dengan mutasinya.")
+            report = reconcile.drift_report(data)
+            summ = reconcile.summarize(report)
+            c1, c2, c3, c4 = st.columns(4)
+            c1.metric("Barang", summ["items"])
+            c2.metric("OK", summ[reconcile.STATUS_OK])
+            c3.metric("Drift", summ[reconcile.STATUS_DRIFT] + summ[reconcile.STATUS_NO_HISTORY])
+            c4.metric("Total |Selisih|", summ["abs_selisih"])
+            show_all = st.checkbox("Tampilkan juga barang yang OK", key="recon_show_all")
+            shown = report if show_all else report[report["Status"] != reconcile.STATUS_OK]
+            if shown.empty:
+                st.success("Inventory dan history sinkron.")
+            else:
+                st.dataframe(shown, use_container_width=True, hide_index=True)
+            if summ["items"] > summ[reconcile.STATUS_OK]:
+                st.markdown("#### Perbaikan")
+                mode = st.radio("Sumber yang dianggap benar", list(reconcile.REPAIR_MODES), horizontal=True, key="recon_mode",
+                                format_func=lambda m: {"history": "Inventory (tambah ADJUST_STOCK di history)",
+                                                       "inventory": "History (set qty inventory = replay)"}[m])
+                if st.checkbox("Saya sudah memeriksa laporan di atas", key="recon_confirm") and st.button("Perbaiki drift", key="recon_repair"):
+                    # laporan dihitung ulang dari data terbaru di bawah kunci brand
+                    changes = mutate_data(st.session_state.current_brand,
+                                          lambda d: reconcile.repair(d, mode, st.session_state.username) or False) or []
+                    st.session_state.pop("recon_confirm", None)
+                    st.session_state.notification = {"type": "success", "message": f"✅ {len(changes)} barang diperbaiki."}
+                    st.rerun()
+
         elif menu == "Reset Database":
             st.markdown(f"## Reset Database - Brand {st.session_state.current_brand.capitalize()}")
             st.divider()
             st.warning(f"Aksi ini akan menghapus seluruh data inventori, pending, dan riwayat untuk brand **{st.session_state.current_brand.capitalize()}**.")
             confirm = st.text_input("Ketik RESET untuk konfirmasi")
             if st.button("Reset Database") and confirm == "RESET":
-                data["inventory"] = {}
-                data["item_counter"] = 0
-                data["pending_requests"] = []
-                data["history"] = []
-                save_data(data, st.session_state.current_brand)
+                mutate_data(st.session_state.current_brand, core.reset_data)
                 st.session_state.notification = {"type": "success", "message": f"✅ Database untuk {st.session_state.current_brand.capitalize()} berhasil direset!"}
                 st.rerun()
 
@@ -1118,113 +1122,49 @@ else:
             "Lihat Riwayat"
         ]
         menu = st.sidebar.radio("📌 Menu User", user_options)
+        perf.menu_started(menu, profile=st.session_state.pop("_profile_menu", None) == menu)
         items = list(data["inventory"].values())
 
         # ----- Dashboard (User) -----
         if menu == "Dashboard":
-            render_dashboard_pro(data, brand_label=st.session_state.current_brand.capitalize(), allow_download=True)
+            render_dashboard_pro(data, brand_label=st.session_state.current_brand.capitalize(), allow_download=True, brand_key=st.session_state.current_brand)
 
         # ----- Stock Card (User) -----
         elif menu == "Stock Card":
             st.markdown(f"## Stock Card Barang - Brand {st.session_state.current_brand.capitalize()}")
             st.divider()
-            if not data["history"]:
-                st.info("Belum ada riwayat transaksi.")
-            else:
-                item_names = sorted(list({item["name"] for item in data["inventory"].values()}))
-                if not item_names:
-                    st.info("Belum ada master barang.")
-                else:
-                    selected_item_name = st.selectbox("Pilih Barang", item_names)
-                    if selected_item_name:
-                        filtered_history = [
-                            h for h in data["history"]
-                            if h["item"] == selected_item_name and (h["action"].startswith("APPROVE") or h["action"].startswith("ADD"))
-                        ]
-                        if filtered_history:
-                            stock_card_data = []
-                            current_balance = 0
-                            sorted_history = sorted(filtered_history, key=lambda x: x["timestamp"])
-                            for h in sorted_history:
-                                transaction_in = 0
-                                transaction_out = 0
-                                keterangan = "N/A"
-                                if h["action"] == "ADD_ITEM":
-                                    transaction_in = h["qty"]; current_balance += transaction_in
-                                    keterangan = "Initial Stock"
-                                elif h["action"] == "APPROVE_IN":
-                                    transaction_in = h["qty"]; current_balance += transaction_in
-                                    keterangan = f"Request IN by {h['user']}"
-                                    do_number = h.get('do_number', '-')
-                                    if do_number != '-': keterangan += f" (No. DO: {do_number})"
-                                elif h["action"] == "APPROVE_OUT":
-                                    transaction_out = h["qty"]; current_balance -= transaction_out
-                                    tipe = h.get("trans_type","-")
-                                    keterangan = f"Request OUT ({tipe}) by {h['user']} for event: {h.get('event', '-')}"
-                                elif h["action"] == "APPROVE_RETURN":
-                                    transaction_in = h["qty"]; current_balance += transaction_in
-                                    keterangan = f"Retur by {h['user']} for event: {h.get('event', '-')}"
-                                else:
-                                    continue
-                                stock_card_data.append({
-                                    "Tanggal": h.get("date", h["timestamp"]),
-                                    "Keterangan": keterangan,
-                                    "Masuk (IN)": transaction_in if transaction_in > 0 else "-",
-                                    "Keluar (OUT)": transaction_out if transaction_out > 0 else "-",
-                                    "Saldo Akhir": current_balance
-                                })
-                            df_stock_card = pd.DataFrame(stock_card_data)
-                            st.dataframe(df_stock_card, use_container_width=True, hide_index=True)
-                        else:
-                            st.info("Tidak ada riwayat transaksi yang disetujui untuk barang ini.")
+            render_stock_card_report(data)
+            render_item_stock_card(data)
 
         # ----- Request Barang IN (Manual; semua wajib) -----
         elif menu == "Request Barang IN":
             st.markdown(f"## Request Barang Masuk (Manual) - Brand {st.session_state.current_brand.capitalize()}")
             st.divider()
             if items:
-                col1, col2 = st.columns(2)
-                idx = col1.selectbox(
-                    "Pilih Barang", range(len(items)),
-                    format_func=lambda x: f"{items[x]['name']} ({items[x]['qty']} {items[x].get('unit', '-')})"
-                )
-                qty = col2.number_input("Jumlah", min_value=1, step=1)
+                @st.fragment
+                def in_drafts():
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        code_sel, item_sel = _item_picker(data, "pick_in", lambda it: f"{it['name']} ({it['qty']} {it.get('unit', '-')})")
+                    qty = col2.number_input("Jumlah", min_value=1, step=1)
+                    location = _location_picker(data, "in_location", "Lokasi Tujuan")
+
+                    if st.button("Tambah Item IN"):
+                        st.session_state.req_in_items.append({
+                            "code": code_sel,
+                            "item": item_sel["name"],
+                            "qty": qty,
+                            "unit": item_sel.get("unit", "-"),
+                            "event": "-",
+                            "location": location
+                        })
+                        st.success("Item IN ditambahkan ke daftar.")
+                    _draft_editor("in", "Daftar Item Request IN", ["code","item","qty","unit","location"])
 
-                if st.button("Tambah Item IN"):
-                    st.session_state.req_in_items.append({
-                        "item": items[idx]["name"],
-                        "qty": qty,
-                        "unit": items[idx].get("unit", "-"),
-                        "event": "-"
-                    })
-                    st.success("Item IN ditambahkan ke daftar.")
+                st.session_state.in_submit_shown = bool(st.session_state.req_in_items)
+                in_drafts()
 
                 if st.session_state.req_in_items:
-                    st.subheader("Daftar Item Request IN")
-
-                    if "in_select_flags" not in st.session_state or len(st.session_state.in_select_flags) != len(st.session_state.req_in_items):
-                        st.session_state.in_select_flags = [False]*len(st.session_state.req_in_items)
-
-                    cA, cB = st.columns([1,1])
-                    if cA.button("Pilih semua", key="in_sel_all"):
-                        st.session_state.in_select_flags = [True]*len(st.session_state.req_in_items)
-                    if cB.button("Kosongkan pilihan", key="in_sel_none"):
-                        st.session_state.in_select_flags = [False]*len(st.session_state.req_in_items)
-
-                    df_in = pd.DataFrame(st.session_state.req_in_items)
-                    df_in["Pilih"] = st.session_state.in_select_flags
-                    edited_df_in = st.data_editor(df_in, key="editor_in", use_container_width=True, hide_index=True)
-                    st.session_state.in_select_flags = edited_df_in["Pilih"].fillna(False).tolist()
-
-                    if st.button("Hapus Item Terpilih", key="delete_in"):
-                        mask = st.session_state.in_select_flags
-                        if any(mask):
-                            st.session_state.req_in_items = [rec for rec, keep in zip(st.session_state.req_in_items, [not x for x in mask]) if keep]
-                            st.session_state.in_select_flags = [False]*len(st.session_state.req_in_items)
-                            st.rerun()
-                        else:
-                            st.info("Tidak ada baris yang dipilih.")
-
                     st.divider()
                     st.subheader("Informasi Wajib")
                     do_number = st.text_input("Nomor Surat Jalan (wajib)", placeholder="Masukkan Nomor Surat Jalan")
@@ -1238,37 +1178,43 @@ else:
                             st.error("Nomor Surat Jalan wajib diisi.")
                         elif not uploaded_file:
                             st.error("PDF Surat Jalan wajib diupload.")
+                        elif uploaded_file.size > attachment_store.MAX_ATTACHMENT_BYTES:
+                            st.error(f"PDF melebihi batas {attachment_store.MAX_ATTACHMENT_BYTES // (1024 * 1024)} MB.")
                         else:
-                            timestamp_str = datetime.now().strftime("%Y%m%d%H%M%S")
-                            file_ext = uploaded_file.name.split(".")[-1]
-                            attachment_path = os.path.join(UPLOADS_DIR, f"{st.session_state.username}_{timestamp_str}.{file_ext}")
-                            with open(attachment_path, "wb") as f:
-                                f.write(uploaded_file.getbuffer())
-
-                            submit_count = 0
+                            # simpan bertahap & dedup berdasarkan isi (PDF sama -> satu file)
+                            try:
+                                attachment_path = attachment_store.put(uploaded_file, uploaded_file.name, st.session_state.username, uploaded_file.type)
+                            except (attachment_store.AttachmentError, OSError) as e:
+                                st.error(f"Gagal menyimpan lampiran: {e}")
+                                st.stop()
+
+                            new_ids = []
                             new_state, new_flags = [], []
-                            for selected, rec in zip(mask, st.session_state.req_in_items):
-                                if selected:
-                                    base = {
-                                        "date": None,
-                                        "code": next((c for c, it in data["inventory"].items() if it.get("name")==rec["item"]), "-"),
-                                        "item": rec["item"],
-                                        "qty": int(rec["qty"]),
-                                        "unit": rec.get("unit", "-"),
-                                        "event": "-",
-                                        "trans_type": None,
-                                        "do_number": do_number.strip(),
-                                        "attachment": attachment_path,
-                                        "user": st.session_state.username,
-                                        "timestamp": timestamp(),
-                                    }
-                                    norm = normalize_out_record(base)
-                                    norm["type"] = "IN"
-                                    data["pending_requests"].append(norm)
-                                    submit_count += 1
-                                else:
-                                    new_state.append(rec); new_flags.append(False)
-                            save_data(data, st.session_state.current_brand)
+                            def submit_in(d):
+                                new_ids.clear(); new_state.clear(); new_flags.clear()
+                                for selected, rec in zip(mask, st.session_state.req_in_items):
+                                    if selected:
+                                        base = {
+                                            "date": None,
+                                            "code": rec.get("code", "-"),
+                                            "item": rec["item"],
+                                            "qty": int(rec["qty"]),
+                                            "unit": rec.get("unit", "-"),
+                                            "event": "-",
+                                            "trans_type": None,
+                                            "do_number": do_number.strip(),
+                                            "attachment": attachment_path,
+                                            "user": st.session_state.username,
+                                            "timestamp": timestamp(),
+                                            "location": rec.get("location"),
+                                        }
+                                        req = make_pending(normalize_out_record(base), "IN")
+                                        core.add_pending(d, [req]); new_ids.append(req["id"])
+                                    else:
+                                        new_state.append(rec); new_flags.append(False)
+                            mutate_data(st.session_state.current_brand, submit_in)
+                            submit_count = len(new_ids)
+                            attachment_store.add_refs(attachment_path, new_ids)
                             st.session_state.req_in_items = new_state
                             st.session_state.in_select_flags = new_flags
                             st.success(f"{submit_count} request IN diajukan & menunggu approval.")
@@ -1282,169 +1228,122 @@ else:
             st.divider()
 
             if items:
-                tab1, tab2 = st.tabs(["Input Manual", "Upload Excel"])
-
-                # INPUT MANUAL (wajib event & tipe)
-                with tab1:
-                    col1, col2 = st.columns(2)
-                    idx = col1.selectbox(
-                        "Pilih Barang", range(len(items)),
-                        format_func=lambda x: f"{items[x]['name']} (Stok: {items[x]['qty']} {items[x].get('unit', '-')})"
-                    )
-
-                    # handle stok 0 -> kunci input
-                    max_qty = int(pd.to_numeric(items[idx].get("qty", 0), errors="coerce") or 0)
-                    if max_qty < 1:
-                        qty = 0
-                        col2.number_input("Jumlah", min_value=0, max_value=0, step=1, value=0, disabled=True)
-                        st.warning("Stok item ini 0. Tidak bisa menambah request OUT.")
-                    else:
-                        qty = col2.number_input("Jumlah", min_value=1, max_value=max_qty, step=1)
-
-                    tipe = st.selectbox("Tipe Transaksi (wajib)", TRANS_TYPES, index=0)
-                    event_manual = st.text_input("Nama Event (wajib)", placeholder="Misal: Pameran, Acara Kantor")
-
-                    if st.button("Tambah Item OUT (Manual)"):
+                @st.fragment
+                def out_drafts():
+                    tab1, tab2 = st.tabs(["Input Manual", "Upload Excel"])
+
+                    # INPUT MANUAL (wajib event & tipe)
+                    with tab1:
+                        col1, col2 = st.columns(2)
+                        with col1:
+                            code_sel, item_sel = _item_picker(data, "pick_out", lambda it: f"{it['name']} (Stok: {it['qty']} {it.get('unit', '-')})")
+
+                        location = _location_picker(data, "out_location", "Lokasi Asal")
+                        # handle stok tersedia 0 -> kunci input (on-hand di lokasi - OUT pending - draft OUT)
+                        on_hand = core.stock_at(data, code_sel, location)
+                        max_qty = core.available_at(data, code_sel, location) - core.reserved_outs(st.session_state.req_out_items).get((code_sel, location), 0)
+                        if max_qty != on_hand:
+                            col2.caption(f"Stok {on_hand}, tersedia {max(0, max_qty)} (dikurangi OUT pending & daftar draft).")
                         if max_qty < 1:
-                            st.error("Stok 0 — tidak bisa menambah OUT untuk item ini.")
-                        elif not event_manual.strip():
-                            st.error("Event wajib diisi.")
-                        elif qty < 1:
-                            st.error("Jumlah harus minimal 1.")
+                            qty = 0
+                            col2.number_input("Jumlah", min_value=0, max_value=0, step=1, value=0, disabled=True)
+                            st.warning("Stok tersedia item ini 0 di lokasi terpilih. Tidak bisa menambah request OUT.")
                         else:
-                            selected_name = items[idx]["name"]
-                            found_code = next((code for code, it in data["inventory"].items() if it.get("name") == selected_name), None)
-                            base = {
-                                "date": datetime.now().strftime("%Y-%m-%d"),
-                                "code": found_code if found_code else "-",
-                                "item": selected_name,
-                                "qty": qty,
-                                "unit": items[idx].get("unit", "-"),
-                                "event": event_manual.strip(),
-                                "trans_type": tipe,
-                                "user": st.session_state.username,
-                            }
-                            st.session_state.req_out_items.append(normalize_out_record(base))
-                            st.success("Item OUT (manual) ditambahkan ke daftar.")
-
-                # UPLOAD EXCEL
-                with tab2:
-                    st.info("Format kolom: **Tanggal | Kode Barang | Nama Barang | Qty | Event | Tipe** (Tipe = Support atau Penjualan)")
-                    st.download_button(
-                        label="📥 Unduh Template Excel OUT",
-                        data=make_out_template_bytes(data),
-                        file_name=f"Template_OUT_{st.session_state.current_brand.capitalize()}.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
-
-                    file_upload = st.file_uploader("Upload File Excel OUT", type=["xlsx"], key="out_excel_uploader")
-                    if file_upload:
-                        try:
-                            df_new = pd.read_excel(file_upload, engine='openpyxl')
-                        except Exception as e:
-                            st.error(f"Gagal membaca file Excel: {e}")
-                            df_new = None
-
-                        required_cols = ["Tanggal", "Kode Barang", "Nama Barang", "Qty", "Event", "Tipe"]
-                        if df_new is not None:
-                            missing = [c for c in required_cols if c not in df_new.columns]
-                            if missing:
-                                st.error(f"Kolom berikut belum ada di Excel: {', '.join(missing)}")
+                            qty = col2.number_input("Jumlah", min_value=1, max_value=max_qty, step=1)
+
+                        tipe = st.selectbox("Tipe Transaksi (wajib)", TRANS_TYPES, index=0)
+                        event_manual = st.text_input("Nama Event (wajib)", placeholder="Misal: Pameran, Acara Kantor")
+
+                        if st.button("Tambah Item OUT (Manual)"):
+                            if max_qty < 1:
+                                st.error("Stok tersedia 0 — tidak bisa menambah OUT untuk item ini.")
+                            elif not event_manual.strip():
+                                st.error("Event wajib diisi.")
+                            elif qty < 1:
+                                st.error("Jumlah harus minimal 1.")
                             else:
-                                if st.button("Tambah dari Excel (OUT)"):
-                                    errors, added = [], 0
-                                    by_code = {code: (it.get("name"), it.get("unit", "-"), it.get("qty", 0)) for code, it in data["inventory"].items()}
-                                    by_name = {it.get("name"): (code, it.get("unit", "-"), it.get("qty", 0)) for code, it in data["inventory"].items()}
-
-                                    for idx_row, row in df_new.iterrows():
-                                        try:
-                                            dt = pd.to_datetime(row["Tanggal"], errors="coerce")
-                                            date_str = dt.strftime("%Y-%m-%d") if pd.notna(dt) else datetime.now().strftime("%Y-%m-%d")
-
-                                            code_xl = str(row["Kode Barang"]).strip() if pd.notna(row["Kode Barang"]) else ""
-                                            name_xl = str(row["Nama Barang"]).strip() if pd.notna(row["Nama Barang"]) else ""
-                                            qty_xl = int(pd.to_numeric(row["Qty"], errors="coerce") or 0)
-                                            event_xl_raw = str(row["Event"]).strip() if pd.notna(row["Event"]) else ""
-                                            tipe_xl_raw = str(row["Tipe"]).strip().lower() if pd.notna(row["Tipe"]) else ""
-
-                                            if not event_xl_raw:
-                                                errors.append(f"Baris {idx_row+2}: Event wajib diisi."); continue
-                                            if tipe_xl_raw not in ["support","penjualan"]:
-                                                errors.append(f"Baris {idx_row+2}: Tipe harus 'Support' atau 'Penjualan'."); continue
-                                            tipe_xl = "Support" if tipe_xl_raw=="support" else "Penjualan"
-
-                                            inv_name, inv_unit, inv_stock = (None, None, None)
-                                            inv_code = None
-                                            if code_xl and code_xl in by_code:
-                                                inv_name, inv_unit, inv_stock = by_code[code_xl]; inv_code = code_xl
-                                            elif name_xl and name_xl in by_name:
-                                                inv_code, inv_unit, inv_stock = by_name[name_xl]; inv_name = name_xl
-                                            else:
-                                                errors.append(f"Baris {idx_row+2}: Item tidak ditemukan (kode='{code_xl}', nama='{name_xl}')."); continue
-                                            if qty_xl <= 0:
-                                                errors.append(f"Baris {idx_row+2}: Qty harus > 0."); continue
-                                            if inv_stock is not None and qty_xl > inv_stock:
-                                                errors.append(f"Baris {idx_row+2}: Qty ({qty_xl}) melebihi stok ({inv_stock}) untuk '{inv_name}'."); continue
-
-                                            base = {
-                                                "date": date_str, "code": inv_code if inv_code else "-", "item": inv_name,
-                                                "qty": qty_xl, "unit": inv_unit if inv_unit else "-",
-                                                "event": event_xl_raw, "trans_type": tipe_xl, "user": st.session_state.username,
-                                            }
-                                            st.session_state.req_out_items.append(normalize_out_record(base))
-                                            added += 1
-                                        except Exception as e:
-                                            errors.append(f"Baris {idx_row+2}: {e}")
-
-                                    if added: st.success(f"{added} baris ditambahkan ke daftar OUT.")
-                                    if errors: st.warning("Beberapa baris dilewati:\n- " + "\n- ".join(errors))
-
-                # DAFTAR & SUBMIT OUT
-                if st.session_state.req_out_items:
-                    st.subheader("Daftar Item Request OUT")
-                    df_out = pd.DataFrame(st.session_state.req_out_items)
-                    pref_cols = [c for c in ["date","code","item","qty","unit","event","trans_type"] if c in df_out.columns]
-                    df_out = df_out[pref_cols]
-
-                    if "out_select_flags" not in st.session_state or len(st.session_state.out_select_flags) != len(st.session_state.req_out_items):
-                        st.session_state.out_select_flags = [False] * len(st.session_state.req_out_items)
+                                base = {
+                                    "date": datetime.now().strftime("%Y-%m-%d"),
+                                    "code": code_sel,
+                                    "item": item_sel["name"],
+                                    "qty": qty,
+                                    "unit": item_sel.get("unit", "-"),
+                                    "event": event_manual.strip(),
+                                    "trans_type": tipe,
+                                    "user": st.session_state.username,
+                                    "location": location,
+                                }
+                                st.session_state.req_out_items.append(normalize_out_record(base))
+                                st.success("Item OUT (manual) ditambahkan ke daftar.")
+
+                    # UPLOAD EXCEL
+                    with tab2:
+                        st.info("Format kolom: **Tanggal | Kode Barang | Nama Barang | Qty | Event | Tipe** (Tipe = Support atau Penjualan), opsional **Lokasi** (kosong = Gudang Utama)")
+                        st.download_button(
+                            label="📥 Unduh Template Excel OUT",
+                            data=out_template_bytes(data),
+                            file_name=f"Template_OUT_{st.session_state.current_brand.capitalize()}.xlsx",
+                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                        )
+
+                        file_upload = st.file_uploader("Upload File Excel OUT", type=["xlsx"], key="out_excel_uploader")
+                        if file_upload:
+                            try:
+                                df_new = pd.read_excel(file_upload, engine='openpyxl')
+                            except Exception as e:
+                                st.error(f"Gagal membaca file Excel: {e}")
+                                df_new = None
+
+                            required_cols = ["Tanggal", "Kode Barang", "Nama Barang", "Qty", "Event", "Tipe"]
+                            if df_new is not None:
+                                missing = [c for c in required_cols if c not in df_new.columns]
+                                if missing:
+                                    st.error(f"Kolom berikut belum ada di Excel: {', '.join(missing)}")
+                                else:
+                                    if st.button("Tambah dari Excel (OUT)"):
+                                        rows = df_new.rename(columns=EXCEL_REQ_COLS).to_dict(orient="records")
+                                        recs, errors = core.validate_request_rows(data, "OUT", rows, st.session_state.username, drafts=st.session_state.req_out_items)
+                                        st.session_state.req_out_items.extend(recs)
+                                        added = len(recs)
 
-                    c1, c2 = st.columns([1,1])
-                    if c1.button("Pilih semua", key="out_sel_all"): st.session_state.out_select_flags = [True] * len(st.session_state.req_out_items)
-                    if c2.button("Kosongkan pilihan", key="out_sel_none"): st.session_state.out_select_flags = [False] * len(st.session_state.req_out_items)
+                                        if added: st.success(f"{added} baris ditambahkan ke daftar OUT.")
+                                        if errors: st.warning("Beberapa baris dilewati:\n- " + "\n- ".join(errors))
 
-                    df_out["Pilih"] = st.session_state.out_select_flags
-                    edited_df_out = st.data_editor(df_out, key="editor_out", use_container_width=True, hide_index=True)
-                    st.session_state.out_select_flags = edited_df_out["Pilih"].fillna(False).tolist()
+                    _draft_editor("out", "Daftar Item Request OUT", ["date","code","item","qty","unit","event","trans_type","location"])
 
-                    if st.button("Hapus Item Terpilih", key="delete_out"):
-                        mask = st.session_state.out_select_flags
-                        if any(mask):
-                            st.session_state.req_out_items = [rec for rec, keep in zip(st.session_state.req_out_items, [not x for x in mask]) if keep]
-                            st.session_state.out_select_flags = [False]*len(st.session_state.req_out_items)
-                            st.rerun()
-                        else:
-                            st.info("Tidak ada baris yang dipilih.")
+                # DAFTAR & SUBMIT OUT
+                st.session_state.out_submit_shown = bool(st.session_state.req_out_items)
+                out_drafts()
 
+                if st.session_state.req_out_items:
                     st.divider()
                     if st.button("Ajukan Request OUT Terpilih"):
                         mask = st.session_state.out_select_flags
                         if not any(mask):
                             st.warning("Pilih setidaknya satu item untuk diajukan.")
                         else:
-                            submitted = 0
-                            new_state, new_flags = [], []
-                            for selected, rec in zip(mask, st.session_state.req_out_items):
-                                if selected:
-                                    base = rec.copy(); base["user"] = st.session_state.username
-                                    norm = normalize_out_record(base); norm["type"] = "OUT"
-                                    data["pending_requests"].append(norm); submitted += 1
-                                else:
-                                    new_state.append(rec); new_flags.append(False)
-                            save_data(data, st.session_state.current_brand)
+                            new_state, new_flags, short = [], [], []
+                            def submit_out(d):
+                                new_state.clear(); new_flags.clear(); short.clear()
+                                submitted = 0
+                                for selected, rec in zip(mask, st.session_state.req_out_items):
+                                    loc = rec.get("location") or DEFAULT_LOCATION
+                                    # cek ulang stok tersedia pada data terbaru: request lain bisa sudah diajukan sejak item masuk daftar
+                                    if selected and core._to_int(rec.get("qty")) <= core.available_at(d, rec.get("code"), loc):
+                                        base = rec.copy(); base["user"] = st.session_state.username
+                                        core.add_pending(d, [make_pending(normalize_out_record(base), "OUT")]); submitted += 1
+                                    else:
+                                        if selected: short.append(f"{rec.get('item')} ({rec.get('qty')}) di {loc}")
+                                        new_state.append(rec); new_flags.append(False)
+                                return submitted or False
+                            submitted = mutate_data(st.session_state.current_brand, submit_out) or 0
                             st.session_state.req_out_items = new_state
                             st.session_state.out_select_flags = new_flags
-                            st.success(f"{submitted} request OUT diajukan & menunggu approval.")
+                            msg = f"{submitted} request OUT diajukan & menunggu approval."
+                            if short:
+                                st.session_state.notification = {"type": "warning", "message": msg + " Stok tersedia tidak cukup, tetap di daftar: " + "; ".join(short)}
+                            else:
+                                st.success(msg)
                             st.rerun()
             else:
                 st.info("Belum ada master barang. Silakan hubungi admin.")
@@ -1455,142 +1354,105 @@ else:
             st.divider()
 
             if items:
-                # Peta event OUT approved per item
-                hist = data.get("history", [])
-                approved_out_map = {}
-                for h in hist:
-                    if h.get("action") == "APPROVE_OUT":
-                        it = h.get("item"); ev = h.get("event")
-                        if it and ev and ev not in ["-", None, ""]:
-                            approved_out_map.setdefault(it, set()).add(ev)
-
-                tab1, tab2 = st.tabs(["Input Manual", "Upload Excel"])
-
-                with tab1:
-                    col1, col2 = st.columns(2)
-                    idx = col1.selectbox(
-                        "Pilih Barang", range(len(items)),
-                        format_func=lambda x: f"{items[x]['name']} (Stok Gudang: {items[x]['qty']} {items[x].get('unit','-')})"
-                    )
-                    qty = col2.number_input("Jumlah Retur", min_value=1, step=1)
-                    item_name = items[idx]["name"]; unit_name = items[idx].get("unit", "-")
-                    approved_events = sorted(list(approved_out_map.get(item_name, set())))
-                    if not approved_events:
-                        st.warning("Belum ada event OUT yang di-approve untuk item ini.")
-                        event_choice = None
-                    else:
-                        event_choice = st.selectbox("Pilih Event (berdasarkan OUT yang disetujui)", approved_events)
-                    if st.button("Tambah Item Retur (Manual)"):
-                        if not event_choice:
-                            st.error("Pilih event terlebih dahulu.")
+                @st.fragment
+                def ret_drafts():
+                    tab1, tab2 = st.tabs(["Input Manual", "Upload Excel"])
+
+                    with tab1:
+                        col1, col2 = st.columns(2)
+                        with col1:
+                            code_sel, item_sel = _item_picker(data, "pick_ret", lambda it: f"{it['name']} (Stok Gudang: {it['qty']} {it.get('unit','-')})")
+                        qty = col2.number_input("Jumlah Retur", min_value=1, step=1)
+                        location = _location_picker(data, "ret_location", "Lokasi Tujuan Retur")
+                        item_name = item_sel["name"]; unit_name = item_sel.get("unit", "-")
+                        # Event dari ledger OUT: sisa = OUT approved - retur approved - retur pending
+                        reserved = core.reserved_returns(st.session_state.req_ret_items)
+                        ev_sisa = {
+                            e["event"]: out_ledger.available(e) - reserved.get((code_sel, out_ledger.norm_event(e["event"])), 0)
+                            for e in out_ledger.events_for(data, code_sel) if e["out"] > 0
+                        }
+                        if not ev_sisa:
+                            st.warning("Belum ada event OUT yang di-approve untuk item ini.")
+                            event_choice = None
                         else:
-                            base = {"date": datetime.now().strftime("%Y-%m-%d"),
-                                    "code": next((c for c, it in data["inventory"].items() if it.get("name")==item_name), "-"),
-                                    "item": item_name, "qty": qty, "unit": unit_name,
-                                    "event": event_choice, "user": st.session_state.username}
-                            st.session_state.req_ret_items.append(normalize_return_record(base))
-                            st.success("Item Retur ditambahkan ke daftar.")
-
-                with tab2:
-                    st.info("Format: **Tanggal | Kode Barang | Nama Barang | Qty | Event**")
-                    st.download_button(
-                        label="📥 Unduh Template Excel Retur",
-                        data=make_return_template_bytes(data),
-                        file_name=f"Template_Retur_{st.session_state.current_brand.capitalize()}.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
-                    file_upload = st.file_uploader("Upload File Excel Retur", type=["xlsx"], key="ret_excel_uploader")
-                    if file_upload:
-                        try:
-                            df_new = pd.read_excel(file_upload, engine='openpyxl')
-                        except Exception as e:
-                            st.error(f"Gagal membaca file Excel: {e}")
-                            df_new = None
-
-                        required_cols = ["Tanggal", "Kode Barang", "Nama Barang", "Qty", "Event"]
-                        if df_new is not None:
-                            missing = [c for c in required_cols if c not in df_new.columns]
-                            if missing:
-                                st.error(f"Kolom berikut belum ada di Excel: {', '.join(missing)}")
+                            event_choice = st.selectbox("Pilih Event (berdasarkan OUT yang disetujui)", list(ev_sisa),
+                                                        format_func=lambda e: f"{e} (sisa {max(0, ev_sisa[e])} {unit_name})")
+                        if st.button("Tambah Item Retur (Manual)"):
+                            err = core.check_return(data, code_sel, item_name, event_choice, qty, reserved)[1] if event_choice else None
+                            if not event_choice:
+                                st.error("Pilih event terlebih dahulu.")
+                            elif err:
+                                st.error(err)
                             else:
-                                if st.button("Tambah dari Excel (Retur)"):
-                                    errors, added = [], 0
-                                    by_code = {code: (it.get("name"), it.get("unit", "-")) for code, it in data["inventory"].items()}
-                                    by_name = {it.get("name"): (code, it.get("unit", "-")) for code, it in data["inventory"].items()}
-                                    for idx_row, row in df_new.iterrows():
-                                        try:
-                                            dt = pd.to_datetime(row["Tanggal"], errors="coerce")
-                                            date_str = dt.strftime("%Y-%m-%d") if pd.notna(dt) else datetime.now().strftime("%Y-%m-%d")
-                                            code_xl = str(row["Kode Barang"]).strip() if pd.notna(row["Kode Barang"]) else ""
-                                            name_xl = str(row["Nama Barang"]).strip() if pd.notna(row["Nama Barang"]) else ""
-                                            qty_xl = int(pd.to_numeric(row["Qty"], errors="coerce") or 0)
-                                            event_xl_raw = str(row["Event"]).strip() if pd.notna(row["Event"]) else ""
-                                            if qty_xl <= 0: errors.append(f"Baris {idx_row+2}: Qty harus > 0."); continue
-                                            if not event_xl_raw: errors.append(f"Baris {idx_row+2}: Event wajib diisi."); continue
-
-                                            inv_name, inv_unit = (None, None); inv_code = None
-                                            if code_xl and code_xl in by_code: inv_name, inv_unit = by_code[code_xl]; inv_code = code_xl
-                                            elif name_xl and name_xl in by_name: inv_code, inv_unit = by_name[name_xl]; inv_name = name_xl
-                                            else: errors.append(f"Baris {idx_row+2}: Item tidak ditemukan."); continue
-
-                                            valid_events = approved_out_map.get(inv_name, set())
-                                            exists = any(e.strip().lower() == event_xl_raw.strip().lower() for e in valid_events)
-                                            if not exists:
-                                                if not valid_events:
-                                                    errors.append(f"Baris {idx_row+2}: Belum ada event OUT yang di-approve untuk '{inv_name}'.")
-                                                else:
-                                                    errors.append(f"Baris {idx_row+2}: Event '{event_xl_raw}' tidak cocok. Tersedia: {', '.join(sorted(valid_events))}.")
-                                                continue
-
-                                            base = {"date": date_str, "code": inv_code if inv_code else "-",
-                                                    "item": inv_name, "qty": qty_xl, "unit": inv_unit if inv_unit else "-",
-                                                    "event": next((e for e in valid_events if e.strip().lower()==event_xl_raw.strip().lower()), event_xl_raw),
-                                                    "user": st.session_state.username}
-                                            st.session_state.req_ret_items.append(normalize_return_record(base)); added += 1
-                                        except Exception as e:
-                                            errors.append(f"Baris {idx_row+2}: {e}")
-                                    if added: st.success(f"{added} baris retur ditambahkan.")
-                                    if errors: st.warning("Beberapa baris gagal:\n- " + "\n- ".join(errors))
-
-                if st.session_state.req_ret_items:
-                    st.subheader("Daftar Item Request Retur")
-                    if "ret_select_flags" not in st.session_state or len(st.session_state.ret_select_flags) != len(st.session_state.req_ret_items):
-                        st.session_state.ret_select_flags = [False]*len(st.session_state.req_ret_items)
+                                base = {"date": datetime.now().strftime("%Y-%m-%d"),
+                                        "code": code_sel,
+                                        "item": item_name, "qty": qty, "unit": unit_name,
+                                        "event": event_choice, "user": st.session_state.username, "location": location}
+                                st.session_state.req_ret_items.append(normalize_return_record(base))
+                                st.success("Item Retur ditambahkan ke daftar.")
+
+                    with tab2:
+                        st.info("Format: **Tanggal | Kode Barang | Nama Barang | Qty | Event**, opsional **Lokasi** (kosong = Gudang Utama)")
+                        st.download_button(
+                            label="📥 Unduh Template Excel Retur",
+                            data=return_template_bytes(data),
+                            file_name=f"Template_Retur_{st.session_state.current_brand.capitalize()}.xlsx",
+                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                        )
+                        file_upload = st.file_uploader("Upload File Excel Retur", type=["xlsx"], key="ret_excel_uploader")
+                        if file_upload:
+                            try:
+                                df_new = pd.read_excel(file_upload, engine='openpyxl')
+                            except Exception as e:
+                                st.error(f"Gagal membaca file Excel: {e}")
+                                df_new = None
+
+                            required_cols = ["Tanggal", "Kode Barang", "Nama Barang", "Qty", "Event"]
+                            if df_new is not None:
+                                missing = [c for c in required_cols if c not in df_new.columns]
+                                if missing:
+                                    st.error(f"Kolom berikut belum ada di Excel: {', '.join(missing)}")
+                                else:
+                                    if st.button("Tambah dari Excel (Retur)"):
+                                        rows = df_new.rename(columns=EXCEL_REQ_COLS).to_dict(orient="records")
+                                        recs, errors = core.validate_request_rows(data, "RETURN", rows, st.session_state.username, drafts=st.session_state.req_ret_items)
+                                        st.session_state.req_ret_items.extend(recs)
+                                        added = len(recs)
+                                        if added: st.success(f"{added} baris retur ditambahkan.")
+                                        if errors: st.warning("Beberapa baris gagal:\n- " + "\n- ".join(errors))
 
-                    cR1, cR2 = st.columns([1,1])
-                    if cR1.button("Pilih semua", key="ret_sel_all"): st.session_state.ret_select_flags = [True]*len(st.session_state.req_ret_items)
-                    if cR2.button("Kosongkan pilihan", key="ret_sel_none"): st.session_state.ret_select_flags = [False]*len(st.session_state.req_ret_items)
+                    _draft_editor("ret", "Daftar Item Request Retur", ["date","code","item","qty","unit","event","location"])
 
-                    df_ret = pd.DataFrame(st.session_state.req_ret_items)
-                    pref_cols = [c for c in ["date","code","item","qty","unit","event"] if c in df_ret.columns]
-                    df_ret = df_ret[pref_cols]; df_ret["Pilih"] = st.session_state.ret_select_flags
-                    edited_df_ret = st.data_editor(df_ret, key="editor_ret", use_container_width=True, hide_index=True)
-                    st.session_state.ret_select_flags = edited_df_ret["Pilih"].fillna(False).tolist()
-
-                    if st.button("Hapus Item Terpilih", key="delete_ret"):
-                        mask = st.session_state.ret_select_flags
-                        if any(mask):
-                            st.session_state.req_ret_items = [rec for rec, keep in zip(st.session_state.req_ret_items, [not x for x in mask]) if keep]
-                            st.session_state.ret_select_flags = [False]*len(st.session_state.req_ret_items)
-                            st.rerun()
-                        else:
-                            st.info("Tidak ada baris yang dipilih.")
+                st.session_state.ret_submit_shown = bool(st.session_state.req_ret_items)
+                ret_drafts()
 
+                if st.session_state.req_ret_items:
                     st.divider()
                     if st.button("Ajukan Request Retur Terpilih"):
                         mask = st.session_state.ret_select_flags
                         if not any(mask):
                             st.warning("Pilih setidaknya satu item untuk diajukan.")
                         else:
-                            for selected, rec in zip(mask, st.session_state.req_ret_items):
-                                if selected:
+                            # validasi ulang terhadap ledger terkini (retur lain bisa sudah diajukan/di-approve)
+                            new_state, errors = [], []
+                            def submit_ret(d):
+                                new_state.clear(); errors.clear()
+                                for selected, rec in zip(mask, st.session_state.req_ret_items):
+                                    if not selected:
+                                        new_state.append(rec); continue
+                                    _, err = core.check_return(d, rec.get("code"), rec.get("item"), rec.get("event"), core._to_int(rec.get("qty")))
+                                    if err:
+                                        errors.append(err); new_state.append(rec); continue
                                     base = rec.copy(); base["user"] = st.session_state.username
-                                    norm = normalize_return_record(base); norm["type"] = "RETURN"
-                                    data["pending_requests"].append(norm)
-                            save_data(data, st.session_state.current_brand)
-                            st.session_state.req_ret_items = [rec for rec, keep in zip(st.session_state.req_ret_items, [not x for x in mask]) if keep]
-                            st.session_state.ret_select_flags = [False]*len(st.session_state.req_ret_items)
-                            st.success("Request RETUR diajukan & menunggu approval.")
+                                    core.add_pending(d, [make_pending(normalize_return_record(base), "RETURN")])
+                                return len(new_state) < len(st.session_state.req_ret_items)
+                            mutate_data(st.session_state.current_brand, submit_ret)
+                            st.session_state.req_ret_items = new_state
+                            st.session_state.ret_select_flags = [False]*len(new_state)
+                            if errors:
+                                st.session_state.notification = {"type": "warning", "message": "Sebagian retur tidak diajukan:\n- " + "\n- ".join(errors)}
+                            else:
+                                st.session_state.notification = {"type": "success", "message": "Request RETUR diajukan & menunggu approval."}
                             st.rerun()
             else:
                 st.info("Belum ada master barang. Silakan hubungi admin.")
@@ -1641,7 +1503,8 @@ else:
             else:
                 st.info("Anda belum memiliki riwayat transaksi.")
 
-
-
-
-
+    perf.end_rerun()
+    if role == "admin":
+        if core.USE_SHEETS:
+            render_sheets_sync_panel(st.session_state.current_brand)
+        render_perf_panel(menu)
@@ -0,0 +1,31 @@
+# artifact_cache.py
+# Cache bersama (satu per proses, lintas session) untuk file unduhan yang dibangkitkan: template Excel OUT/Retur/Master,
+# Excel Reorder Insight, dan export laporan. Kunci = (brand, jenis, parameter, versi data); versi data berubah setiap
+# save sehingga entri lama tidak pernah terbaca lagi dan akhirnya tergusur. LRU dibatasi total byte (ARTIFACT_CACHE_MB).
+#
+#   xls = artifact_cache.get_or_build(brand, "template_out", (today,), data.get("_version"), lambda: build(...))
+#
+# Versi None (mis. backend Sheets tanpa versi) -> dibangun setiap kali tanpa disimpan.
+import os
+
+from shared_cache import SharedLRU
+
+MAX_BYTES = int(float(os.environ.get("ARTIFACT_CACHE_MB", "64")) * 1024 * 1024)
+STATIC = "static"   # versi untuk artefak yang tidak bergantung data (template Master)
+
+_cache = SharedLRU(MAX_BYTES, len)
+
+
+def get_or_build(brand, kind, params, version, build):
+    """Bytes artefak dari cache, atau build() sekali lalu disimpan. Build bersamaan untuk kunci sama menunggu hasilnya."""
+    key = None if version is None else (brand, kind, tuple(params), version)
+    return _cache.get_or_build(key, build)
+
+
+def invalidate(brand=None):
+    """Buang entri brand (None = semua)."""
+    _cache.invalidate(None if brand is None else lambda k: k[0] == brand)
+
+
+def stats():
+    return _cache.stats()
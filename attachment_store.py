@@ -0,0 +1,362 @@
+# attachment_store.py
+# Penyimpanan lampiran (PDF surat jalan) berbasis isi: file ditulis bertahap (chunk) sambil di-hash SHA-256,
+# disimpan sekali per isi di uploads/objects/<2 huruf>/<sha256>.<ext>, dengan metadata JSON di sebelahnya:
+#   {"sha256", "size", "content_type", "ext", "names": [...], "users": [...], "refs": [request id...], "created"}
+# Nilai `attachment` pada request/history tetap berupa path file, sehingga lampiran lama (uploads/<user>_<ts>.pdf)
+# tetap terbaca. Lampiran lama dipindah ke bundle zip bulanan (cold tier) dan di-resolve lewat index:
+#
+#   python attachment_store.py --archive [--days 90] [--gc]
+import argparse
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import zipfile
+from contextlib import contextmanager
+
+import inventory_core as core
+
+try:
+    import fcntl
+    _FCNTL_OK = True
+except Exception:
+    _FCNTL_OK = False
+
+log = logging.getLogger("gltkims.attachments")
+
+CHUNK_SIZE = 1024 * 1024
+MAX_ATTACHMENT_BYTES = int(float(os.environ.get("MAX_ATTACHMENT_MB", "50")) * 1024 * 1024)
+OBJECTS_DIR = os.path.join(core.UPLOADS_DIR, "objects")
+TMP_DIR = os.path.join(core.UPLOADS_DIR, "tmp")
+CONTENT_TYPES = {"pdf": "application/pdf", "png": "image/png", "jpg": "image/jpeg", "jpeg": "image/jpeg"}
+
+_lock = threading.Lock()
+
+
+class AttachmentError(Exception):
+    pass
+
+
+def _ext(filename):
+    ext = os.path.splitext(str(filename or ""))[1].lstrip(".").lower()
+    return ext if ext.isalnum() and ext != "json" else "bin"   # .json dipakai untuk metadata
+
+
+def object_path(sha256, ext):
+    return os.path.join(OBJECTS_DIR, sha256[:2], f"{sha256}.{ext}")
+
+
+def _meta_path(path):
+    return os.path.splitext(path)[0] + ".json"
+
+
+def read_meta(path):
+    """Metadata lampiran atau None (lampiran lama / bukan dari store)."""
+    try:
+        with open(_meta_path(path), "r") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def _write_meta(path, meta):
+    tmp = _meta_path(path) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, _meta_path(path))
+
+
+def _chunks_of(source, chunk_size):
+    """File-like (read) atau iterable bytes -> iterator chunk."""
+    if hasattr(source, "read"):
+        if hasattr(source, "seek"):
+            source.seek(0)
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        yield from source
+
+
+def put(source, filename, user="-", content_type=None, chunk_size=CHUNK_SIZE, max_bytes=MAX_ATTACHMENT_BYTES):
+    """Simpan lampiran secara streaming; isi yang sama hanya disimpan sekali. Mengembalikan path objek."""
+    os.makedirs(TMP_DIR, exist_ok=True)
+    ext = _ext(filename)
+    tmp = os.path.join(TMP_DIR, f"{uuid.uuid4().hex}.part")
+    h = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in _chunks_of(source, chunk_size):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise AttachmentError(f"Lampiran melebihi batas {max_bytes // (1024 * 1024)} MB.")
+                h.update(chunk)
+                f.write(chunk)
+        if size == 0:
+            raise AttachmentError("Lampiran kosong.")
+        sha = h.hexdigest()
+        path = object_path(sha, ext)
+        with _lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            meta = read_meta(path) if os.path.exists(path) else None
+            if meta is not None:
+                os.utime(path)          # dipakai lagi: jangan dianggap yatim oleh gc_orphans
+            else:
+                os.replace(tmp, path)
+                meta = {"sha256": sha, "size": size, "ext": ext,
+                        "content_type": content_type or CONTENT_TYPES.get(ext, "application/octet-stream"),
+                        "names": [], "users": [], "refs": [], "created": core.timestamp()}
+            name = os.path.basename(str(filename or f"lampiran.{ext}"))
+            if name not in meta["names"]:
+                meta["names"].append(name)
+            if user not in meta["users"]:
+                meta["users"].append(user)
+            _write_meta(path, meta)
+        return path
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def put_base64(b64, filename, user="-", content_type=None, max_bytes=MAX_ATTACHMENT_BYTES):
+    """Seperti put() untuk string base64 (API); didekode per blok agar tidak ada salinan biner utuh."""
+    b64 = "".join(str(b64).split())
+    if len(b64) * 3 // 4 > max_bytes + 3:
+        raise AttachmentError(f"Lampiran melebihi batas {max_bytes // (1024 * 1024)} MB.")
+    block = 4 * (CHUNK_SIZE // 3)
+    return put((base64.b64decode(b64[i:i + block], validate=True) for i in range(0, len(b64), block)),
+               filename, user, content_type, max_bytes=max_bytes)
+
+
+def add_refs(path, request_ids):
+    """Catat id request yang memakai lampiran ini (untuk audit & GC)."""
+    if not request_ids:
+        return
+    with _lock:
+        meta = read_meta(path)
+        if meta is None:
+            return
+        for rid in request_ids:
+            if rid not in meta["refs"]:
+                meta["refs"].append(rid)
+        _write_meta(path, meta)
+
+
+def download_name(path):
+    meta = read_meta(path)
+    if meta is None:
+        meta = archive_index().get(_key(path), {}).get("meta")
+    if meta and meta.get("names"):
+        return meta["names"][0]
+    return os.path.basename(path)
+
+
+def stats():
+    """Jumlah objek & total byte di store."""
+    count = total = 0
+    for root, _, files in os.walk(OBJECTS_DIR):
+        for fn in files:
+            if not fn.endswith((".json", ".tmp")):
+                count += 1
+                total += os.path.getsize(os.path.join(root, fn))
+    return {"objects": count, "bytes": total}
+
+
+def gc_orphans(max_age_hours=24):
+    """Hapus objek tanpa referensi request yang lebih tua dari `max_age_hours` (upload gagal diajukan)."""
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    with _lock:
+        for root, _, files in os.walk(OBJECTS_DIR):
+            for fn in files:
+                if fn.endswith((".json", ".tmp")):
+                    continue
+                path = os.path.join(root, fn)
+                meta = read_meta(path)
+                if meta is not None and not meta.get("refs") and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    os.remove(_meta_path(path))
+                    removed += 1
+    if removed:
+        log.info("GC lampiran: %d objek tanpa referensi dihapus", removed)
+    return removed
+
+
+# ====== Cold tier: bundle bulanan terkompresi + index, diambil saat dibutuhkan ======
+ARCHIVE_DIR = os.path.join(core.UPLOADS_DIR, "archive")
+CACHE_DIR = os.path.join(core.UPLOADS_DIR, "cache")
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ATTACHMENT_ARCHIVE_DAYS", "90"))
+CACHE_MAX_BYTES = int(float(os.environ.get("ATTACHMENT_CACHE_MB", "200")) * 1024 * 1024)
+_index_cache = {"sig": None, "index": {}}
+
+
+@contextmanager
+def _archive_lock():
+    """Kunci antar-proses untuk bundle & index arsip."""
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    with _lock:
+        fh = open(os.path.join(ARCHIVE_DIR, ".lock"), "w")
+        try:
+            if _FCNTL_OK:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+            yield
+        finally:
+            if _FCNTL_OK:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+            fh.close()
+
+
+def _index_path():
+    return os.path.join(ARCHIVE_DIR, "index.json")
+
+
+def _key(path):
+    return os.path.normpath(str(path))
+
+
+def archive_index():
+    """Index arsip {path asli: {"bundle", "member", "size", "meta"}}; dibaca ulang hanya bila file berubah."""
+    try:
+        st_ = os.stat(_index_path())
+        sig = (st_.st_mtime_ns, st_.st_size)
+    except OSError:
+        return {}
+    if _index_cache["sig"] != sig:
+        with open(_index_path(), "r") as f:
+            _index_cache["index"] = json.load(f)
+        _index_cache["sig"] = sig
+    return _index_cache["index"]
+
+
+def _write_index(index):
+    tmp = _index_path() + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp, _index_path())
+
+
+def _hot_files():
+    """File lampiran di hot storage: objek store + file lama di root uploads/ (archive/cache/tmp dilewati)."""
+    roots = [(core.UPLOADS_DIR, False), (OBJECTS_DIR, True)]
+    for top, recurse in roots:
+        for root, dirs, files in os.walk(top):
+            if not recurse:
+                dirs[:] = []
+            for fn in files:
+                if not fn.endswith((".json", ".tmp", ".part")) and not fn.startswith("."):
+                    yield os.path.join(root, fn)
+
+
+def archive_old(max_age_days=ARCHIVE_AFTER_DAYS):
+    """Pindahkan lampiran lebih tua dari `max_age_days` ke bundle zip bulanan (per bulan mtime file)."""
+    cutoff = time.time() - max_age_days * 86400
+    by_month = {}
+    for path in _hot_files():
+        mtime = os.path.getmtime(path)
+        if mtime < cutoff:
+            by_month.setdefault(time.strftime("%Y-%m", time.localtime(mtime)), []).append(path)
+    moved = 0
+    with _archive_lock():
+        index = dict(archive_index())
+        for month, paths in sorted(by_month.items()):
+            bundle = f"{month}.zip"
+            with zipfile.ZipFile(os.path.join(ARCHIVE_DIR, bundle), "a", compression=zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
+                names = set(zf.namelist())
+                for path in paths:
+                    member = os.path.relpath(path, core.UPLOADS_DIR).replace(os.sep, "/")
+                    if member not in names:
+                        zf.write(path, member)
+                    index[_key(path)] = {"bundle": bundle, "member": member, "size": os.path.getsize(path), "meta": read_meta(path)}
+            with zipfile.ZipFile(os.path.join(ARCHIVE_DIR, bundle)) as zf:
+                bad = zf.testzip()
+            if bad is not None:
+                raise AttachmentError(f"Bundle {bundle} rusak pada {bad}; file hot tidak dihapus.")
+            _write_index(index)
+            for path in paths:
+                os.remove(path)
+                if os.path.exists(_meta_path(path)):
+                    os.remove(_meta_path(path))
+                moved += 1
+    if moved:
+        log.info("Arsip lampiran: %d file dipindah ke bundle bulanan", moved)
+    return moved
+
+
+def status(path):
+    """'hot' (ada di disk), 'archived' (ada di bundle), atau None."""
+    if not isinstance(path, str) or not path:
+        return None
+    if os.path.exists(path):
+        return "hot"
+    return "archived" if _key(path) in archive_index() else None
+
+
+def resolve(path):
+    """Path file yang bisa dibaca: hot langsung, arsip diekstrak ke cache (LRU berbatas) saat dibutuhkan."""
+    st_ = status(path)
+    if st_ == "hot":
+        return path
+    if st_ is None:
+        return None
+    entry = archive_index()[_key(path)]
+    cached = os.path.join(CACHE_DIR, hashlib.sha1(_key(path).encode("utf-8")).hexdigest() + os.path.splitext(path)[1])
+    if os.path.exists(cached):
+        os.utime(cached)
+        return cached
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = f"{cached}.{uuid.uuid4().hex}.part"
+    with zipfile.ZipFile(os.path.join(ARCHIVE_DIR, entry["bundle"])) as zf, zf.open(entry["member"]) as src, open(tmp, "wb") as dst:
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+            dst.write(chunk)
+    os.replace(tmp, cached)
+    _trim_cache()
+    return cached
+
+
+def _trim_cache():
+    files = []
+    for fn in os.listdir(CACHE_DIR):
+        p = os.path.join(CACHE_DIR, fn)
+        if not fn.endswith(".part"):
+            st_ = os.stat(p)
+            files.append((st_.st_mtime, st_.st_size, p))
+    total = sum(f[1] for f in files)
+    for _, size, p in sorted(files):
+        if total <= CACHE_MAX_BYTES:
+            break
+        os.remove(p)
+        total -= size
+
+
+def read_bytes(path):
+    """Isi lampiran (hot atau dari arsip), None bila tidak ada."""
+    real = resolve(path)
+    if real is None:
+        return None
+    with open(real, "rb") as f:
+        return f.read()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perawatan attachment store")
+    parser.add_argument("--archive", action="store_true", help="pindahkan lampiran lama ke bundle bulanan")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--gc", action="store_true", help="hapus objek tanpa referensi")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if args.gc:
+        print(f"GC: {gc_orphans()} objek dihapus")
+    if args.archive:
+        print(f"Arsip: {archive_old(args.days)} file dipindah")
+    print(f"Hot: {stats()} | Arsip: {len(archive_index())} file")
+
+
+if __name__ == "__main__":
+    main()
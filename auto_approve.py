@@ -0,0 +1,252 @@
+# auto_approve.py
+# Worker auto-approve: evaluasi aturan terhadap pending request dan approve yang cocok
+# lewat logika approval yang sama (inventory_core.approve_requests), satu batch & satu save per brand.
+#
+# Aturan dibaca dari AUTO_APPROVE_RULES_FILE (list JSON), contoh: auto_approve_rules.example.json
+#   {"name": "...", "type": "OUT", "trans_type": "Support", "max_qty": 10, "require_stock": true}
+#   {"name": "...", "type": "RETURN", "require_out_event": true}
+# Kunci opsional lain: "brands" (list), "users" (list), "locations" (list), "enabled" (default true).
+# "require_stock" dicek terhadap stok lokasi request. Aturan tidak valid dilewati (dicatat di log), aturan lain tetap jalan.
+#
+#   python auto_approve.py --once          # satu putaran untuk semua brand
+#   python auto_approve.py --interval 5    # jalan terus
+import argparse
+import json
+import logging
+import os
+import threading
+
+import inventory_core as core
+import locations
+import out_ledger
+
+log = logging.getLogger("gltkims.auto_approve")
+
+AUTO_APPROVE_RULES_FILE = os.environ.get("AUTO_APPROVE_RULES_FILE", "auto_approve_rules.json")
+AUTO_APPROVE_INTERVAL = float(os.environ.get("AUTO_APPROVE_INTERVAL", "5"))
+
+
+_warned = set()   # (sumber, no, pesan) yang sudah dicatat: worker memuat ulang aturan tiap putaran
+_LIST_KEYS = ("brands", "users", "locations")
+_BOOL_KEYS = ("enabled", "require_stock", "require_out_event")
+
+
+def validate_rule(rule):
+    """Aturan yang sudah dinormalisasi (type, trans_type, max_qty, list, bool). ValueError bila tidak valid."""
+    if not isinstance(rule, dict):
+        raise ValueError("aturan harus berupa object")
+    out = dict(rule)
+    out["name"] = str(rule.get("name") or "-")
+    out["type"] = core._norm_req_type(rule.get("type"))
+    if out["type"] not in core.REQ_TYPES:
+        raise ValueError(f"type tidak dikenal: {rule.get('type')!r}")
+    if rule.get("trans_type"):
+        out["trans_type"] = core._norm_trans_type(rule["trans_type"])
+        if out["trans_type"] is None:
+            raise ValueError(f"trans_type tidak dikenal: {rule['trans_type']!r}")
+    if rule.get("max_qty") is not None:
+        try:
+            out["max_qty"] = int(rule["max_qty"])
+        except (TypeError, ValueError):
+            raise ValueError(f"max_qty bukan angka: {rule['max_qty']!r}")
+        if out["max_qty"] < 0:
+            raise ValueError("max_qty tidak boleh negatif")
+    for key in _LIST_KEYS:
+        val = rule.get(key)
+        if val is not None and (not isinstance(val, list) or not all(isinstance(v, str) for v in val)):
+            raise ValueError(f"{key} harus berupa list teks")
+    for key in _BOOL_KEYS:
+        if key in rule and not isinstance(rule[key], bool):
+            raise ValueError(f"{key} harus true/false")
+    return out
+
+
+def valid_rules(rules, source="-"):
+    """Aturan aktif yang valid; aturan tidak valid dilewati & dicatat (tidak menghentikan aturan lain)."""
+    if not isinstance(rules, list):
+        log.warning("Aturan auto-approve (%s) harus berupa list JSON; diabaikan", source)
+        return []
+    out = []
+    for i, rule in enumerate(rules):
+        try:
+            rule = validate_rule(rule)
+        except ValueError as e:
+            if (source, i, str(e)) not in _warned:
+                _warned.add((source, i, str(e)))
+                name = rule.get("name", "-") if isinstance(rule, dict) else "-"
+                log.warning("Aturan auto-approve #%d (%s) di %s dilewati: %s", i + 1, name, source, e)
+            continue
+        if rule.get("enabled", True):
+            out.append(rule)
+    return out
+
+
+def load_rules(path=None):
+    path = path or AUTO_APPROVE_RULES_FILE
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, "r") as f:
+            rules = json.load(f)
+    except (json.JSONDecodeError, OSError) as e:
+        log.warning("Aturan auto-approve tidak terbaca (%s): %s", path, e)
+        return []
+    return valid_rules(rules, path)
+
+
+class _StockSim(dict):
+    """(kode, lokasi) -> stok; diisi dari data saat pertama diakses."""
+
+    def __init__(self, data):
+        super().__init__()
+        self._data = data
+
+    def __missing__(self, key):
+        self[key] = core.stock_at(self._data, *key)
+        return self[key]
+
+
+def _rule_matches(rule, req, brand, stock, out_events):
+    if rule["type"] != req.get("type"):
+        return False
+    if rule.get("brands") and brand not in rule["brands"]:
+        return False
+    if rule.get("users") and req.get("user") not in rule["users"]:
+        return False
+    if rule.get("trans_type") and rule["trans_type"] != req.get("trans_type"):
+        return False
+    qty = core._to_int(req.get("qty", 0))
+    if qty <= 0:
+        return False
+    if rule.get("max_qty") is not None and qty > rule["max_qty"]:
+        return False
+    if rule.get("locations") and req.get("location") not in rule["locations"]:
+        return False
+    if rule.get("require_stock") and qty > stock[(req.get("code"), req.get("location"))]:
+        return False
+    if rule.get("require_out_event"):
+        ev = out_ledger.norm_event(req.get("event"))
+        if ev not in out_events.get(req.get("item"), set()):
+            return False
+    return True
+
+
+def select_auto_approvals(data: dict, rules, brand):
+    """Daftar (request_id, nama aturan) yang lolos aturan, urut sesuai antrean pending.
+
+    Stok per (kode, lokasi) disimulasikan berjalan agar beberapa OUT untuk item yang sama tidak melebihi stok bersama.
+    """
+    rules = valid_rules(rules)
+    if not rules:
+        return []
+    lookup = core.build_item_lookup(data)
+    stock = _StockSim(data)
+    out_events = {it: {out_ledger.norm_event(e) for e in evs} for it, evs in core.approved_out_events(data).items()}
+    picked = []
+    for req in data.get("pending_requests", []):
+        code = core.resolve_item_code(lookup, req.get("code"), req.get("item"))
+        if code is None:
+            continue
+        req = dict(req, code=code, location=req.get("location") or locations.DEFAULT_LOCATION)
+        rule = next((r for r in rules if _rule_matches(r, req, brand, stock, out_events)), None)
+        if rule is None:
+            continue
+        qty = core._to_int(req["qty"])
+        stock[(code, req["location"])] += -qty if req["type"] == "OUT" else qty
+        picked.append((req["id"], rule.get("name", "-")))
+    return picked
+
+
+def run_once(brand, rules=None):
+    """Satu putaran auto-approve untuk satu brand. Mengembalikan jumlah request yang di-approve."""
+    rules = load_rules() if rules is None else rules
+    if not rules:
+        return 0
+    with core.brand_lock(brand):
+        data = core.load_data(brand)
+        picked = select_auto_approvals(data, rules, brand)
+        if not picked:
+            return 0
+        approved = core.approve_requests(data, [rid for rid, _ in picked])
+        if approved:
+            core.save_data(data, brand)
+    by_rule = {}
+    for _, name in picked:
+        by_rule[name] = by_rule.get(name, 0) + 1
+    log.info("Auto-approve %s: %d request (%s)", brand, len(approved), by_rule)
+    return len(approved)
+
+
+class AutoApproveWorker(threading.Thread):
+    """Thread latar yang menjalankan run_once per brand setiap `interval` detik.
+
+    Brand hanya dievaluasi ulang bila file datanya berubah sejak putaran terakhir.
+    """
+
+    def __init__(self, brands=None, interval=AUTO_APPROVE_INTERVAL):
+        super().__init__(name="auto-approve", daemon=True)
+        self.brands = list(brands or core.DATA_FILES.keys())
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._seen = {}
+
+    def _changed(self, brand):
+        try:
+            stat = os.stat(core.DATA_FILES[brand])
+            sig = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            sig = None
+        if core.USE_SHEETS or sig is None or self._seen.get(brand) != sig:
+            self._seen[brand] = sig
+            return True
+        return False
+
+    def run(self):
+        while not self._stop_event.is_set():
+            rules = load_rules()
+            for brand in self.brands:
+                if rules and self._changed(brand):
+                    try:
+                        run_once(brand, rules)
+                    except Exception:
+                        log.exception("Auto-approve %s gagal", brand)
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def start_worker(brands=None, interval=AUTO_APPROVE_INTERVAL):
+    """Start worker sekali per proses (aman dipanggil berulang dari rerun Streamlit)."""
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = AutoApproveWorker(brands, interval)
+            _worker.start()
+        return _worker
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Auto-approve pending request berdasarkan aturan")
+    parser.add_argument("--once", action="store_true", help="jalankan satu putaran lalu keluar")
+    parser.add_argument("--interval", type=float, default=AUTO_APPROVE_INTERVAL)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if args.once:
+        for brand in core.DATA_FILES:
+            print(f"{brand}: {run_once(brand)} request di-approve")
+        return
+    worker = AutoApproveWorker(interval=args.interval)
+    worker.start()
+    try:
+        worker.join()
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# forecast.py
+# Forecast permintaan OUT per SKU, tervektorisasi untuk semua SKU sekaligus (numpy),
+# pengganti rata-rata datar 3 bulan pada Reorder Insight.
+#
+# Model per SKU (dipilih otomatis dari MAE one-step pada HOLDOUT_DAYS terakhir):
+#   - SES   : simple exponential smoothing (level)
+#   - Holt  : exponential smoothing dengan trend (level + trend, teredam)
+#   - SNaive: seasonal naive mingguan (pola 7 hari terakhir berulang)
+# Output per kode: forecast harian, safety stock, reorder point, days of cover, saran order.
+import threading
+from collections import OrderedDict
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+LOOKBACK_DAYS = 182
+HOLDOUT_DAYS = 28
+SEASON = 7
+ALPHA = 0.2          # smoothing level
+BETA = 0.05          # smoothing trend
+PHI = 0.9            # redaman trend Holt
+MODELS = ["SES", "Holt", "SNaive"]
+
+_CACHE_MAX = 16
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def daily_out_matrix(df_hist: pd.DataFrame, codes, name_to_code: dict, end, days=LOOKBACK_DAYS):
+    """Matriks qty OUT harian [SKU x hari] untuk `days` hari yang berakhir di `end` (inklusif)."""
+    end = pd.Timestamp(end).normalize()
+    start = end - pd.Timedelta(days=days - 1)
+    mat = np.zeros((len(codes), days), dtype=float)
+    if df_hist is None or df_hist.empty:
+        return mat
+    d = df_hist[(df_hist["type_norm"] == "OUT") & (df_hist["date_eff"] >= start) & (df_hist["date_eff"] <= end)]
+    if d.empty:
+        return mat
+    code_pos = {c: i for i, c in enumerate(codes)}
+    code_col = d["code"].astype(object) if "code" in d.columns else pd.Series(None, index=d.index, dtype=object)
+    # history lama tanpa kode -> cari lewat nama item
+    code_col = code_col.where(code_col.isin(code_pos.keys()), d["item"].astype(object).map(name_to_code))
+    row = code_col.map(code_pos)
+    ok = row.notna().to_numpy()
+    day = (d["date_eff"] - start).dt.days.to_numpy()
+    np.add.at(mat, (row.to_numpy()[ok].astype(int), day[ok]), d["qty"].to_numpy(dtype=float)[ok])
+    return mat
+
+
+def _ses(y):
+    """Level SES + error one-step [SKU x T]."""
+    n, T = y.shape
+    level = y[:, 0].copy()
+    err = np.zeros((n, T))
+    for t in range(1, T):
+        err[:, t] = y[:, t] - level
+        level = level + ALPHA * err[:, t]
+    return level, err
+
+
+def _holt(y):
+    """Holt dengan trend teredam; kembalikan (level, trend, error one-step)."""
+    n, T = y.shape
+    level = y[:, 0].copy()
+    trend = np.zeros(n)
+    err = np.zeros((n, T))
+    for t in range(1, T):
+        pred = level + PHI * trend
+        err[:, t] = y[:, t] - pred
+        new_level = pred + ALPHA * err[:, t]
+        trend = PHI * trend + BETA * (new_level - level - PHI * trend)
+        level = new_level
+    return level, trend, err
+
+
+def _snaive(y):
+    err = np.zeros_like(y)
+    err[:, SEASON:] = y[:, SEASON:] - y[:, :-SEASON]
+    return err
+
+
+def forecast_demand(mat: np.ndarray, horizon: int):
+    """Forecast rata-rata harian untuk `horizon` hari + sigma error + model terpilih, per baris matriks."""
+    n, T = mat.shape
+    if n == 0:
+        return np.zeros(0), np.zeros(0), np.array([], dtype=object)
+    ses_level, ses_err = _ses(mat)
+    holt_level, holt_trend, holt_err = _holt(mat)
+    sn_err = _snaive(mat)
+
+    h = np.arange(1, horizon + 1)
+    damp = np.cumsum(PHI ** h)                                 # sum_{i<=k} phi^i
+    holt_fc = np.clip(holt_level[:, None] + damp[None, :] * holt_trend[:, None], 0, None).mean(axis=1)
+    sn_fc = mat[:, -SEASON:].mean(axis=1)
+    fcs = np.stack([np.clip(ses_level, 0, None), holt_fc, sn_fc])            # [model x SKU]
+
+    hold = slice(max(SEASON, T - HOLDOUT_DAYS), T)
+    errs = np.stack([ses_err[:, hold], holt_err[:, hold], sn_err[:, hold]])  # [model x SKU x H]
+    mae = np.abs(errs).mean(axis=2)
+    best = mae.argmin(axis=0)
+    idx = np.arange(n)
+    fc = fcs[best, idx]
+    sigma = np.sqrt((errs[best, idx] ** 2).mean(axis=1))
+    return fc, sigma, np.array(MODELS, dtype=object)[best]
+
+
+def _recommendation(doc):
+    if doc == float("inf"): return "OK (tidak ada pemakaian)", 5
+    if doc < 15: return "Order NOW (Urgent)", 1
+    if doc < 30: return "Order bulan ini", 2
+    if doc < 60: return "Order bulan depan", 3
+    if doc < 90: return "Order 2 bulan lagi", 4
+    return "OK (stok aman)", 5
+
+
+def reorder_table(df_hist: pd.DataFrame, inventory: dict, ref_end, target_days=60, lead_time=14, service_level=0.95):
+    """Tabel Reorder Insight berbasis forecast untuk semua SKU (satu pass vektor)."""
+    codes = list(inventory.keys())
+    if not codes:
+        return pd.DataFrame()
+    name_to_code = {}
+    for c, it in inventory.items():
+        name_to_code.setdefault(it.get("name"), c)
+    mat = daily_out_matrix(df_hist, codes, name_to_code, ref_end)
+    fc, sigma, model = forecast_demand(mat, max(lead_time, SEASON))
+
+    stock = np.array([int(inventory[c].get("qty", 0)) for c in codes], dtype=float)
+    z = NormalDist().inv_cdf(service_level)
+    safety = np.ceil(z * sigma * np.sqrt(lead_time))
+    rop = np.ceil(fc * lead_time + safety)
+    with np.errstate(divide="ignore"):
+        doc = np.where(fc > 0, stock / np.where(fc > 0, fc, 1), np.inf)
+    order = np.where(fc > 0, np.maximum(0, np.ceil(fc * target_days + safety - stock)), 0)
+    reco = [_recommendation(d) for d in doc]
+
+    df = pd.DataFrame({
+        "Kode": codes,
+        "Nama Barang": [inventory[c].get("name", "-") for c in codes],
+        "Unit": [inventory[c].get("unit", "-") for c in codes],
+        "Current Stock": stock.astype(int),
+        "OUT 3 Bulan": mat[:, -91:].sum(axis=1).astype(int),
+        "Forecast OUT / Hari": np.round(fc, 2),
+        "Model": model,
+        "Safety Stock": safety.astype(int),
+        "Reorder Point": rop.astype(int),
+        "Days of Cover": ["∞" if d == np.inf else int(round(d)) for d in doc],
+        "Rekomendasi": [r[0] for r in reco],
+        "Saran Order (Qty)": order.astype(int),
+        "_urgency": [r[1] for r in reco],
+        "_doc": doc,
+    })
+    return df.sort_values(["_urgency", "_doc"], ascending=[True, True]).drop(columns=["_urgency", "_doc"]).reset_index(drop=True)
+
+
+def cached_reorder_table(brand, version, df_hist, inventory, ref_end, target_days=60, lead_time=14, service_level=0.95):
+    """reorder_table dengan cache per (brand, versi data, parameter). Versi None -> tanpa cache."""
+    key = (brand, version, pd.Timestamp(ref_end).normalize(), target_days, lead_time, service_level)
+    if version is not None:
+        with _cache_lock:
+            if key in _cache:
+                _cache.move_to_end(key)
+                return _cache[key]
+    df = reorder_table(df_hist, inventory, ref_end, target_days, lead_time, service_level)
+    if version is not None:
+        with _cache_lock:
+            _cache[key] = df
+            while len(_cache) > _CACHE_MAX:
+                _cache.popitem(last=False)
+    return df
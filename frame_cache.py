@@ -0,0 +1,60 @@
+# frame_cache.py
+# Cache DataFrame turunan (tabel stok, history rapi, history riwayat lengkap) bersama untuk semua session & thread
+# dalam satu proses. Kunci = (brand, jenis, parameter, versi data); versi data (core.data_version) mencakup file
+# brand, manifest history Arrow dan direktori shard stok lokasi. Frame dibangun sekali per versi lalu dipakai
+# bersama: setiap pemanggil menerima salinan dangkal di atas copy-on-write, sehingga perubahan kolom, index atau
+# operasi inplace di satu session tidak ikut mengubah frame di cache.
+#
+# Memori tiap entri dihitung sekali saat masuk (memory_usage(deep=True)); entri paling lama tidak dipakai digusur
+# bila total melewati FRAME_CACHE_MB. Entri versi lama tidak pernah dipakai lagi sehingga tergusur lebih dulu.
+#
+#   df = frame_cache.get_or_build(brand, "history_full", data.get("_version"), lambda: build(data))
+#
+# Versi None (backend Sheets tanpa versi) -> dibangun setiap kali tanpa disimpan.
+import os
+import time
+
+import pandas as pd
+
+from shared_cache import SharedLRU
+
+# copy-on-write selalu aktif sejak pandas 3; requirements mengizinkan pandas 2.2 yang masih perlu diaktifkan
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.options.mode.copy_on_write = True
+
+MAX_BYTES = int(float(os.environ.get("FRAME_CACHE_MB", "256")) * 1024 * 1024)
+
+
+def frame_bytes(df: pd.DataFrame) -> int:
+    """Perkiraan memori frame termasuk isi kolom objek/string."""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+_cache = SharedLRU(MAX_BYTES, frame_bytes)
+
+
+def get_or_build(brand, kind, version, build, params=()):
+    """Frame dari cache, atau build() sekali lalu disimpan. Build bersamaan untuk kunci sama menunggu hasilnya.
+
+    Hasil berupa salinan dangkal: murah (data dibagi lewat copy-on-write) dan aman diubah pemanggil.
+    """
+    key = None if version is None else (brand, kind, tuple(params), version)
+    return _cache.get_or_build(key, build).copy(deep=False)
+
+
+def invalidate(brand=None):
+    """Buang entri brand (None = semua)."""
+    _cache.invalidate(None if brand is None else lambda k: k[0] == brand)
+
+
+def stats():
+    return _cache.stats()
+
+
+def entries():
+    """Rincian entri (terbaru dipakai dulu) untuk panel Performa."""
+    now = time.time()
+    return [{"brand": k[0], "jenis": k[1], "parameter": ", ".join(map(str, k[2])) or "-", "versi": str(k[3]),
+             "MB": round(e["bytes"] / 1048576, 2), "baris": len(e["value"]), "hit": e["hits"],
+             "build_ms": round(e["build_ms"], 1), "umur_s": int(now - e["built_at"])}
+            for k, e in _cache.items()]
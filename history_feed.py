@@ -0,0 +1,152 @@
+# history_feed.py
+# Change feed history per brand untuk konsumen hilir (finance, BI): setiap entri history punya `seq` yang naik terus
+# (seq = history_seq_base + posisi + 1; Reset Database tidak mengulang nomor). Konsumen menyimpan cursor = seq
+# terakhir yang sudah diproses, lalu meminta "entri setelah cursor" per halaman atau menunggu entri baru (tail).
+# Dibaca dari penyimpanan lokal yang sudah di-commit (JSON, atau segmen Arrow bila HISTORY_FORMAT=arrow: hanya segmen
+# setelah cursor yang dibuka).
+#
+#   python history_feed.py gulavit --after 120 --limit 500 --actions APPROVE_,REJECT_
+#   python history_feed.py gulavit --cursor-file finance.cursor --follow        (JSON Lines ke stdout)
+#
+#   import history_feed
+#   page = history_feed.read("gulavit", after=cursor, limit=1000, actions=("APPROVE_", "REJECT_"))
+#   for entry in history_feed.tail("gulavit", after=cursor): ...
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import history_store
+import inventory_core as core
+
+log = logging.getLogger("gltkims.feed")
+
+DEFAULT_LIMIT = 1000
+TAIL_POLL = 1.0   # detik; cek perubahan file lewat stat, murah
+
+
+def _source(brand):
+    """(base, total, ambil(start, stop) -> list dict) dari file brand yang sudah di-commit."""
+    try:
+        with open(core.DATA_FILES[brand], "r") as f:
+            raw = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        raw = {}
+    base = int(raw.get(core.HISTORY_SEQ_KEY, 0) or 0)
+    if "history" not in raw and raw.get("history_store") == "arrow":
+        hpath = core.history_path(brand)
+        return base, history_store.history_len(hpath), lambda a, b: history_store.read_history_range(hpath, a, b)
+    hist = raw.get("history", [])
+    return base, len(hist), lambda a, b: hist[a:b]
+
+
+def _matches(entry, actions):
+    return not actions or str(entry.get("action", "")).startswith(tuple(actions))
+
+
+def read(brand, after=0, limit=DEFAULT_LIMIT, actions=None):
+    """Entri dengan seq > `after` (maks `limit` yang cocok `actions`, prefix mis. "APPROVE_").
+
+    Hasil: {"entries", "next_cursor", "end_seq", "gap"}. Simpan `next_cursor` sebagai cursor berikutnya;
+    `gap` = True bila entri setelah cursor sudah hilang (history di-reset) atau cursor melewati ujung feed
+    -> konsumen perlu sinkron ulang.
+    """
+    base, total, fetch = _source(brand)
+    end = base + total
+    after = max(0, int(after))
+    gap = after < base or after > end      # entri sudah di-reset / cursor dari history yang lain
+    pos = min(max(after, base) - base, total)
+    entries = []
+    # pindai per blok sampai `limit` entri cocok; tanpa filter satu blok = satu halaman
+    while pos < total and len(entries) < limit:
+        block = fetch(pos, min(total, pos + max(limit, DEFAULT_LIMIT)))
+        for i, row in enumerate(block):
+            if _matches(row, actions):
+                entries.append(dict(row, seq=base + pos + i + 1))
+                if len(entries) >= limit:
+                    pos += i + 1
+                    break
+        else:
+            pos += len(block)
+    return {"entries": entries, "next_cursor": base + pos, "end_seq": end, "gap": gap}
+
+
+def _wait_for_commit(brand, poll, stop=None):
+    """Tunggu sampai versi data brand berubah. Tanpa versi (backend Sheets: data_version None) cukup tidur satu
+    interval lalu kembali, sehingga pemanggil membaca ulang feed secara berkala."""
+    seen = core.data_version(brand)
+    if seen is None:
+        if stop is not None:
+            stop.wait(poll)
+        else:
+            time.sleep(poll)
+        return
+    while (stop is None or not stop.is_set()) and core.data_version(brand) == seen:
+        time.sleep(poll)
+
+
+def tail(brand, after=0, actions=None, poll=TAIL_POLL, limit=DEFAULT_LIMIT, stop=None):
+    """Generator entri baru setelah `after`, menunggu commit berikutnya bila sudah di ujung.
+
+    `stop` = threading.Event opsional untuk berhenti.
+    """
+    cursor = after
+    while stop is None or not stop.is_set():
+        page = read(brand, cursor, limit, actions)
+        for entry in page["entries"]:
+            yield entry
+        cursor = page["next_cursor"]
+        if page["entries"] or cursor < page["end_seq"]:
+            continue
+        _wait_for_commit(brand, poll, stop)
+
+
+def _read_cursor(path):
+    try:
+        with open(path, "r") as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def _write_cursor(path, cursor):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(str(cursor))
+    os.replace(tmp, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Change feed history GLTKIMS (JSON Lines)")
+    parser.add_argument("brand", choices=list(core.DATA_FILES))
+    parser.add_argument("--after", type=int, help="seq terakhir yang sudah diproses (default 0 / isi --cursor-file)")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT)
+    parser.add_argument("--actions", help="prefix action dipisah koma, mis. APPROVE_,REJECT_")
+    parser.add_argument("--cursor-file", help="baca cursor awal & simpan cursor terakhir setelah tiap halaman")
+    parser.add_argument("--follow", action="store_true", help="terus tunggu entri baru (tail)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s", stream=sys.stderr)
+
+    actions = [a.strip() for a in args.actions.split(",") if a.strip()] if args.actions else None
+    cursor = args.after if args.after is not None else (_read_cursor(args.cursor_file) if args.cursor_file else 0)
+    while True:
+        page = read(args.brand, cursor, args.limit, actions)
+        if page["gap"]:
+            log.warning("History setelah cursor %d sudah di-reset; entri lanjut dari seq %d", cursor, page["next_cursor"])
+        for entry in page["entries"]:
+            sys.stdout.write(json.dumps(entry, default=str) + "\n")
+        sys.stdout.flush()
+        cursor = page["next_cursor"]
+        if args.cursor_file:
+            _write_cursor(args.cursor_file, cursor)
+        if cursor < page["end_seq"]:
+            continue
+        if not args.follow:
+            break
+        _wait_for_commit(args.brand, TAIL_POLL)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+# history_store.py
+# Penyimpanan history kolumnar (Arrow IPC) dengan dictionary encoding untuk kolom teks berulang
+# dan timestamp/date native. Dibaca lewat memory-map, hanya kolom yang dibutuhkan.
+#
+# Aktifkan dengan env HISTORY_FORMAT=arrow (butuh pyarrow). Layout per brand:
+#   <brand>_history/manifest.json        daftar segmen aktif (diganti atomik)
+#   <brand>_history/part-<n>.arrow       segmen; save yang hanya menambah baris menulis segmen baru
+# Segmen digabung ulang (compaction) bila jumlahnya melebihi MAX_SEGMENTS.
+import json
+import os
+import threading
+from collections.abc import MutableSequence
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    _ARROW_OK = True
+except Exception:
+    _ARROW_OK = False
+
+HISTORY_FORMAT = os.environ.get("HISTORY_FORMAT", "json")  # "arrow" untuk kolumnar
+MAX_SEGMENTS = 32
+
+# Kolom teks di-dictionary-encode (nilai berulang: action, user, unit, event, trans_type, item, code, ...)
+STRING_COLS = ["action","item","unit","user","event","do_number","attachment","code","trans_type","location"]
+INT_COLS = ["qty","stock"]
+COLUMNS = ["action","item","qty","stock","unit","user","event","do_number","attachment","timestamp","date","code","trans_type","location"]
+
+_lock = threading.Lock()
+
+
+def enabled():
+    return HISTORY_FORMAT == "arrow" and _ARROW_OK
+
+
+def _schema():
+    dict_str = pa.dictionary(pa.int32(), pa.string())
+    types = {c: dict_str for c in STRING_COLS}
+    types.update({"qty": pa.int64(), "stock": pa.int64(), "timestamp": pa.timestamp("s"), "date": pa.date32()})
+    return pa.schema([(c, types[c]) for c in COLUMNS])
+
+
+def _parse_dt(s, fmt):
+    out = pd.to_datetime(s, format=fmt, errors="coerce")
+    rest = out.isna() & s.notna()
+    if rest.any():
+        out[rest] = pd.to_datetime(s[rest].astype(str), format="mixed", errors="coerce")
+    return out
+
+
+def _to_table(rows):
+    df = pd.DataFrame.from_records(list(rows), columns=COLUMNS)
+    schema = _schema()
+    arrays = []
+    for c in COLUMNS:
+        s = df[c]
+        if c in STRING_COLS:
+            arr = pa.array(s.astype("string"), type=pa.string(), from_pandas=True).dictionary_encode()
+        elif c in INT_COLS:
+            arr = pa.array(pd.to_numeric(s, errors="coerce").astype("Int64"), type=pa.int64(), from_pandas=True)
+        elif c == "timestamp":
+            arr = pa.array(_parse_dt(s, "%Y-%m-%d %H:%M:%S").astype("datetime64[s]"), type=pa.timestamp("s"), from_pandas=True)
+        else:
+            arr = pa.array(_parse_dt(s, "%Y-%m-%d").astype("datetime64[s]"), type=pa.timestamp("s"), from_pandas=True).cast(pa.date32())
+        arrays.append(arr)
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+# ====== Manifest & segmen ======
+def _manifest_path(path):
+    return os.path.join(path, "manifest.json")
+
+
+def _read_manifest(path):
+    try:
+        with open(_manifest_path(path), "r") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {"segments": [], "rows": 0, "next": 1}
+
+
+def _write_manifest(path, manifest):
+    tmp = _manifest_path(path) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, _manifest_path(path))
+
+
+def exists(path):
+    return os.path.exists(_manifest_path(path))
+
+
+def history_len(path):
+    """Jumlah baris tanpa membaca data (dari manifest)."""
+    return int(_read_manifest(path).get("rows", 0))
+
+
+def source(path):
+    """Penanda file JSON yang terakhir dimigrasikan ke store ini (None bila ditulis oleh save biasa)."""
+    return _read_manifest(path).get("source")
+
+
+def _write_segment(path, manifest, table):
+    name = f"part-{manifest['next']:06d}.arrow"
+    with pa.OSFile(os.path.join(path, name), "wb") as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    manifest["next"] += 1
+    return name
+
+
+def append_history(path, rows):
+    """Tambah baris sebagai segmen baru; O(baris baru)."""
+    rows = list(rows)
+    if not rows:
+        return
+    with _lock:
+        os.makedirs(path, exist_ok=True)
+        manifest = _read_manifest(path)
+        name = _write_segment(path, manifest, _to_table(rows))
+        manifest["segments"].append({"file": name, "rows": len(rows)})
+        manifest["rows"] = manifest.get("rows", 0) + len(rows)
+        _write_manifest(path, manifest)
+    if len(manifest["segments"]) > MAX_SEGMENTS:
+        compact(path)
+
+
+def write_history(path, rows, source=None):
+    """Tulis ulang seluruh history menjadi satu segmen (reset, edit non-append, migrasi).
+
+    `source` = penanda file asal migrasi (lihat source()); None untuk penulisan biasa.
+    """
+    rows = list(rows)
+    with _lock:
+        os.makedirs(path, exist_ok=True)
+        manifest = _read_manifest(path)
+        old = [s["file"] for s in manifest["segments"]]
+        name = _write_segment(path, manifest, _to_table(rows))
+        manifest["segments"] = [{"file": name, "rows": len(rows)}]
+        manifest["rows"] = len(rows)
+        manifest["source"] = source
+        _write_manifest(path, manifest)
+        _remove_files(path, old)
+
+
+def compact(path):
+    """Gabungkan semua segmen menjadi satu; pembaca lama tetap aman karena file dipetakan memori."""
+    with _lock:
+        manifest = _read_manifest(path)
+        if len(manifest["segments"]) <= 1:
+            return
+        table = _read_table_unlocked(path, manifest, None)
+        old = [s["file"] for s in manifest["segments"]]
+        name = _write_segment(path, manifest, table.combine_chunks())
+        manifest["segments"] = [{"file": name, "rows": table.num_rows}]
+        _write_manifest(path, manifest)
+        _remove_files(path, old)
+
+
+def _remove_files(path, names):
+    for n in names:
+        try:
+            os.remove(os.path.join(path, n))
+        except OSError:
+            pass
+
+
+# ====== Pembacaan (memory-mapped, proyeksi kolom) ======
+def _conform(t, schema):
+    """Segmen lama (sebelum kolom baru ditambahkan ke COLUMNS) dilengkapi kolom null."""
+    if t.schema.names == schema.names:
+        return t
+    cols = [t.column(f.name) if f.name in t.schema.names else pa.nulls(t.num_rows, f.type) for f in schema]
+    return pa.Table.from_arrays(cols, schema=schema)
+
+
+def _read_table_unlocked(path, manifest, columns):
+    tables = []
+    schema = _schema()
+    for seg in manifest["segments"]:
+        source = pa.memory_map(os.path.join(path, seg["file"]), "r")
+        t = _conform(ipc.open_file(source).read_all(), schema)
+        tables.append(t.select(columns) if columns else t)
+    if not tables:
+        schema = _schema()
+        return schema.empty_table().select(columns) if columns else schema.empty_table()
+    return pa.concat_tables(tables).unify_dictionaries()
+
+
+def read_history_table(path, columns=None):
+    """pyarrow.Table dari semua segmen (zero-copy via memory-map), hanya `columns` bila diberikan."""
+    columns = [c for c in columns if c in COLUMNS] if columns else None
+    with _lock:
+        manifest = _read_manifest(path)
+    return _read_table_unlocked(path, manifest, columns)
+
+
+def read_history_df(path, columns=None):
+    """DataFrame kolumnar: teks -> Categorical, timestamp/date -> datetime64."""
+    return read_history_table(path, columns).to_pandas(date_as_object=False)
+
+
+def _df_to_rows(df):
+    """Kembalikan ke bentuk dict seperti di JSON (string tanggal, stock '-' untuk reject)."""
+    cols = {}
+    for c in df.columns:
+        s = df[c]
+        if c == "timestamp":
+            s = s.dt.strftime("%Y-%m-%d %H:%M:%S")
+        elif c == "date":
+            s = s.dt.strftime("%Y-%m-%d")
+        if c == "stock":
+            vals = ["-" if pd.isna(v) else int(v) for v in s.tolist()]
+        elif c == "qty":
+            vals = [0 if pd.isna(v) else int(v) for v in s.tolist()]
+        else:
+            vals = [None if v is None or v != v else v for v in s.tolist()]
+        cols[c] = vals
+    keys = list(cols)
+    return [{k: v for k, v in zip(keys, row) if v is not None} for row in zip(*cols.values())]
+
+
+def read_history_rows(path):
+    return _df_to_rows(read_history_df(path))
+
+
+def read_history_range(path, start, stop=None):
+    """Baris dict [start, stop) dengan hanya membuka segmen yang beririsan (O(baris diminta))."""
+    with _lock:
+        manifest = _read_manifest(path)
+    schema = _schema()
+    tables, offset = [], 0
+    for seg in manifest["segments"]:
+        lo, hi = offset, offset + seg["rows"]
+        offset = hi
+        if hi <= start or (stop is not None and lo >= stop):
+            continue
+        source = pa.memory_map(os.path.join(path, seg["file"]), "r")
+        t = _conform(ipc.open_file(source).read_all(), schema)
+        a = max(start, lo) - lo
+        b = (min(stop, hi) if stop is not None else hi) - lo
+        tables.append(t.slice(a, b - a))
+    if not tables:
+        return []
+    return _df_to_rows(pa.concat_tables(tables).unify_dictionaries().to_pandas(date_as_object=False))
+
+
+def fillna_str(s: pd.Series, value) -> pd.Series:
+    """fillna yang aman untuk Categorical (tambahkan kategori dulu bila perlu)."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        if value not in s.cat.categories:
+            s = s.cat.add_categories([value])
+    return s.fillna(value)
+
+
+class LazyHistory(MutableSequence):
+    """Pengganti list `data["history"]` yang didukung file Arrow.
+
+    Baris baru (append) disimpan sebagai segmen baru saat flush; baris lama baru dibaca ke memori
+    bila ada kode yang benar-benar mengiterasi history. Dashboard/laporan sebaiknya memakai
+    `frame(columns)` agar hanya kolom yang dibutuhkan yang dipetakan.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._disk_len = history_len(path)
+        self._loaded = None
+        self._new = []
+        self._rewrite = False
+
+    def _rows(self):
+        if self._loaded is None:
+            self._loaded = read_history_rows(self.path) + self._new
+        return self._loaded
+
+    def __len__(self):
+        if self._rewrite:
+            return len(self._loaded)
+        return self._disk_len + len(self._new)
+
+    def __getitem__(self, i):
+        return self._rows()[i]
+
+    def __setitem__(self, i, v):
+        self._rows()[i] = v
+        self._rewrite = True
+
+    def __delitem__(self, i):
+        del self._rows()[i]
+        self._rewrite = True
+
+    def __iter__(self):
+        return iter(self._rows())
+
+    def insert(self, i, v):
+        if i >= len(self):
+            return self.append(v)
+        self._rows().insert(i, v)
+        self._rewrite = True
+
+    def append(self, v):
+        self._new.append(v)
+        if self._loaded is not None:
+            self._loaded.append(v)
+
+    def frame(self, columns=None, start=0):
+        """DataFrame kolumnar (memory-mapped) termasuk baris baru yang belum di-flush, mulai baris `start`."""
+        if self._rewrite:
+            df = pd.DataFrame(self._loaded[start:])
+            return df[[c for c in columns if c in df.columns]] if columns else df
+        if start:
+            table = read_history_table(self.path, columns)
+            df = table.slice(min(start, table.num_rows)).to_pandas(date_as_object=False)
+        else:
+            df = read_history_df(self.path, columns)
+        new_rows = self._new[max(0, start - self._disk_len):]
+        if new_rows:
+            new = _to_table(new_rows).to_pandas(date_as_object=False)
+            df = pd.concat([df, new[df.columns]], ignore_index=True)
+        return df
+
+    def flush(self):
+        if self._rewrite:
+            write_history(self.path, self._loaded)
+        elif self._new:
+            append_history(self.path, self._new)
+        self._disk_len = history_len(self.path)
+        self._new = []
+        self._rewrite = False
+        if self._loaded is not None:
+            self._loaded = list(self._loaded)
+
+
+def history_frame(history, columns=None, start=0) -> pd.DataFrame:
+    """DataFrame history dari LazyHistory (kolumnar) atau list dict biasa, mulai baris `start`."""
+    if isinstance(history, LazyHistory):
+        return history.frame(columns, start)
+    df = pd.DataFrame(history[start:] if start else history)
+    if columns:
+        df = df[[c for c in columns if c in df.columns]]
+    return df
@@ -0,0 +1,902 @@
+# inventory_core.py
+# Logika inti inventory yang dipakai bersama oleh UI Streamlit (app.py) dan API (api.py):
+# konstanta, normalisasi record, validasi request, approval/reject, dan storage per brand.
+import json
+import os
+import hashlib
+import logging
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+import history_store
+import locations
+import out_ledger
+import reservations
+import sheets_io
+import sheets_mirror
+import sheets_outbox
+import user_store
+
+try:
+    import fcntl
+    _FCNTL_OK = True
+except Exception:
+    _FCNTL_OK = False
+
+log = logging.getLogger(__name__)
+
+# ====== Konfigurasi Multi-Brand ======
+DATA_FILES = {
+    "gulavit": "gulavit_data.json",
+    "takokak": "takokak_data.json"
+}
+UPLOADS_DIR = "uploads"
+
+TRANS_TYPES = ["Support", "Penjualan"]  # tipe transaksi OUT
+REQ_TYPES = ["IN", "OUT", "RETURN"]
+
+# ==== Storage backend (Google Sheets opsional) ====
+USE_SHEETS = False  # True jika ingin pakai Sheets; jika belum siap, set False
+SHEET_IDS = {
+    "gulavit": "SPREADSHEET_ID_GULAVIT",  # ganti jika USE_SHEETS=True
+    "takokak": "SPREADSHEET_ID_TAKOKAK",
+}
+
+# ===== Normalisasi record agar kolom seragam =====
+STD_REQ_COLS = ["date","code","item","qty","unit","event","trans_type","do_number","attachment","user","timestamp","location"]
+PENDING_COLS = ["type"] + STD_REQ_COLS + ["id"]
+HISTORY_COLS = ["action","item","qty","stock","unit","user","event","do_number","attachment","timestamp","date","code","trans_type","location"]
+
+def timestamp():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def _secrets():
+    """st.secrets bila tersedia (juga terbaca di luar `streamlit run`), selain itu dict kosong."""
+    try:
+        import streamlit as st
+        return st.secrets
+    except Exception:
+        return {}
+
+def _to_date_str(val):
+    if _clean_str(val) == "":
+        return datetime.now().strftime("%Y-%m-%d")
+    # jalur cepat untuk format yang paling sering (form, API, Excel)
+    if isinstance(val, datetime):
+        return val.strftime("%Y-%m-%d")
+    if isinstance(val, str) and len(val) == 10:
+        try:
+            return datetime.strptime(val, "%Y-%m-%d").strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    try:
+        return pd.to_datetime(val, errors="coerce").strftime("%Y-%m-%d")
+    except Exception:
+        return datetime.now().strftime("%Y-%m-%d")
+
+def _to_int(val):
+    if isinstance(val, int) and not isinstance(val, bool):
+        return val
+    num = pd.to_numeric(val, errors="coerce")
+    return 0 if pd.isna(num) else int(num)
+
+def _clean_str(val):
+    """String rapi dari sel Excel/JSON; None/NaN -> ''."""
+    if val is None:
+        return ""
+    try:
+        if pd.isna(val):
+            return ""
+    except (TypeError, ValueError):
+        pass
+    return str(val).strip()
+
+def _norm_event(s):
+    return str(s).strip() if s is not None else "-"
+
+def _norm_trans_type(s):
+    s = "" if s is None else str(s).strip().lower()
+    if s == "support": return "Support"
+    if s == "penjualan": return "Penjualan"
+    return None
+
+def _norm_req_type(s):
+    s = _clean_str(s).upper()
+    return "RETURN" if s == "RETUR" else s
+
+def new_request_id():
+    return uuid.uuid4().hex[:12]
+
+def normalize_out_record(base: dict) -> dict:
+    """Samakan kolom OUT, baik dari manual maupun Excel."""
+    rec = {k: None for k in STD_REQ_COLS}
+    rec.update({
+        "date": _to_date_str(base.get("date")),
+        "code": base.get("code", "-") or "-",
+        "item": base.get("item", "-") or "-",
+        "qty": _to_int(base.get("qty", 0)),
+        "unit": base.get("unit", "-") or "-",
+        "event": _norm_event(base.get("event", "-")),
+        "trans_type": _norm_trans_type(base.get("trans_type")),
+        "do_number": base.get("do_number", "-") or "-",
+        "attachment": base.get("attachment"),
+        "user": base.get("user", "-"),
+        "timestamp": base.get("timestamp", timestamp()),
+        "location": base.get("location") or locations.DEFAULT_LOCATION,
+    })
+    return rec
+
+def normalize_return_record(base: dict) -> dict:
+    """Samakan kolom RETURN (manual/Excel)."""
+    rec = {k: None for k in STD_REQ_COLS}
+    rec.update({
+        "date": _to_date_str(base.get("date")),
+        "code": base.get("code", "-") or "-",
+        "item": base.get("item", "-") or "-",
+        "qty": _to_int(base.get("qty", 0)),
+        "unit": base.get("unit", "-") or "-",
+        "event": _norm_event(base.get("event", "-")),
+        "trans_type": None,
+        "do_number": "-",
+        "attachment": None,
+        "user": base.get("user", "-"),
+        "timestamp": base.get("timestamp", timestamp()),
+        "location": base.get("location") or locations.DEFAULT_LOCATION,
+    })
+    return rec
+
+def make_pending(norm: dict, req_type: str) -> dict:
+    """Record pending siap simpan: tipe + id unik."""
+    norm["type"] = req_type
+    norm["id"] = new_request_id()
+    return norm
+
+def add_pending(data: dict, pending) -> None:
+    """Tambahkan record pending (hasil make_pending) + perbarui ledger retur & reservasi OUT."""
+    reservations.ensure(data)
+    for req in pending:
+        data["pending_requests"].append(req)
+        out_ledger.on_pending_added(data, req)
+        reservations.on_pending_added(data, req)
+
+def _legacy_request_id(req, seen):
+    """Id deterministik untuk pending lama (tanpa id) agar stabil antar load."""
+    key = "|".join(str(req.get(k, "")) for k in ["type","code","item","qty","user","event","timestamp"])
+    n = seen.get(key, 0); seen[key] = n + 1
+    return hashlib.sha1(f"{key}#{n}".encode("utf-8")).hexdigest()[:12]
+
+def ensure_request_ids(data: dict) -> dict:
+    seen = {}
+    for req in data.get("pending_requests", []):
+        if not req.get("id"):
+            req["id"] = _legacy_request_id(req, seen)
+    return data
+
+# ===================== Validasi request =====================
+def build_item_lookup(data: dict):
+    """(by_code, by_name) untuk resolusi item; nama duplikat -> kode pertama."""
+    by_code = data.get("inventory", {})
+    by_name = {}
+    for code, it in by_code.items():
+        by_name.setdefault(it.get("name"), code)
+    return by_code, by_name
+
+def resolve_item_code(lookup, code, name):
+    by_code, by_name = lookup
+    if code and code in by_code:
+        return code
+    if name and name in by_name:
+        return by_name[name]
+    return None
+
+def approved_out_events(data: dict) -> dict:
+    """Peta event OUT approved per nama item (dari ledger OUT)."""
+    return out_ledger.out_events_by_name(data)
+
+def check_return(data: dict, code, item_name, event, qty, reserved=None):
+    """Validasi satu retur terhadap ledger OUT: (event_terpakai, pesan_error|None).
+
+    `reserved` = dict (kode, event ternormalisasi) -> qty retur lain yang sudah dipakai (draft/batch yang sama).
+    """
+    entry = out_ledger.find(data, code, event)
+    if entry is None or entry["out"] <= 0:
+        events = [e["event"] for e in out_ledger.events_for(data, code) if e["out"] > 0]
+        if not events:
+            return None, f"Belum ada event OUT yang di-approve untuk '{item_name}'."
+        return None, f"Event '{event}' tidak cocok. Tersedia: {', '.join(events)}."
+    used = (reserved or {}).get((code, out_ledger.norm_event(event)), 0)
+    sisa = out_ledger.available(entry) - used
+    if qty > sisa:
+        return None, f"Qty retur ({qty}) melebihi sisa OUT event '{entry['event']}' ({max(0, sisa)}) untuk '{item_name}'."
+    return entry["event"], None
+
+def reserved_returns(records):
+    """Qty retur per (kode, event ternormalisasi) dari daftar record draft."""
+    out = {}
+    for r in records or []:
+        key = (r.get("code"), out_ledger.norm_event(r.get("event")))
+        out[key] = out.get(key, 0) + _to_int(r.get("qty", 0))
+    return out
+
+def location_stock(data: dict):
+    """LocationStock milik data (None untuk dict data yang tidak dimuat lewat load_data)."""
+    return data.get(locations.STOCK_KEY)
+
+def location_names(data: dict):
+    stock = location_stock(data)
+    return stock.locations if stock is not None else [locations.DEFAULT_LOCATION]
+
+def resolve_location(data: dict, value):
+    """Nama lokasi baku (kosong -> DEFAULT_LOCATION, tanpa beda huruf besar/kecil) atau None bila tidak dikenal."""
+    value = _clean_str(value)
+    if not value:
+        return locations.DEFAULT_LOCATION
+    return next((l for l in location_names(data) if l.casefold() == value.casefold()), None)
+
+def stock_at(data: dict, code, location=None):
+    """Stok on-hand kode di satu lokasi; total brand bila lokasi None."""
+    stock = location_stock(data)
+    if location is None or stock is None:
+        return _to_int(data.get("inventory", {}).get(code, {}).get("qty", 0))
+    return stock.qty(code, location)
+
+def available_at(data: dict, code, location=None):
+    """Stok tersedia = on-hand - OUT pending (reservasi), di satu lokasi atau total brand."""
+    return stock_at(data, code, location) - reservations.reserved(data, code, location)
+
+def reserved_outs(records):
+    """Qty OUT per (kode, lokasi) dari daftar record draft."""
+    out = {}
+    for r in records or []:
+        key = (r.get("code"), r.get("location") or locations.DEFAULT_LOCATION)
+        out[key] = out.get(key, 0) + _to_int(r.get("qty", 0))
+    return out
+
+def validate_request_rows(data: dict, req_type: str, rows, user: str, start_line=2, do_number=None, attachment=None, drafts=None):
+    """Validasi & normalisasi baris request (Excel/API) dengan aturan yang sama seperti form.
+
+    `rows` berisi dict dengan kunci date, code, item, qty, event, trans_type.
+    `drafts` = record yang sudah ada di daftar draft: retur ikut mengurangi sisa OUT event, OUT ikut mengurangi
+    stok tersedia. OUT dicek terhadap stok tersedia (on-hand - OUT pending) per lokasi, termasuk baris sebelumnya.
+    Mengembalikan (records, errors); records sudah ternormalisasi tanpa `type`/`id`.
+    """
+    req_type = _norm_req_type(req_type)
+    if req_type not in REQ_TYPES:
+        return [], [f"Tipe request '{req_type}' tidak dikenal."]
+    lookup = build_item_lookup(data)
+    inventory = lookup[0]
+    reserved = reserved_returns(drafts) if req_type == "RETURN" else reserved_outs(drafts) if req_type == "OUT" else {}
+    records, errors = [], []
+    for n, row in enumerate(rows, start=start_line):
+        try:
+            code_raw = _clean_str(row.get("code"))
+            name_raw = _clean_str(row.get("item"))
+            qty = _to_int(row.get("qty", 0))
+            event_raw = _clean_str(row.get("event"))
+            location = resolve_location(data, row.get("location"))
+            if location is None:
+                errors.append(f"Baris {n}: Lokasi '{_clean_str(row.get('location'))}' tidak dikenal."); continue
+
+            if req_type == "OUT":
+                tipe = _norm_trans_type(row.get("trans_type"))
+                if not event_raw:
+                    errors.append(f"Baris {n}: Event wajib diisi."); continue
+                if tipe is None:
+                    errors.append(f"Baris {n}: Tipe harus 'Support' atau 'Penjualan'."); continue
+            elif req_type == "RETURN":
+                if qty <= 0: errors.append(f"Baris {n}: Qty harus > 0."); continue
+                if not event_raw: errors.append(f"Baris {n}: Event wajib diisi."); continue
+
+            code = resolve_item_code(lookup, code_raw, name_raw)
+            if code is None:
+                errors.append(f"Baris {n}: Item tidak ditemukan (kode='{code_raw}', nama='{name_raw}')."); continue
+            it = inventory[code]
+            inv_name = it.get("name"); inv_unit = it.get("unit", "-") or "-"
+            if qty <= 0:
+                errors.append(f"Baris {n}: Qty harus > 0."); continue
+
+            base = {"date": row.get("date"), "code": code, "item": inv_name, "qty": qty, "unit": inv_unit, "user": user,
+                    "location": location}
+            if req_type == "OUT":
+                avail = available_at(data, code, location) - reserved.get((code, location), 0)
+                if qty > avail:
+                    errors.append(f"Baris {n}: Qty ({qty}) melebihi stok tersedia ({max(0, avail)}) untuk '{inv_name}' di {location}."); continue
+                reserved[(code, location)] = reserved.get((code, location), 0) + qty
+                base.update({"event": event_raw, "trans_type": tipe})
+                records.append(normalize_out_record(base))
+            elif req_type == "RETURN":
+                match, err = check_return(data, code, inv_name, event_raw, qty, reserved)
+                if err:
+                    errors.append(f"Baris {n}: {err}"); continue
+                key = (code, out_ledger.norm_event(match))
+                reserved[key] = reserved.get(key, 0) + qty
+                base["event"] = match
+                records.append(normalize_return_record(base))
+            else:
+                base.update({"event": "-", "trans_type": None, "do_number": do_number or "-", "attachment": attachment})
+                records.append(normalize_out_record(base))
+        except Exception as e:
+            errors.append(f"Baris {n}: {e}")
+    return records, errors
+
+# ===================== Approval =====================
+def _find_inventory_item(data, req, lookup=None):
+    lookup = lookup or build_item_lookup(data)
+    code = resolve_item_code(lookup, req.get("code"), req.get("item"))
+    return (code, data["inventory"][code]) if code else (None, None)
+
+def approve_requests(data: dict, request_ids) -> list:
+    """Approve pending request berdasarkan id: update stok + tulis history APPROVE_*.
+
+    Mengembalikan daftar request yang di-approve; id yang tidak ada di pending diabaikan.
+    OUT yang melebihi stok on-hand di lokasinya tetap pending (stok tidak pernah negatif).
+    """
+    wanted = set(request_ids)
+    lookup = build_item_lookup(data)
+    stock = location_stock(data)
+    keep, approved = [], []
+    for req in data.get("pending_requests", []):
+        if req.get("id") not in wanted:
+            keep.append(req); continue
+        code, item = _find_inventory_item(data, req, lookup)
+        if item is None:
+            keep.append(req); continue
+        qty = int(req["qty"])
+        location = req.get("location") or locations.DEFAULT_LOCATION
+        if req["type"] == "OUT" and qty > stock_at(data, code, location if stock is not None else None):
+            keep.append(req); continue
+        delta = -qty if req["type"] == "OUT" else qty
+        item["qty"] += delta
+        if stock is not None:
+            stock.add(code, location, delta)
+        data["history"].append({
+            "action": f"APPROVE_{req['type']}",
+            "item": req["item"],
+            "qty": qty,
+            "stock": int(item["qty"]),
+            "unit": item.get("unit", "-"),
+            "user": req["user"],
+            "event": req.get("event", "-"),
+            "do_number": req.get("do_number", "-"),
+            "attachment": req.get("attachment"),
+            "date": req.get("date", None),
+            "code": req.get("code", None),
+            "trans_type": req.get("trans_type", None),
+            "location": location,
+            "timestamp": timestamp()
+        })
+        out_ledger.on_decided(data, req, code, approved=True)
+        reservations.on_decided(data, req, code)
+        approved.append(req)
+    data["pending_requests"] = keep
+    return approved
+
+def reject_requests(data: dict, request_ids) -> list:
+    """Reject pending request berdasarkan id: tulis history REJECT_* tanpa mengubah stok."""
+    wanted = set(request_ids)
+    lookup = build_item_lookup(data)
+    keep, rejected = [], []
+    for req in data.get("pending_requests", []):
+        if req.get("id") not in wanted:
+            keep.append(req); continue
+        data["history"].append({
+            "action": f"REJECT_{req['type']}",
+            "item": req["item"],
+            "qty": int(req["qty"]),
+            "stock": "-",
+            "unit": req.get("unit", "-"),
+            "user": req["user"],
+            "event": req.get("event", "-"),
+            "do_number": req.get("do_number", "-"),
+            "attachment": req.get("attachment"),
+            "date": req.get("date", None),
+            "code": req.get("code", None),
+            "trans_type": req.get("trans_type", None),
+            "location": req.get("location") or locations.DEFAULT_LOCATION,
+            "timestamp": timestamp()
+        })
+        code = resolve_item_code(lookup, req.get("code"), req.get("item"))
+        out_ledger.on_decided(data, req, code, approved=False)
+        reservations.on_decided(data, req, code)
+        rejected.append(req)
+    data["pending_requests"] = keep
+    return rejected
+
+# ===================== Reset & nomor urut history =====================
+HISTORY_SEQ_KEY = "history_seq_base"   # seq entri history pertama - 1 (naik terus walau history di-reset)
+
+def history_end_seq(data: dict) -> int:
+    """Seq entri history terakhir (0 bila belum ada); entri ke-i (0-based) punya seq base + i + 1."""
+    return int(data.get(HISTORY_SEQ_KEY, 0) or 0) + len(data.get("history", []))
+
+def reset_data(data: dict) -> None:
+    """Kosongkan inventory, pending & history. Nomor urut history (change feed) tetap berlanjut."""
+    data[HISTORY_SEQ_KEY] = history_end_seq(data)
+    data["inventory"] = {}
+    data["item_counter"] = 0
+    data["pending_requests"] = []
+    data["history"] = []
+    # ledger turunan ikut dikosongkan; yang lama masih mencatat event/reservasi dari history & pending sebelum reset
+    out_ledger.rebuild(data)
+    reservations.rebuild(data)
+
+# ===================== Antrean pending (filter & halaman) =====================
+
+def pending_frame(data: dict) -> pd.DataFrame:
+    """Pending request sebagai DataFrame (kolom PENDING_COLS, urutan antrean)."""
+    return pd.DataFrame.from_records(data.get("pending_requests", []), columns=PENDING_COLS)
+
+def filter_pending(df: pd.DataFrame, types=None, users=None, events=None, trans_types=None, locs=None,
+                   date_from=None, date_to=None, item=None) -> pd.DataFrame:
+    """Saring antrean secara vektor. Filter list kosong/None = semua; event tanpa beda huruf besar/kecil;
+    `item` = potongan nama atau kode; tanggal inklusif pada kolom date."""
+    mask = pd.Series(True, index=df.index)
+    if types:
+        mask &= df["type"].isin(types)
+    if users:
+        mask &= df["user"].isin(users)
+    if events:
+        wanted = {out_ledger.norm_event(e) for e in events}
+        mask &= df["event"].map(out_ledger.norm_event).isin(wanted)
+    if trans_types:
+        mask &= df["trans_type"].isin(trans_types)
+    if locs:
+        mask &= df["location"].fillna(locations.DEFAULT_LOCATION).isin(locs)
+    if date_from is not None or date_to is not None:
+        dates = pd.to_datetime(df["date"], errors="coerce")
+        if date_from is not None:
+            mask &= dates >= pd.Timestamp(date_from)
+        if date_to is not None:
+            mask &= dates <= pd.Timestamp(date_to)
+    if item:
+        q = str(item).strip()
+        mask &= (df["item"].astype(str).str.contains(q, case=False, regex=False)
+                 | df["code"].astype(str).str.contains(q, case=False, regex=False))
+    return df[mask]
+
+def page_of(df: pd.DataFrame, page: int, page_size: int):
+    """(potongan halaman, jumlah halaman); page mulai 1 dan dijepit ke rentang yang ada."""
+    pages = max(1, -(-len(df) // page_size))
+    page = min(max(1, int(page)), pages)
+    return df.iloc[(page - 1) * page_size: page * page_size], pages
+
+# ========= Google Sheets adapter =========
+def _gs_client():
+    import gspread
+    from google.oauth2.service_account import Credentials
+    scopes = [
+        "https://www.googleapis.com/auth/spreadsheets",
+        "https://www.googleapis.com/auth/drive",
+    ]
+    creds = Credentials.from_service_account_info(
+        dict(_secrets().get("gcp_service_account", {})), scopes=scopes
+    )
+    return gspread.authorize(creds)
+
+INV_COLS = ["code","name","qty","unit","category"]
+_GS_HANDLES = {}   # brand -> (sh, ws_users, ws_inv, ws_pending, ws_history); header dicek sekali per proses
+_GS_LOCK = threading.Lock()
+
+def _gs_open(brand_key):
+    """Spreadsheet & worksheet brand (di-cache per proses agar tidak ada panggilan metadata setiap load).
+
+    Worksheet dibungkus sheets_io.Throttled: setiap panggilan API memakai budget kuota bersama & retry backoff.
+    """
+    with _GS_LOCK:
+        cached = _GS_HANDLES.get(brand_key)
+    if cached is not None:
+        return cached
+    import gspread
+    client = _gs_client()
+    sid = SHEET_IDS.get(brand_key)
+    if not sid:
+        raise RuntimeError(f"Spreadsheet ID untuk brand '{brand_key}' belum diisi.")
+    # semua panggilan API lewat sheets_io (budget kuota + retry backoff)
+    sh = sheets_io.Throttled(sheets_io.call("read", client.open_by_key, sid))
+    existing = {ws.title: sheets_io.Throttled(ws) for ws in sh.worksheets()}
+
+    def ensure_ws(title, headers):
+        ws = existing.get(title)
+        if ws is None:
+            ws = sheets_io.Throttled(sh.add_worksheet(title=title, rows=1000, cols=max(10, len(headers))))
+            ws.append_row(headers)
+        # pastikan header; kolom baru (mis. location) ditambahkan tanpa membuang isi sheet
+        values = ws.get_values("1:1")
+        if not values or values[0] != headers:
+            rows = ws.get_all_records() if values and values[0] else []
+            ws.clear()
+            ws.append_row(headers)
+            if rows:
+                ws.append_rows([[r.get(h) for h in headers] for r in rows])
+            sheets_mirror.invalidate(brand_key, title)
+        return ws
+
+    handles = (sh,
+               ensure_ws("users",   ["username","password","role"]),
+               ensure_ws("inventory", INV_COLS),
+               ensure_ws("pending_requests", PENDING_COLS),
+               ensure_ws("history", HISTORY_COLS))
+    with _GS_LOCK:
+        _GS_HANDLES[brand_key] = handles
+    return handles
+
+def _gs_reset(brand_key):
+    """Buang handle ter-cache (mis. setelah error) agar dibuka ulang pada akses berikutnya."""
+    with _GS_LOCK:
+        _GS_HANDLES.pop(brand_key, None)
+
+def _df_from_ws(ws):
+    rows = ws.get_all_records()
+    return pd.DataFrame(rows)
+
+def _default_users():
+    pw = _secrets().get("passwords", {})
+    return {
+        "admin": {"password": pw.get("admin"), "role": "admin"},
+        "user":  {"password": pw.get("user"),  "role": "user"},
+    }
+
+def _sheets_fetch(brand_key):
+    """(inventory, pending, history) sebagai baris; load bersamaan untuk brand yang sama berbagi satu fetch."""
+    def fetch():
+        _, _, ws_inv, ws_pending, ws_history = _gs_open(brand_key)
+        return (sheets_mirror.sync_table(brand_key, "inventory", ws_inv, INV_COLS),
+                sheets_mirror.sync_table(brand_key, "pending_requests", ws_pending, PENDING_COLS),
+                sheets_mirror.sync_append_only(brand_key, "history", ws_history, HISTORY_COLS))
+    try:
+        return sheets_io.single_flight(("load", brand_key), fetch)
+    except Exception:
+        _gs_reset(brand_key)
+        raise
+
+def _remote_fingerprint(inv_rows, pending_rows, history_rows):
+    return sheets_outbox.fingerprint(inv_rows, pending_rows, len(history_rows), history_rows[-1] if history_rows else None)
+
+def load_data_sheets(brand_key):
+    """Load inkremental: inventory & pending lewat ranged read, history hanya baris baru setelah cursor mirror.
+
+    Load bersamaan untuk brand yang sama berbagi satu fetch (single-flight).
+    """
+    # user tidak lagi dibaca dari sheet brand: lihat user_store
+    inv_rows, pending_rows, history_rows = _sheets_fetch(brand_key)
+    # state Sheets ini sekarang sudah dibaca aplikasi: jadi dasar deteksi konflik replay outbox
+    sheets_outbox.set_synced(brand_key, _remote_fingerprint(inv_rows, pending_rows, history_rows))
+
+    inventory = {}
+    if inv_rows:
+        df_inv = pd.DataFrame(inv_rows, columns=INV_COLS)
+        df_inv["code"] = df_inv["code"].astype(str)
+        df_inv["name"] = df_inv["name"].astype(str)
+        df_inv["qty"] = pd.to_numeric(df_inv["qty"], errors="coerce").fillna(0).astype(int)
+        df_inv["unit"] = df_inv["unit"].replace("", "-").fillna("-").astype(str)
+        df_inv["category"] = df_inv["category"].replace("", "Uncategorized").fillna("Uncategorized").astype(str)
+        inventory = df_inv.set_index("code").to_dict(orient="index")
+
+    return {
+        "inventory": inventory,
+        "item_counter": 0,
+        "pending_requests": sheets_mirror.to_records(PENDING_COLS, pending_rows),
+        "history": sheets_mirror.to_records(HISTORY_COLS, history_rows),
+    }
+
+SHEETS_SAVE_WAIT = float(os.environ.get("SHEETS_SAVE_WAIT", "30"))   # detik menunggu flush sebelum save_data kembali
+
+def _sheets_snapshot(data):
+    """Snapshot baris yang akan ditulis (diambil saat save; data boleh berubah sesudahnya)."""
+    return {
+        "inventory": [sheets_mirror.to_row({"code": code, "name": it.get("name",""), "qty": int(it.get("qty",0)),
+                                            "unit": it.get("unit","-"), "category": it.get("category","Uncategorized")}, INV_COLS)
+                      for code, it in data.get("inventory", {}).items()],
+        "pending": [sheets_mirror.to_row(r, PENDING_COLS) for r in data.get("pending_requests", [])],
+        "history": list(data.get("history", [])),
+    }
+
+def _flush_sheets(brand_key, snap):
+    """Tulis satu snapshot: satu values_batch_update (inventory, pending, ekor history) + satu clear sisa baris lama."""
+    try:
+        sh, _, ws_inv, ws_pending, ws_history = _gs_open(brand_key)
+        history = snap["history"]
+        remote = len(sheets_mirror.sync_append_only(brand_key, "history", ws_history, HISTORY_COLS))
+        if len(history) < remote:
+            # history dipotong (reset database): tulis ulang penuh
+            hist_start, hist_rows = 1, [HISTORY_COLS] + [sheets_mirror.to_row(r, HISTORY_COLS) for r in history]
+        else:
+            hist_start, hist_rows = remote + 2, [sheets_mirror.to_row(r, HISTORY_COLS) for r in history[remote:]]
+
+        tables = [(ws_inv, "inventory", [INV_COLS] + snap["inventory"], 1),
+                  (ws_pending, "pending_requests", [PENDING_COLS] + snap["pending"], 1)]
+        if hist_rows:
+            tables.append((ws_history, "history", hist_rows, hist_start))
+        for ws, _, rows, start in tables:
+            sheets_io.ensure_rows(sh, ws, start + len(rows) - 1)
+        sh.values_batch_update({"valueInputOption": "RAW", "data": [
+            {"range": sheets_io.a1_range(title, start), "values": rows} for _, title, rows, start in tables]})
+        # baris lama di bawah tabel baru (inventory/pending menyusut, history di-reset)
+        clears = [sheets_io.a1_range(title, len(rows) + 1, len(rows[0]))
+                  for _, title, rows, start in tables if start == 1]
+        sh.values_batch_clear(body={"ranges": clears})
+
+        sheets_mirror.replace(brand_key, "inventory", INV_COLS, snap["inventory"])
+        sheets_mirror.replace(brand_key, "pending_requests", PENDING_COLS, snap["pending"])
+        if hist_start == 1:
+            sheets_mirror.replace(brand_key, "history", HISTORY_COLS, hist_rows[1:])
+        elif hist_rows:
+            sheets_mirror.append(brand_key, "history", HISTORY_COLS, hist_rows)
+    except Exception:
+        _gs_reset(brand_key)
+        raise
+
+def submit_sheets(data, brand_key):
+    """Antrikan snapshot ke flusher brand (save bersamaan digabung jadi satu tulis). Mengembalikan ticket."""
+    return sheets_io.submit(("save", brand_key), _sheets_snapshot(data), lambda snap: _flush_sheets(brand_key, snap))
+
+def save_data_sheets(data, brand_key):
+    return submit_sheets(data, brand_key).wait(SHEETS_SAVE_WAIT)
+
+def replay_outbox(brand_key):
+    """Replay outbox (dipanggil worker sheets_outbox): tulis state lokal terbaru brand ke Sheets.
+
+    Ditolak (Conflict) bila Sheets berubah di luar aplikasi sejak sinkron terakhir.
+    """
+    remote_fp = _remote_fingerprint(*_sheets_fetch(brand_key))
+    accepted = sheets_outbox.accepted_fingerprints(brand_key)
+    if accepted and remote_fp not in accepted:
+        raise sheets_outbox.Conflict(remote_fp, "Google Sheets diubah di luar aplikasi sejak sinkron terakhir.")
+    with brand_lock(brand_key):
+        data = _load_json(brand_key)
+        snap = _sheets_snapshot(data)
+        ticket = sheets_io.submit(("save", brand_key), snap, lambda s: _flush_sheets(brand_key, s))
+    history = snap["history"]
+    expected = sheets_outbox.fingerprint(snap["inventory"], snap["pending"], len(history),
+                                         sheets_mirror.to_row(history[-1], HISTORY_COLS) if history else None)
+    sheets_outbox.begin_write(brand_key, expected)
+    ticket.wait()
+    sheets_outbox.set_synced(brand_key, expected)
+
+def start_outbox_worker():
+    """Worker replay outbox Sheets (sekali per proses); tidak melakukan apa pun bila Sheets tidak dipakai."""
+    if USE_SHEETS:
+        return sheets_outbox.start_worker(DATA_FILES.keys(), replay_outbox)
+
+# ====== Lock per brand (antar thread & antar proses UI/API) ======
+_BRAND_LOCKS = {k: threading.RLock() for k in DATA_FILES}
+_LOCK_STATE = threading.local()
+
+@contextmanager
+def brand_lock(brand_key):
+    """Kunci read-modify-write satu brand. Reentrant dalam satu thread."""
+    lock = _BRAND_LOCKS[brand_key]
+    with lock:
+        depth = getattr(_LOCK_STATE, brand_key, 0)
+        setattr(_LOCK_STATE, brand_key, depth + 1)
+        fh = None
+        try:
+            if depth == 0 and _FCNTL_OK:
+                fh = open(DATA_FILES[brand_key] + ".lock", "w")
+                fcntl.flock(fh, fcntl.LOCK_EX)
+            yield
+        finally:
+            if fh is not None:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+                fh.close()
+            setattr(_LOCK_STATE, brand_key, depth)
+
+# ====== History kolumnar (opsional, HISTORY_FORMAT=arrow) ======
+def history_path(brand_key):
+    return os.path.join(os.path.dirname(DATA_FILES[brand_key]), f"{brand_key}_history")
+
+def _file_token(path):
+    """Penanda isi file dari stat (mtime_ns-size); "0" bila tidak ada."""
+    try:
+        st_ = os.stat(path)
+        return f"{st_.st_mtime_ns}-{st_.st_size}"
+    except OSError:
+        return "0"
+
+def _attach_history(data, brand_key, source=None):
+    """Ganti data["history"] dengan LazyHistory berbasis Arrow; migrasi dari JSON bila perlu.
+
+    JSON yang memuat list `history` (migrasi pertama, atau format sempat dikembalikan ke JSON lalu disimpan) adalah
+    sumber kebenaran: store Arrow ditulis ulang darinya, sekali per isi file (`source` = _file_token saat dibaca).
+    """
+    hpath = history_path(brand_key)
+    if history_store.enabled():
+        rows = data.get("history")
+        if isinstance(rows, list) or not history_store.exists(hpath):
+            with brand_lock(brand_key):
+                if source is not None and _file_token(DATA_FILES[brand_key]) != source:
+                    # file brand sudah diganti sejak dibaca: data ini basi, jangan timpa store; pakai list apa adanya
+                    data.pop("history_store", None)
+                    return data
+                if not history_store.exists(hpath) or source is None or history_store.source(hpath) != source:
+                    history_store.write_history(hpath, rows if isinstance(rows, list) else [], source=source)
+        data["history"] = history_store.LazyHistory(hpath)
+    elif data.get("history_store") == "arrow" and "history" not in data:
+        # format dikembalikan ke JSON: baca sekali dari Arrow, tersimpan ke JSON pada save berikutnya
+        data["history"] = history_store.read_history_rows(hpath)
+    data.pop("history_store", None)
+    return data
+
+# ====== Stok per lokasi (shard per lokasi, lihat locations.py) ======
+def stock_path(brand_key):
+    return os.path.join(os.path.dirname(DATA_FILES[brand_key]), f"{brand_key}_stock")
+
+def _committed_shards(brand_key):
+    """Peta shard yang tercatat di JSON lokal (data dari Sheets tidak membawa kunci ini)."""
+    try:
+        with open(DATA_FILES[brand_key], "r") as f:
+            return json.load(f).get(locations.SHARDS_KEY)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+def _attach_stock(data, brand_key):
+    """Pasang LocationStock brand dan samakan dengan total master (migrasi: stok lama -> DEFAULT_LOCATION)."""
+    shards = data[locations.SHARDS_KEY] if locations.SHARDS_KEY in data else _committed_shards(brand_key)
+    stock = locations.LocationStock(stock_path(brand_key), locations.configured(brand_key), shards)
+    stock.reconcile(data.get("inventory", {}))
+    data[locations.STOCK_KEY] = stock
+    return data
+
+def _json_payload(data, brand_key):
+    """Dict yang ditulis ke JSON; history di-flush ke Arrow lebih dulu bila mode kolumnar aktif."""
+    out_ledger.stamp(data)
+    if "users" in data:
+        ensure_user_store()   # user lama dipindah ke user_store sebelum dibuang dari file brand
+    data = {k: v for k, v in data.items() if not k.startswith("_") and k != "users"}
+    hist = data.get("history", [])
+    if history_store.enabled():
+        hpath = history_path(brand_key)
+        if isinstance(hist, history_store.LazyHistory) and hist.path == hpath:
+            hist.flush()
+        else:
+            history_store.write_history(hpath, hist)
+        payload = {k: v for k, v in data.items() if k != "history"}
+        payload["history_store"] = "arrow"
+        return payload
+    if isinstance(hist, history_store.LazyHistory):
+        return dict(data, history=list(hist))
+    return data
+
+# ====== Versi data (kunci cache hasil turunan) ======
+def data_version(brand_key):
+    """Token versi data brand dari stat file JSON (+ manifest history Arrow + direktori shard stok lokasi).
+    None bila tidak bisa dipastikan.
+
+    Diambil SEBELUM file dibaca agar hasil turunan tidak pernah tersimpan dengan versi yang lebih baru dari datanya.
+    """
+    if USE_SHEETS:
+        return None
+    # direktori shard berubah mtime setiap ada file shard generasi baru / shard lama dibersihkan
+    paths = [DATA_FILES[brand_key], os.path.join(history_path(brand_key), "manifest.json"), stock_path(brand_key)]
+    return f"{brand_key}:" + ":".join(_file_token(p) for p in paths)
+
+# ====== Wrapper load/save (Sheets -> fallback JSON) ======
+def _load_json(brand_key):
+    """Data brand dari file JSON lokal (+ history Arrow), atau data kosong bila belum ada/rusak."""
+    data_file = DATA_FILES[brand_key]
+    # shard yang dirujuk JSON bisa terhapus oleh dua save beruntun saat file dibaca tanpa kunci: baca ulang
+    for _ in range(3):
+        if not os.path.exists(data_file):
+            break
+        try:
+            version = data_version(brand_key)
+            source = _file_token(data_file)
+            with open(data_file, "r") as f:
+                data = json.load(f)
+                for code, item in data.get("inventory", {}).items():
+                    if "category" not in item:
+                        item["category"] = "Uncategorized"
+                data = _attach_history(ensure_request_ids(data), brand_key, source)
+                out_ledger.ensure(data)
+                data["_version"] = version
+                return _attach_stock(data, brand_key)
+        except json.JSONDecodeError:
+            break
+        except FileNotFoundError:
+            continue
+    return _attach_stock({
+        "inventory": {},
+        "item_counter": 0,
+        "pending_requests": [],
+        "history": [],
+    }, brand_key)
+
+def load_data(brand_key, warn=None):
+    warn = warn or log.warning
+    # selama outbox brand belum kosong, JSON lokal lebih baru dari Sheets
+    if USE_SHEETS and not sheets_outbox.has_pending(brand_key):
+        try:
+            data = ensure_request_ids(load_data_sheets(brand_key))
+            out_ledger.ensure(data)
+            return _attach_stock(data, brand_key)
+        except Exception as e:
+            warn(f"Gagal membaca Google Sheets: {e}. Pakai data lokal sementara.")
+    # fallback JSON
+    return _load_json(brand_key)
+
+class StaleDataError(Exception):
+    """Data yang akan disimpan dimuat dari versi lama (ada penulisan lain sejak load)."""
+
+
+def save_data(data, brand_key, warn=None):
+    """Simpan data brand. Data hasil load_data yang versinya sudah tidak terbaru ditolak (StaleDataError)
+    agar snapshot basi tidak menimpa penulisan lain; pakai mutate() untuk read-modify-write."""
+    warn = warn or log.warning
+    with brand_lock(brand_key):
+        loaded = data.get("_version")
+        if loaded is not None and loaded != data_version(brand_key):
+            raise StaleDataError(f"Data {brand_key} sudah berubah sejak dimuat; muat ulang lalu ulangi perubahan.")
+        # shard lokasi yang berubah ditulis dulu sebagai generasi baru; belum berlaku sampai JSON di bawah tersimpan.
+        # Seluruh save (termasuk penulis ke lokasi lain) tetap berurutan di bawah brand_lock; lihat batasan di locations.py
+        stock = location_stock(data)
+        if stock is not None:
+            stock.reconcile(data.get("inventory", {}))
+            stock.flush()
+            data[locations.SHARDS_KEY] = dict(stock.shards)
+        # simpan cadangan JSON lokal (tulis ke file sementara lalu replace agar tidak setengah jadi) = titik commit
+        data_file = DATA_FILES[brand_key]
+        tmp_file = f"{data_file}.tmp"
+        payload = _json_payload(data, brand_key)
+        with open(tmp_file, "w") as f:
+            json.dump(payload, f, indent=4)
+        os.replace(tmp_file, data_file)
+        if stock is not None:
+            stock.cleanup()
+        # Sheets ditulis di latar oleh worker outbox (tidak memblokir user; tidak hilang bila Sheets sedang down)
+        if USE_SHEETS:
+            sheets_outbox.enqueue(brand_key)
+        if loaded is not None:
+            data["_version"] = data_version(brand_key)
+    start_outbox_worker()
+
+def mutate(brand_key, fn, warn=None):
+    """Read-modify-write atomik satu brand: muat data terbaru di bawah brand_lock, jalankan fn(data), lalu simpan.
+
+    fn mengembalikan False -> tidak disimpan. Mengembalikan (data, hasil fn).
+    """
+    with brand_lock(brand_key):
+        data = load_data(brand_key, warn=warn)
+        result = fn(data)
+        if result is not False:
+            save_data(data, brand_key, warn=warn)
+    return data, result
+
+# ====== Login ======
+def _legacy_users():
+    """User lama per brand (plaintext di file JSON brand, sebelum ada user_store); default dari secrets bila kosong."""
+    out = {}
+    for brand, path in DATA_FILES.items():
+        try:
+            with open(path, "r") as f:
+                out[brand] = json.load(f).get("users") or {}
+        except (OSError, json.JSONDecodeError):
+            out[brand] = {}
+        if USE_SHEETS and not out[brand]:
+            try:
+                df_users = _df_from_ws(_gs_open(brand)[1])
+                out[brand] = {str(r["username"]): {"password": str(r["password"]), "role": str(r["role"])}
+                              for _, r in df_users.iterrows()}
+            except Exception as e:
+                log.warning("Gagal membaca user lama dari Google Sheets %s: %s", brand, e)
+    if not any(out.values()):
+        out = {brand: _default_users() for brand in DATA_FILES}
+    return out
+
+def ensure_user_store():
+    """Migrasi sekali: buat user_store dari user lama di file brand."""
+    if not user_store.exists():
+        user_store.migrate_legacy(_legacy_users())
+
+def authenticate(username, password):
+    """Cek kredensial terhadap user_store (dibagi semua brand). Kembalikan record user
+    {"username", "role", "brands"} atau None."""
+    ensure_user_store()
+    return user_store.authenticate(username, password)
+
+def user_brands(user):
+    """Brand yang boleh diakses user, urut DATA_FILES."""
+    return user_store.allowed_brands(user, list(DATA_FILES))
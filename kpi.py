@@ -0,0 +1,133 @@
+# kpi.py
+# KPI periode-ke-periode berbasis prefix sum harian: setiap jumlah qty pada rentang [start, end]
+# diselesaikan dengan dua lookup (cum[end] - cum[start-1]), tanpa memfilter ulang history.
+#
+# Seri kumulatif dibangun sekali per versi data untuk:
+#   - tipe (IN / OUT / RETURN)
+#   - tipe x trans_type (mis. OUT x Penjualan)
+#   - tipe x item dan tipe x trans_type x item (sparse per item, dibangun saat pertama dipakai; lookup via searchsorted)
+# Dashboard memakai dimensi item untuk "Perbandingan periode" satu barang.
+import threading
+
+import numpy as np
+import pandas as pd
+
+SALES_TRANS_TYPE = "Penjualan"
+
+
+class KpiIndex:
+    """Prefix sum qty harian dari history yang sudah disiapkan (kolom date_eff, type_norm, qty, trans_type, item)."""
+
+    def __init__(self, df_hist: pd.DataFrame):
+        self._df = df_hist
+        self._series = {}
+        self._items = None
+        self._items_lock = threading.Lock()
+        if df_hist is None or df_hist.empty:
+            self.origin, self.n_days = None, 0
+            return
+        self.origin = df_hist["date_eff"].min().normalize()
+        days = (df_hist["date_eff"] - self.origin).dt.days.to_numpy()
+        self.n_days = int(days.max()) + 1
+        qty = df_hist["qty"].to_numpy(dtype=float)
+        types = df_hist["type_norm"].to_numpy()
+        trans = df_hist["trans_type"].to_numpy() if "trans_type" in df_hist.columns else np.full(len(df_hist), "-")
+        for t in np.unique(types):
+            m = types == t
+            self._series[(t, None)] = self._cumsum(days[m], qty[m])
+            for tt in np.unique(trans[m]):
+                mm = m & (trans == tt)
+                self._series[(t, tt)] = self._cumsum(days[mm], qty[mm])
+        self._days = days
+
+    def _cumsum(self, days, qty):
+        out = np.zeros(self.n_days + 1)
+        out[1:] = np.cumsum(np.bincount(days, weights=qty, minlength=self.n_days))
+        return out
+
+    def _bounds(self, start, end):
+        lo = (pd.Timestamp(start).normalize() - self.origin).days
+        hi = (pd.Timestamp(end).normalize() - self.origin).days + 1
+        return min(max(lo, 0), self.n_days), min(max(hi, 0), self.n_days)
+
+    def _build_items(self):
+        """Per (tipe, trans_type|None, item): hari terurut + qty kumulatif, untuk lookup searchsorted."""
+        trans = self._df["trans_type"] if "trans_type" in self._df.columns else pd.Series("-", index=self._df.index)
+        df = pd.DataFrame({"t": self._df["type_norm"].to_numpy(), "tt": trans.astype(object).fillna("-").to_numpy(),
+                           "item": self._df["item"].astype(str).to_numpy(),
+                           "d": self._days, "q": self._df["qty"].to_numpy(dtype=float)})
+        items = {}
+        for keys, tt in ((["t", "item"], False), (["t", "tt", "item"], True)):
+            agg = df.groupby(keys + ["d"], sort=True)["q"].sum().reset_index()
+            for key, g in agg.groupby(keys, sort=False):
+                key = key if tt else (key[0], None, key[1])
+                items[key] = (g["d"].to_numpy(), np.concatenate([[0.0], np.cumsum(g["q"].to_numpy())]))
+        return items
+
+    def total(self, start, end, type_norm, trans_type=None, item=None):
+        """Jumlah qty pada [start, end] (inklusif) untuk tipe, opsional trans_type dan/atau item."""
+        if self.n_days == 0:
+            return 0
+        lo, hi = self._bounds(start, end)
+        if hi <= lo:
+            return 0
+        if item is not None:
+            if self._items is None:
+                with self._items_lock:
+                    if self._items is None:
+                        self._items = self._build_items()
+            entry = self._items.get((type_norm, trans_type, str(item)))
+            if entry is None:
+                return 0
+            d, cum = entry
+            return int(cum[np.searchsorted(d, hi)] - cum[np.searchsorted(d, lo)])
+        cum = self._series.get((type_norm, trans_type))
+        if cum is None:
+            return 0
+        return int(cum[hi] - cum[lo])
+
+    def period_kpis(self, start, end, total_units, total_skus=0, item=None):
+        """KPI periode [start, end] dan periode sebelumnya dengan panjang sama. Sales = OUT Penjualan.
+
+        `item` (nama barang) membatasi semua jumlah ke satu barang; total_units = stok barang itu.
+        """
+        start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+        period_days = max(1, (end - start).days + 1)
+        prev_end = start - pd.Timedelta(days=1)
+        prev_start = prev_end - pd.Timedelta(days=period_days - 1)
+
+        cur_sales = self.total(start, end, "OUT", SALES_TRANS_TYPE, item)
+        prev_sales = self.total(prev_start, prev_end, "OUT", SALES_TRANS_TYPE, item)
+        return {
+            "total_units": int(total_units),
+            "total_skus": int(total_skus),
+            "cur_in": self.total(start, end, "IN", item=item),
+            "cur_out": self.total(start, end, "OUT", item=item),
+            "cur_ret": self.total(start, end, "RETURN", item=item),
+            "cur_sales": cur_sales,
+            "prev_sales": prev_sales,
+            # Turnover ~ sales / persediaan sekarang (disederhanakan)
+            "turnover": (cur_sales / total_units) if total_units > 0 else 0.0,
+            "inv_to_sales": (total_units / cur_sales) if cur_sales > 0 else 0.0,
+            # Avg Days of Supply ≈ persediaan sekarang / rata-rata penjualan per hari (di periode)
+            "days_supply": (total_units / (cur_sales / period_days)) if cur_sales > 0 else 0.0,
+        }
+
+    def compare(self, windows, total_units, total_skus=0, item=None):
+        """KPI untuk beberapa rentang sekaligus: list (label, start, end) -> DataFrame. `item` = satu barang saja."""
+        rows = []
+        for label, start, end in windows:
+            k = self.period_kpis(start, end, total_units, total_skus, item)
+            change = ((k["cur_sales"] - k["prev_sales"]) / k["prev_sales"] * 100) if k["prev_sales"] else None
+            rows.append({
+                "Periode": label,
+                "Dari": pd.Timestamp(start).strftime("%d %b %Y"),
+                "Sampai": pd.Timestamp(end).strftime("%d %b %Y"),
+                "IN": k["cur_in"], "OUT": k["cur_out"], "Retur": k["cur_ret"],
+                "Sales": k["cur_sales"], "Sales Periode Lalu": k["prev_sales"],
+                "Perubahan Sales (%)": None if change is None else round(change, 1),
+                "Turnover": round(k["turnover"], 2),
+                "Inventory/Sales": round(k["inv_to_sales"], 2),
+                "Days of Supply": round(k["days_supply"], 1),
+            })
+        return pd.DataFrame(rows)
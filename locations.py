@@ -0,0 +1,207 @@
+# locations.py
+# Dimensi lokasi stok (gudang, mobil event) per brand. Master item & total stok tetap di file brand;
+# rincian stok per lokasi disimpan ter-shard, satu file per lokasi:
+#   <brand>_stock/<slug lokasi>.g<gen>.json      {"location": "Gudang Utama", "gen": 7, "stock": {kode: qty}}
+# Perubahan stok di satu lokasi hanya menulis shard lokasi itu, sebagai file generasi baru. File JSON brand mencatat
+# shard mana yang berlaku (SHARDS_KEY) dan menjadi titik commit: shard ditulis dulu, lalu JSON brand. Crash di antara
+# keduanya hanya meninggalkan shard yatim yang diabaikan saat load dan dibersihkan pada save berikutnya.
+# Total per item (inventory[kode]["qty"]) selalu = jumlah semua shard; selisih dari perubahan master masuk ke
+# DEFAULT_LOCATION (pengurangan diambil dari DEFAULT_LOCATION dulu, stok lokasi tidak pernah dibuat negatif).
+#
+# Batasan: sharding ini mengurangi I/O (lokasi lain tidak ditulis ulang), BUKAN kontensi kunci. Setiap mutasi stok
+# juga mengubah total master & history di file brand, sehingga setiap save tetap menulis ulang file brand di bawah
+# satu brand_lock per brand: penulis ke lokasi berbeda masih berjalan bergantian. Kunci per lokasi baru berguna bila
+# total & history tidak lagi disimpan di file brand.
+#
+# Daftar lokasi per brand dibaca dari LOCATIONS_FILE (lihat locations.example.json); tanpa file hanya DEFAULT_LOCATION.
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+
+import pandas as pd
+
+log = logging.getLogger("gltkims.locations")
+
+LOCATIONS_FILE = os.environ.get("LOCATIONS_FILE", "locations.json")
+DEFAULT_LOCATION = "Gudang Utama"
+STOCK_KEY = "_stock"
+SHARDS_KEY = "stock_shards"  # di JSON brand: {lokasi: nama file shard yang berlaku}
+_SHARD_RE = re.compile(r"^[0-9a-z_]+-[0-9a-f]{6}(?:\.g(\d+))?\.json$")   # tanpa .g<gen> = tata letak lama
+
+_shard_cache = {}            # path shard -> ((mtime_ns, size), lokasi, stok)
+_lock = threading.Lock()
+
+
+def configured(brand):
+    """Lokasi terdaftar untuk brand; DEFAULT_LOCATION selalu ada dan selalu pertama."""
+    try:
+        with open(LOCATIONS_FILE, "r") as f:
+            cfg = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        cfg = {}
+    locs = [str(l).strip() for l in cfg.get(brand, []) if str(l).strip()]
+    return [DEFAULT_LOCATION] + [l for l in dict.fromkeys(locs) if l != DEFAULT_LOCATION]
+
+
+def _slug(location):
+    base = re.sub(r"[^0-9a-z]+", "_", location.lower()).strip("_") or "lokasi"
+    return f"{base}-{hashlib.sha1(location.encode('utf-8')).hexdigest()[:6]}"
+
+
+def _read_shard(path):
+    """(lokasi, stok) dari file shard; di-cache per (mtime, size) dan disalin agar aman diubah."""
+    st_ = os.stat(path)
+    sig = (st_.st_mtime_ns, st_.st_size)
+    with _lock:
+        cached = _shard_cache.get(path)
+    if cached is None or cached[0] != sig:
+        with open(path, "r") as f:
+            raw = json.load(f)
+        cached = (sig, raw["location"], {c: int(q) for c, q in raw.get("stock", {}).items()})
+        with _lock:
+            _shard_cache[path] = cached
+    return cached[1], dict(cached[2])
+
+
+class LocationStock:
+    """Stok per (kode, lokasi) untuk satu brand. Hanya shard yang berubah yang ditulis saat flush().
+
+    `shards` = peta {lokasi: file} yang tercatat di JSON brand; None = tata letak lama (<slug>.json), dimigrasikan
+    ke file bergenerasi pada flush berikutnya.
+    """
+
+    def __init__(self, path, locations=(), shards=None):
+        self.path = path
+        self._stock = {}
+        self._dirty = set()
+        self.shards = {}
+        self._prev_shards = {}
+        if shards is None:
+            legacy = [fn for fn in sorted(os.listdir(path)) if (m := _SHARD_RE.match(fn)) and m.group(1) is None] \
+                if os.path.isdir(path) else []
+            for fn in legacy:
+                loc, stock = _read_shard(os.path.join(path, fn))
+                self._stock[loc] = stock
+            self._dirty.update(self._stock)
+        else:
+            for loc, fn in shards.items():
+                self._stock[loc] = _read_shard(os.path.join(path, fn))[1]
+                self.shards[loc] = fn
+        for loc in locations:
+            self._stock.setdefault(loc, {})
+        self._stock.setdefault(DEFAULT_LOCATION, {})
+
+    @property
+    def locations(self):
+        """Lokasi terdaftar + lokasi lama yang masih punya shard; DEFAULT_LOCATION pertama."""
+        return [DEFAULT_LOCATION] + [l for l in self._stock if l != DEFAULT_LOCATION]
+
+    def qty(self, code, location):
+        return self._stock.get(location, {}).get(code, 0)
+
+    def by_location(self, code):
+        """{lokasi: qty} untuk satu kode (hanya lokasi yang pernah memegang kode ini)."""
+        return {loc: s[code] for loc, s in self._stock.items() if code in s}
+
+    def add(self, code, location, delta):
+        stock = self._stock.setdefault(location, {})
+        stock[code] = stock.get(code, 0) + int(delta)
+        self._dirty.add(location)
+        return stock[code]
+
+    def totals(self):
+        out = {}
+        for stock in self._stock.values():
+            for code, q in stock.items():
+                out[code] = out.get(code, 0) + q
+        return out
+
+    def _take(self, code, qty):
+        """Kurangi total kode sebanyak qty: DEFAULT_LOCATION dulu, lalu lokasi lain; tidak ada lokasi di bawah 0."""
+        for loc in self.locations:
+            have = self.qty(code, loc)
+            if qty <= 0:
+                break
+            if have <= 0:
+                continue
+            take = min(have, qty)
+            self.add(code, loc, -take)
+            qty -= take
+            if loc != DEFAULT_LOCATION:
+                log.warning("Total master %s turun melebihi stok %s; %d diambil dari %s", code, DEFAULT_LOCATION, take, loc)
+        if qty > 0:
+            log.warning("Total master %s lebih kecil %d dari stok lokasi yang tersisa; dibiarkan", code, qty)
+
+    def reconcile(self, inventory):
+        """Samakan dengan total master: kode yang hilang dibuang, selisih total masuk/diambil dari DEFAULT_LOCATION.
+
+        Pertama kali (belum ada shard) seluruh stok lama otomatis menjadi stok DEFAULT_LOCATION.
+        """
+        totals = self.totals()
+        for loc, stock in self._stock.items():
+            gone = [c for c in stock if c not in inventory]
+            for c in gone:
+                del stock[c]
+            if gone:
+                self._dirty.add(loc)
+        for code, it in inventory.items():
+            diff = int(it.get("qty", 0) or 0) - totals.get(code, 0)
+            if diff > 0:
+                self.add(code, DEFAULT_LOCATION, diff)
+            elif diff < 0:
+                self._take(code, -diff)
+
+    def frame(self, codes=None):
+        """DataFrame kode x lokasi (0 bila kosong), kolom urut `locations`."""
+        df = pd.DataFrame({loc: pd.Series(self._stock[loc], dtype="int64") for loc in self.locations})
+        if codes is not None:
+            df = df.reindex(list(codes))
+        return df.fillna(0).astype(int)
+
+    def summary(self):
+        """Total unit & jumlah SKU berstok per lokasi."""
+        return pd.DataFrame([
+            {"Lokasi": loc, "Total Unit": sum(self._stock[loc].values()),
+             "SKU Berstok": sum(1 for q in self._stock[loc].values() if q > 0)}
+            for loc in self.locations
+        ])
+
+    def _next_gen(self):
+        gens = [int(m.group(1)) for fn in os.listdir(self.path) if (m := _SHARD_RE.match(fn)) and m.group(1)]
+        return max(gens, default=0) + 1
+
+    def flush(self):
+        """Tulis shard lokasi yang berubah ke file generasi baru; `shards` ikut diperbarui.
+
+        Belum berlaku sampai `shards` tersimpan di JSON brand (titik commit), lalu panggil cleanup().
+        """
+        self._prev_shards = dict(self.shards)
+        if not self._dirty:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        gen = self._next_gen()
+        for loc in sorted(self._dirty):
+            fn = f"{_slug(loc)}.g{gen}.json"
+            path = os.path.join(self.path, fn)
+            tmp = f"{path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump({"location": loc, "gen": gen, "stock": self._stock.get(loc, {})}, f)
+            os.replace(tmp, path)
+            self.shards[loc] = fn
+        self._dirty.clear()
+
+    def cleanup(self):
+        """Hapus shard yang tidak berlaku lagi (setelah commit JSON brand). Shard commit sebelumnya disimpan satu
+        generasi agar pembaca yang baru saja membaca JSON lama masih bisa membuka shard-nya."""
+        if not os.path.isdir(self.path):
+            return
+        keep = set(self.shards.values()) | set(self._prev_shards.values())
+        for fn in os.listdir(self.path):
+            if _SHARD_RE.match(fn.removesuffix(".tmp")) and fn not in keep:
+                try:
+                    os.remove(os.path.join(self.path, fn))
+                except OSError as e:
+                    log.warning("Gagal menghapus shard lama %s: %s", fn, e)
@@ -0,0 +1,154 @@
+# out_ledger.py
+# Ledger OUT yang masih beredar per (kode item, event ternormalisasi):
+#   out     = total APPROVE_OUT
+#   ret     = total APPROVE_RETURN
+#   pending = total RETURN yang masih pending
+# Sisa yang boleh diretur = out - ret - pending. Disimpan di data["out_ledger"] dan dirawat inkremental
+# oleh approve/reject/tambah pending; saat load hanya baris history baru (ekor) yang diterapkan.
+import history_store
+
+LEDGER_KEY = "out_ledger"
+_COLS = ["action", "item", "code", "event", "qty"]
+
+
+def norm_event(ev):
+    """Kunci event: spasi dirapikan, tanpa beda huruf besar/kecil."""
+    return " ".join(str(ev or "").split()).casefold()
+
+
+def _is_event(ev):
+    return norm_event(ev) not in ("", "-", "none", "nan")
+
+
+def _name_to_code(data):
+    out = {}
+    for code, it in data.get("inventory", {}).items():
+        out.setdefault(it.get("name"), code)
+    return out
+
+
+def _empty(history_len=0):
+    return {"history_len": history_len, "entries": {}}
+
+
+def _entry(ledger, code, event):
+    evs = ledger["entries"].setdefault(code, {})
+    key = norm_event(event)
+    e = evs.get(key)
+    if e is None:
+        e = evs[key] = {"event": " ".join(str(event).split()), "out": 0, "ret": 0, "pending": 0}
+    return e
+
+
+def _apply_frame(ledger, df, data):
+    """Terapkan baris APPROVE_OUT / APPROVE_RETURN dari DataFrame history (vektor)."""
+    if df.empty or "action" not in df.columns:
+        return
+    for col in _COLS:
+        if col not in df.columns:
+            df[col] = None
+    df = df[df["action"].isin(["APPROVE_OUT", "APPROVE_RETURN"])]
+    if df.empty:
+        return
+    inv = data.get("inventory", {})
+    code = df["code"].astype(object)
+    code = code.where(code.isin(inv.keys()), df["item"].astype(object).map(_name_to_code(data)))
+    ev = df["event"].astype(object).fillna("").astype(str)
+    d = df.assign(_code=code, _ev=ev.str.split().str.join(" "), _key=ev.map(norm_event),
+                  qty=df["qty"].fillna(0).astype(int))
+    d = d[d["_code"].notna() & ~d["_key"].isin(["", "-", "none", "nan"])]
+    for (c, key, action), g in d.groupby(["_code", "_key", "action"], sort=False):
+        e = _entry(ledger, c, g["_ev"].iloc[0])
+        e["out" if action == "APPROVE_OUT" else "ret"] += int(g["qty"].sum())
+
+
+def _recount_pending(ledger, data):
+    for evs in ledger["entries"].values():
+        for e in evs.values():
+            e["pending"] = 0
+    lookup = _name_to_code(data)
+    inv = data.get("inventory", {})
+    for req in data.get("pending_requests", []):
+        if req.get("type") == "RETURN" and _is_event(req.get("event")):
+            code = req.get("code") if req.get("code") in inv else lookup.get(req.get("item"))
+            if code:
+                _entry(ledger, code, req["event"])["pending"] += int(req.get("qty", 0) or 0)
+
+
+def rebuild(data):
+    ledger = _empty(len(data.get("history", [])))
+    _apply_frame(ledger, history_store.history_frame(data.get("history", []), _COLS), data)
+    _recount_pending(ledger, data)
+    data[LEDGER_KEY] = ledger
+    return ledger
+
+
+def ensure(data):
+    """Pastikan ledger sinkron dengan history: terapkan ekor baru saja; bangun ulang bila history menyusut."""
+    ledger = data.get(LEDGER_KEY)
+    n = len(data.get("history", []))
+    if not isinstance(ledger, dict) or "entries" not in ledger or ledger.get("history_len", 0) > n:
+        return rebuild(data)
+    if ledger["history_len"] < n:
+        _apply_frame(ledger, history_store.history_frame(data["history"], _COLS, start=ledger["history_len"]), data)
+        ledger["history_len"] = n
+    _recount_pending(ledger, data)
+    return ledger
+
+
+def stamp(data):
+    """Dipanggil sebelum simpan: ledger mewakili seluruh history di memori."""
+    if LEDGER_KEY in data:
+        data[LEDGER_KEY]["history_len"] = len(data.get("history", []))
+
+
+# ====== Pembaruan inkremental ======
+def _ledger(data):
+    return data.get(LEDGER_KEY) or rebuild(data)
+
+
+def on_pending_added(data, req):
+    if req.get("type") == "RETURN" and _is_event(req.get("event")) and req.get("code"):
+        _entry(_ledger(data), req["code"], req["event"])["pending"] += int(req.get("qty", 0) or 0)
+
+
+def on_decided(data, req, code, approved):
+    """Request pending di-approve/reject: pindahkan qty dari pending ke ret (RETURN) atau tambah out (OUT)."""
+    if not code or not _is_event(req.get("event")):
+        return
+    qty = int(req.get("qty", 0) or 0)
+    if req.get("type") == "RETURN":
+        e = _entry(_ledger(data), code, req["event"])
+        e["pending"] = max(0, e["pending"] - qty)
+        if approved:
+            e["ret"] += qty
+    elif req.get("type") == "OUT" and approved:
+        _entry(_ledger(data), code, req["event"])["out"] += qty
+
+
+# ====== Query ======
+def available(entry):
+    return entry["out"] - entry["ret"] - entry["pending"]
+
+
+def find(data, code, event):
+    """Entry ledger (O(1)) atau None."""
+    return _ledger(data)["entries"].get(code, {}).get(norm_event(event))
+
+
+def events_for(data, code):
+    """Entry event OUT untuk satu kode, urut nama event."""
+    return sorted(_ledger(data)["entries"].get(code, {}).values(), key=lambda e: e["event"].casefold())
+
+
+def out_events_by_name(data):
+    """Peta nama item -> set event OUT approved (kompatibel dengan approved_out_events lama)."""
+    inv = data.get("inventory", {})
+    out = {}
+    for code, evs in _ledger(data)["entries"].items():
+        name = inv.get(code, {}).get("name")
+        if name:
+            for e in evs.values():
+                if e["out"] > 0:
+                    out.setdefault(name, set()).add(e["event"])
+    return out
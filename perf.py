@@ -0,0 +1,335 @@
+# perf.py
+# Instrumentasi waktu per rerun: span di sekitar storage, data prep, section dashboard & handler menu.
+# Hasil: agregat in-memory (panel admin), log terstruktur JSON Lines, dan file teks format Prometheus.
+# Mode profiling: cProfile satu rerun per menu (tombol admin atau env PROFILE_MENU), nol overhead bila mati.
+import cProfile
+import json
+import logging
+import os
+import pstats
+import re
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+log = logging.getLogger("gltkims.perf")
+
+PERF_ENABLED = os.environ.get("PERF_ENABLED", "1") != "0"
+PERF_LOG_FILE = os.environ.get("PERF_LOG_FILE", "perf_log.jsonl")
+PERF_LOG_MAX_BYTES = int(float(os.environ.get("PERF_LOG_MAX_MB", "20")) * 1024 * 1024)   # 0 = tanpa rotasi
+PERF_LOG_BACKUPS = int(os.environ.get("PERF_LOG_BACKUPS", "3"))                          # perf_log.jsonl.1 .. .N
+PERF_PROM_FILE = os.environ.get("PERF_PROM_FILE", "perf_metrics.prom")
+PROM_WRITE_INTERVAL = 5.0   # detik; file Prometheus ditulis ulang paling sering tiap interval ini
+WINDOW = 200                # jumlah durasi terakhir per span untuk p50/p95
+RECENT_RUNS = 20
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_TOP_N = 30
+
+_lock = threading.Lock()
+_log_lock = threading.Lock()    # serialisasi append + rotasi file log
+_prom_lock = threading.Lock()   # satu penulis file Prometheus pada satu waktu
+_local = threading.local()
+_stats = {}                 # (span, brand, menu) -> {"count", "sum", "max", "recent"}
+_recent_runs = deque(maxlen=RECENT_RUNS)
+_last_prom_write = 0.0
+# Env PROFILE_MENU="Riwayat Lengkap" (atau "*") [+ PROFILE_BRAND="takokak"]: profil rerun berikutnya yang cocok, sekali per proses.
+_env_profile = os.environ.get("PROFILE_MENU") or None
+_env_profile_brand = os.environ.get("PROFILE_BRAND") or None
+_profiles = deque(maxlen=RECENT_RUNS)
+
+
+class Rerun:
+    """Satu eksekusi script Streamlit: konteks label + daftar span yang tercatat."""
+
+    def __init__(self, brand="-", **context):
+        self.context = {"brand": brand, "menu": "-"}
+        self.context.update(context)
+        self.started = time.time()
+        self.t0 = time.perf_counter()
+        self.menu_t0 = None
+        self.last_mark = self.t0
+        self.spans = []
+        self.finished = False
+        self.profiler = None
+
+
+def current():
+    return getattr(_local, "run", None)
+
+
+def begin_rerun(brand="-", prev=None, **context):
+    """Mulai rerun baru. `prev` = rerun sebelumnya dari session yang mungkin terputus oleh st.rerun()."""
+    if prev is not None and not prev.finished:
+        end_rerun(prev, interrupted=True)
+    run = Rerun(brand, **context)
+    _local.run = run
+    return run
+
+
+def set_context(**context):
+    run = current()
+    if run is not None:
+        run.context.update(context)
+
+
+def _consume_env_profile(menu, brand):
+    global _env_profile
+    if _env_profile is None:
+        return False
+    with _lock:
+        if _env_profile in ("*", menu) and _env_profile_brand in (None, brand):
+            _env_profile = None
+            return True
+    return False
+
+
+def menu_started(menu, profile=False):
+    """Tandai awal handler menu; durasinya dicatat sebagai span `menu` saat rerun selesai.
+
+    `profile=True` (atau env PROFILE_MENU cocok) menjalankan cProfile sampai rerun ini selesai.
+    """
+    run = current()
+    if run is not None:
+        run.context["menu"] = menu
+        if profile or _consume_env_profile(menu, run.context.get("brand")):
+            run.profiler = cProfile.Profile()
+            run.profiler.enable()
+        run.menu_t0 = time.perf_counter()
+
+
+def _record(name, dur, labels):
+    key = (name, labels.get("brand", "-"), labels.get("menu", "-"))
+    with _lock:
+        s = _stats.get(key)
+        if s is None:
+            s = _stats[key] = {"count": 0, "sum": 0.0, "max": 0.0, "recent": deque(maxlen=WINDOW)}
+        s["count"] += 1
+        s["sum"] += dur
+        s["max"] = max(s["max"], dur)
+        s["recent"].append(dur)
+
+
+@contextmanager
+def span(name, **labels):
+    """Ukur durasi blok. Label default diambil dari rerun aktif (brand, menu)."""
+    if not PERF_ENABLED:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        t1 = time.perf_counter()
+        run = current()
+        merged = dict(run.context) if run is not None else {}
+        merged.update(labels)
+        _record(name, t1 - t0, merged)
+        if run is not None:
+            run.spans.append({"span": name, "ms": round((t1 - t0) * 1000, 2), **labels})
+            run.last_mark = t1
+
+
+def timed(name):
+    """Decorator versi `span` untuk fungsi."""
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+class Laps:
+    """Span berurutan tanpa indentasi ulang: setiap `mark(x)` mencatat waktu sejak mark sebelumnya."""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.t = time.perf_counter()
+
+    def mark(self, name):
+        if not PERF_ENABLED:
+            return
+        now = time.perf_counter()
+        run = current()
+        labels = dict(run.context) if run is not None else {}
+        _record(f"{self.prefix}.{name}", now - self.t, labels)
+        if run is not None:
+            run.spans.append({"span": f"{self.prefix}.{name}", "ms": round((now - self.t) * 1000, 2)})
+            run.last_mark = now
+        self.t = now
+
+
+def end_rerun(run=None, interrupted=False):
+    """Tutup rerun: catat span `menu` & `rerun`, tulis log JSON Lines dan (berkala) file Prometheus."""
+    run = run or current()
+    if run is None or run.finished:
+        return
+    run.finished = True
+    end = run.last_mark if interrupted else time.perf_counter()
+    if run.profiler is not None:
+        run.profiler.disable()
+        _save_profile(run, end)
+    if not PERF_ENABLED:
+        return
+    if run.menu_t0 is not None:
+        _record("menu", end - run.menu_t0, run.context)
+        run.spans.append({"span": "menu", "ms": round((end - run.menu_t0) * 1000, 2)})
+    total = end - run.t0
+    _record("rerun", total, run.context)
+    entry = {
+        "ts": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(run.started)),
+        **run.context,
+        "total_ms": round(total * 1000, 2),
+        "interrupted": interrupted,
+        "spans": run.spans,
+    }
+    with _lock:
+        _recent_runs.append(entry)
+    _write_log(entry)
+    _maybe_write_prom()
+
+
+def _slug(s):
+    return re.sub(r"[^A-Za-z0-9]+", "_", str(s)).strip("_") or "-"
+
+
+def _save_profile(run, end):
+    """Simpan .prof bertag brand/menu/waktu dan ringkasan top-N (urut cumulative time)."""
+    prof, run.profiler = run.profiler, None
+    brand, menu = run.context.get("brand", "-"), run.context.get("menu", "-")
+    stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(run.started))
+    path = os.path.join(PROFILE_DIR, f"{_slug(brand)}_{_slug(menu)}_{stamp}.prof")
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        prof.dump_stats(path)
+    except OSError as e:
+        log.warning("Gagal menyimpan profil %s: %s", path, e)
+        path = None
+    stats = pstats.Stats(prof).sort_stats("cumulative")
+    top = []
+    for func in stats.fcn_list[:PROFILE_TOP_N]:
+        cc, nc, tt, ct, _ = stats.stats[func]
+        filename, line, name = func
+        top.append({
+            "function": f"{os.path.basename(filename)}:{line}({name})" if line else name,
+            "ncalls": nc, "tottime_ms": round(tt * 1000, 2), "cumtime_ms": round(ct * 1000, 2),
+        })
+    entry = {"ts": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(run.started)), "brand": brand, "menu": menu,
+             "menu_ms": round((end - (run.menu_t0 or run.t0)) * 1000, 2), "file": path, "top": top}
+    with _lock:
+        _profiles.append(entry)
+    log.info("Profil %s/%s disimpan ke %s", brand, menu, path)
+
+
+def saved_profiles():
+    """Profil terbaru (paling baru di akhir) beserta tabel hotspot top-N."""
+    with _lock:
+        return list(_profiles)
+
+
+def _rotate_log_unlocked():
+    """Geser perf_log.jsonl -> .1 -> .2 ... (yang tertua dibuang) bila ukurannya melewati PERF_LOG_MAX_BYTES."""
+    try:
+        if not PERF_LOG_MAX_BYTES or os.path.getsize(PERF_LOG_FILE) < PERF_LOG_MAX_BYTES:
+            return
+    except OSError:
+        return
+    if PERF_LOG_BACKUPS <= 0:
+        os.remove(PERF_LOG_FILE)
+        return
+    for i in range(PERF_LOG_BACKUPS - 1, 0, -1):
+        src = f"{PERF_LOG_FILE}.{i}"
+        if os.path.exists(src):
+            os.replace(src, f"{PERF_LOG_FILE}.{i + 1}")
+    os.replace(PERF_LOG_FILE, f"{PERF_LOG_FILE}.1")
+
+
+def _write_log(entry):
+    if not PERF_LOG_FILE:
+        return
+    line = json.dumps(entry, default=str) + "\n"
+    try:
+        with _log_lock:
+            _rotate_log_unlocked()
+            with open(PERF_LOG_FILE, "a") as f:
+                f.write(line)
+    except OSError as e:
+        log.warning("Gagal menulis %s: %s", PERF_LOG_FILE, e)
+
+
+def _quantile(values, q):
+    if not values:
+        return 0.0
+    vals = sorted(values)
+    return vals[min(len(vals) - 1, int(round(q * (len(vals) - 1))))]
+
+
+def summary():
+    """Agregat per (span, brand, menu) sebagai list dict, urut p95 menurun."""
+    with _lock:
+        rows = [{
+            "span": k[0], "brand": k[1], "menu": k[2], "count": s["count"],
+            "avg_ms": round(s["sum"] / s["count"] * 1000, 1),
+            "p50_ms": round(_quantile(s["recent"], 0.5) * 1000, 1),
+            "p95_ms": round(_quantile(s["recent"], 0.95) * 1000, 1),
+            "max_ms": round(s["max"] * 1000, 1),
+        } for k, s in _stats.items()]
+    return sorted(rows, key=lambda r: r["p95_ms"], reverse=True)
+
+
+def recent_runs():
+    with _lock:
+        return list(_recent_runs)
+
+
+def _esc(v):
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def prometheus_text():
+    lines = [
+        "# HELP gltkims_span_seconds Durasi span per rerun Streamlit.",
+        "# TYPE gltkims_span_seconds summary",
+    ]
+    max_lines = [
+        "# HELP gltkims_span_seconds_max Durasi span terlama sejak proses start.",
+        "# TYPE gltkims_span_seconds_max gauge",
+    ]
+    with _lock:
+        items = [(k, s["count"], s["sum"], s["max"], list(s["recent"])) for k, s in _stats.items()]
+    for (name, brand, menu), count, total, mx, recent in sorted(items):
+        lbl = f'span="{_esc(name)}",brand="{_esc(brand)}",menu="{_esc(menu)}"'
+        for q in (0.5, 0.95):
+            lines.append(f'gltkims_span_seconds{{{lbl},quantile="{q}"}} {_quantile(recent, q):.6f}')
+        lines.append(f"gltkims_span_seconds_sum{{{lbl}}} {total:.6f}")
+        lines.append(f"gltkims_span_seconds_count{{{lbl}}} {count}")
+        max_lines.append(f"gltkims_span_seconds_max{{{lbl}}} {mx:.6f}")
+    return "\n".join(lines + max_lines) + "\n"
+
+
+def _maybe_write_prom(force=False):
+    global _last_prom_write
+    if not PERF_PROM_FILE:
+        return
+    now = time.time()
+    if not force and now - _last_prom_write < PROM_WRITE_INTERVAL:
+        return
+    _last_prom_write = now
+    # nama file sementara unik + lock: rerun dari beberapa thread tidak saling menimpa file .tmp
+    with _prom_lock:
+        tmp = None
+        try:
+            with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(os.path.abspath(PERF_PROM_FILE)),
+                                             prefix=os.path.basename(PERF_PROM_FILE) + ".", suffix=".tmp",
+                                             delete=False) as f:
+                tmp = f.name
+                f.write(prometheus_text())
+            os.replace(tmp, PERF_PROM_FILE)
+        except OSError as e:
+            log.warning("Gagal menulis %s: %s", PERF_PROM_FILE, e)
+            if tmp and os.path.exists(tmp):
+                os.remove(tmp)
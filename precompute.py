@@ -0,0 +1,224 @@
+# precompute.py
+# Precompute analitik dashboard per brand di luar jalur request: saat server start, setelah batch tulis
+# (menunggu data tenang SETTLE_SECONDS), dan refresh malam saat tanggal berganti.
+# Hasil disimpan di cache berversi (core.data_version) milik proses; render_dashboard_pro membaca cache ini dulu.
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+
+import inventory_core as core
+import history_store
+import forecast
+import frame_cache
+import kpi
+
+log = logging.getLogger("gltkims.precompute")
+
+PRECOMPUTE_INTERVAL = float(os.environ.get("PRECOMPUTE_INTERVAL", "10"))
+SETTLE_SECONDS = float(os.environ.get("PRECOMPUTE_SETTLE_SECONDS", "2"))
+# Parameter default dashboard (harus sama dengan nilai awal widget di app.py)
+DEFAULT_TARGET_DAYS = 60
+DEFAULT_LEAD_TIME = 14
+DEFAULT_SERVICE_LEVEL = 0.95
+
+_cache = {}                 # brand -> hasil compute()
+_cache_lock = threading.Lock()
+
+
+# ====== Perhitungan (tanpa streamlit) ======
+def prepare_history_df(data: dict) -> pd.DataFrame:
+    """History rapi: hanya APPROVE_* dengan tanggal efektif & tipe."""
+    hist = data.get("history", [])
+    df = history_store.history_frame(hist, ["action","item","qty","unit","event","date","timestamp","code","trans_type","user"])
+    if df.empty:
+        return df
+
+    df["qty"] = pd.to_numeric(df.get("qty", 0), errors="coerce").fillna(0).astype(int)
+    s_date = pd.to_datetime(df["date"], errors="coerce") if "date" in df.columns else pd.Series(pd.NaT, index=df.index)
+    s_ts = pd.to_datetime(df["timestamp"], errors="coerce") if "timestamp" in df.columns else pd.Series(pd.NaT, index=df.index)
+    df["date_eff"] = s_date.fillna(s_ts).dt.floor("D")
+
+    act = df.get("action", "").astype(str).str.upper()
+    df["type_norm"] = "-"
+    df.loc[act.str.contains("APPROVE_IN"), "type_norm"] = "IN"
+    df.loc[act.str.contains("APPROVE_OUT"), "type_norm"] = "OUT"
+    df.loc[act.str.contains("APPROVE_RETURN"), "type_norm"] = "RETURN"
+
+    for col in ["item", "event", "trans_type", "unit"]:
+        if col not in df.columns:
+            df[col] = None
+
+    df = df[df["type_norm"].isin(["IN","OUT","RETURN"])].copy()
+    df = df.dropna(subset=["date_eff"])
+    df["event"] = df["event"].astype(object).fillna("-").astype(str)
+    df["trans_type"] = df["trans_type"].astype(object).fillna("-").astype(str)
+    return df
+
+
+def default_range(today=None):
+    """Rentang filter default dashboard: awal bulan 11 bulan lalu s/d hari ini."""
+    today = pd.Timestamp(today).normalize() if today is not None else pd.Timestamp.today().normalize()
+    return (today - pd.DateOffset(months=11)).replace(day=1), today
+
+
+def filter_range(df_hist, start_date, end_date):
+    if df_hist.empty:
+        return pd.DataFrame(columns=["date_eff","type_norm","qty","item","event","trans_type"])
+    mask = (df_hist["date_eff"] >= pd.Timestamp(start_date)) & (df_hist["date_eff"] <= pd.Timestamp(end_date))
+    return df_hist.loc[mask].copy()
+
+
+def month_agg(df, tipe):
+    """Agregasi bulanan (urut) + label & index untuk sort tegas."""
+    d = df[df["type_norm"]==tipe].copy()
+    if d.empty:
+        return pd.DataFrame({"month": [], "qty": [], "Periode": [], "idx": []})
+    d["month"] = d["date_eff"].dt.to_period("M").dt.to_timestamp()  # awal bulan
+    g = d.groupby("month", as_index=False)["qty"].sum().sort_values("month")
+    g["Periode"] = g["month"].dt.strftime("%b %Y")
+    g["idx"] = g["month"].dt.year.astype(int) * 12 + g["month"].dt.month.astype(int)
+    return g
+
+
+def top_events(df_range, n=5):
+    df_ev = df_range[(df_range["type_norm"]=="OUT") & (df_range["event"].notna())]
+    df_ev = df_ev[df_ev["event"].astype(str).str.strip().ne("-")]
+    return (df_ev.groupby("event", as_index=False)["qty"].sum()
+            .sort_values("qty", ascending=False).head(n))
+
+
+def inventory_frame(data: dict) -> pd.DataFrame:
+    return pd.DataFrame([
+        {"Kode": code, "Nama Barang": it.get("name","-"), "Current Stock": int(it.get("qty",0)), "Unit": it.get("unit","-")}
+        for code, it in data.get("inventory", {}).items()
+    ])
+
+
+def compute(data: dict, brand, today=None):
+    """Semua analitik dashboard untuk rentang & parameter default."""
+    start, end = default_range(today)
+    # frame dasar lewat frame_cache: dashboard yang menghitung ulang (filter non-default) memakai objek yang sama
+    df_hist = frame_cache.get_or_build(brand, "history_approved", data.get("_version"), lambda: prepare_history_df(data))
+    df_inv = frame_cache.get_or_build(brand, "inventory_dashboard", data.get("_version"), lambda: inventory_frame(data))
+    df_range = filter_range(df_hist, start, end)
+    reorder = None
+    if not df_inv.empty:
+        reorder = forecast.cached_reorder_table(
+            brand, data.get("_version"), df_hist, data.get("inventory", {}), end,
+            target_days=DEFAULT_TARGET_DAYS, lead_time=DEFAULT_LEAD_TIME, service_level=DEFAULT_SERVICE_LEVEL,
+        )
+    return {
+        "version": data.get("_version"),
+        "day": end,
+        "start": start,
+        "end": end,
+        "df_hist": df_hist,
+        "df_inv": df_inv,
+        "df_range": df_range,
+        "kpi": kpi.KpiIndex(df_hist),
+        "months": {t: month_agg(df_range, t) for t in ("IN", "OUT", "RETURN")},
+        "top10": df_inv.sort_values("Current Stock", ascending=False).head(10) if not df_inv.empty else df_inv,
+        "ev_top": top_events(df_range),
+        "reorder": reorder,
+        "computed_at": core.timestamp(),
+    }
+
+
+# ====== Cache berversi ======
+def get(brand, version):
+    """Hasil precompute bila versi data & tanggal masih sama; None bila basi/belum ada.
+
+    Backend Sheets tidak punya token versi murah (version None) sehingga selalu dihitung ulang.
+    """
+    if version is None:
+        return None
+    with _cache_lock:
+        res = _cache.get(brand)
+    if res is None or res["version"] != version or res["day"] != pd.Timestamp.today().normalize():
+        return None
+    return res
+
+
+def warm(brand):
+    """Load + compute + simpan ke cache. Mengembalikan hasilnya."""
+    t0 = time.perf_counter()
+    data = core.load_data(brand)
+    res = compute(data, brand)
+    with _cache_lock:
+        _cache[brand] = res
+    log.info("Precompute %s selesai dalam %.2fs (versi %s)", brand, time.perf_counter() - t0, res["version"])
+    return res
+
+
+# ====== Scheduler ======
+class PrecomputeWorker(threading.Thread):
+    """Thread latar: warm semua brand saat start, setelah data berubah (batch tulis), dan saat ganti hari."""
+
+    def __init__(self, brands=None, interval=PRECOMPUTE_INTERVAL):
+        super().__init__(name="precompute", daemon=True)
+        self.brands = list(brands or core.DATA_FILES.keys())
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._wake = threading.Event()
+
+    def notify(self):
+        """Dipanggil setelah save: bangunkan worker lebih cepat dari interval."""
+        self._wake.set()
+
+    def _stale(self, brand):
+        with _cache_lock:
+            res = _cache.get(brand)
+        if res is None or res["day"] != pd.Timestamp.today().normalize():
+            return True      # start / refresh malam
+        version = core.data_version(brand)
+        return version is not None and version != res["version"]
+
+    def _settled(self, brand):
+        """Tunggu sampai versi tidak berubah selama SETTLE_SECONDS (satu batch tulis selesai)."""
+        version = core.data_version(brand)
+        while not self._stop_event.wait(SETTLE_SECONDS):
+            now = core.data_version(brand)
+            if now == version:
+                return True
+            version = now
+        return False
+
+    def run(self):
+        while not self._stop_event.is_set():
+            for brand in self.brands:
+                if self._stale(brand) and self._settled(brand):
+                    try:
+                        warm(brand)
+                    except Exception:
+                        log.exception("Precompute %s gagal", brand)
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def start_worker(brands=None, interval=PRECOMPUTE_INTERVAL):
+    """Start worker sekali per proses (aman dipanggil berulang dari rerun Streamlit)."""
+    global _worker
+    if core.USE_SHEETS:
+        return None   # tanpa token versi, hasil precompute tidak bisa divalidasi
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = PrecomputeWorker(brands, interval)
+            _worker.start()
+        return _worker
+
+
+def notify():
+    if _worker is not None:
+        _worker.notify()
+
@@ -0,0 +1,171 @@
+# reconcile.py
+# Rekonsiliasi inventory vs history per brand. inventory[kode]["qty"] diubah di tempat saat approve, sedangkan history
+# mencatat mutasi + snapshot `stock`; crash di tengah save, sesi bersamaan, atau edit manual bisa membuat keduanya
+# tidak sinkron. Engine ini memutar ulang mutasi (ADD_ITEM, APPROVE_*, ADJUST_STOCK) per barang secara vektor
+# (groupby sum/cumsum, tanpa loop per baris) lalu membandingkan dengan qty master dan kolom `stock` tercatat.
+#
+#   Selisih           = qty inventory - hasil replay mutasi
+#   Selisih Tercatat  = qty inventory - `stock` tercatat terakhir di history
+#   Lompatan          = baris history yang `stock`-nya tidak sama dengan stock sebelumnya + mutasinya
+#
+# Mode perbaikan (opsional):
+#   "history"    inventory dianggap benar: tambah entri ADJUST_STOCK (qty bertanda) sehingga replay = inventory
+#   "inventory"  history dianggap benar: qty inventory diset ke hasil replay (+ ADJUST_STOCK qty 0 sebagai jejak)
+# Entri ADJUST_STOCK mencatat `stock` = qty baru sehingga Selisih Tercatat ikut kembali 0.
+#
+#   python reconcile.py gulavit                      laporan drift; exit code 1 bila ada drift (cocok untuk cron)
+#   python reconcile.py gulavit --all --csv drift.csv
+#   python reconcile.py gulavit --repair history
+import argparse
+import logging
+import sys
+
+import numpy as np
+import pandas as pd
+
+import inventory_core as core
+import stock_card
+
+log = logging.getLogger("gltkims.reconcile")
+
+REPAIR_MODES = ("history", "inventory")
+REPORT_COLS = ["Kode", "Nama Barang", "Qty Inventory", "Qty Replay", "Selisih", "Stock Tercatat", "Selisih Tercatat",
+               "Lompatan", "Seq Lompatan Pertama", "Status"]
+
+STATUS_OK = "OK"
+STATUS_DRIFT = "DRIFT"
+STATUS_NO_HISTORY = "TANPA HISTORY"
+STATUS_NOT_IN_MASTER = "TIDAK DI MASTER"
+
+
+def drift_report(data: dict, only_drift=False) -> pd.DataFrame:
+    """Satu baris per barang (master + kode yang hanya ada di history), kolom REPORT_COLS."""
+    inventory = data.get("inventory", {})
+    mv = stock_card.movements(data, describe=False).sort_values(["Kode", "pos"], kind="stable")
+    codes = mv["Kode"].to_numpy()
+    g = mv.groupby("Kode", sort=False)
+
+    # offset = stock tercatat - saldo replay; berubah di dalam satu kode = ada lompatan di baris itu
+    offset = (mv["stock"] - g["delta"].cumsum()).to_numpy()
+    recorded = ~np.isnan(offset)
+    rec = pd.DataFrame({"Kode": codes[recorded], "off": offset[recorded], "pos": mv["pos"].to_numpy()[recorded]})
+    prev = rec.groupby("Kode", sort=False)["off"].shift(fill_value=0.0).to_numpy()
+    rec["jump"] = rec["off"].to_numpy() != prev
+    jumps = rec[rec["jump"]].groupby("Kode", sort=False)["pos"].agg(["size", "min"])
+
+    replay = g["delta"].sum()
+    last_stock = g["stock"].last()          # nilai non-NaN terakhir per kode
+    names = g["Nama Barang"].last()
+
+    idx = pd.Index(sorted(set(inventory) | set(replay.index)), name="Kode")
+    inv_qty = pd.Series({c: int(it.get("qty", 0) or 0) for c, it in inventory.items()}, dtype="int64").reindex(idx)
+    rep = replay.reindex(idx).fillna(0).astype("int64")
+    stock_rec = last_stock.reindex(idx).round().astype("Int64")
+    base = int(data.get(core.HISTORY_SEQ_KEY, 0) or 0)
+    in_master = idx.isin(list(inventory))
+    has_moves = idx.isin(replay.index)
+    selisih = (inv_qty.fillna(0).astype("int64") - rep)
+    selisih_rec = (inv_qty.astype("Int64") - stock_rec)
+
+    status = np.select(
+        [~in_master, ~has_moves & (inv_qty.fillna(0) != 0).to_numpy(),
+         (selisih != 0).to_numpy() | (selisih_rec.fillna(0) != 0).to_numpy()],
+        [STATUS_NOT_IN_MASTER, STATUS_NO_HISTORY, STATUS_DRIFT], default=STATUS_OK)
+    n_jumps = jumps["size"].reindex(idx).fillna(0).astype("int64")
+    first_jump = (jumps["min"].reindex(idx) + base + 1).astype("Int64")
+    report = pd.DataFrame({
+        "Kode": idx.to_numpy(),
+        "Nama Barang": [inventory[c].get("name", "") if c in inventory else names.get(c, "") for c in idx],
+        "Qty Inventory": inv_qty.astype("Int64").to_numpy(),
+        "Qty Replay": rep.to_numpy(),
+        "Selisih": selisih.to_numpy(),
+        "Stock Tercatat": stock_rec.to_numpy(),
+        "Selisih Tercatat": selisih_rec.to_numpy(),
+        "Lompatan": n_jumps.to_numpy(),
+        "Seq Lompatan Pertama": first_jump.to_numpy(),
+        "Status": status,
+    })
+    if only_drift:
+        report = report[report["Status"] != STATUS_OK]
+    return report.reset_index(drop=True)
+
+
+def summarize(report: pd.DataFrame) -> dict:
+    counts = report["Status"].value_counts()
+    return {"items": int(len(report)), **{s: int(counts.get(s, 0)) for s in
+            (STATUS_OK, STATUS_DRIFT, STATUS_NO_HISTORY, STATUS_NOT_IN_MASTER)},
+            "abs_selisih": int(report["Selisih"].abs().sum())}
+
+
+def repair(data: dict, mode="history", user="reconcile", report=None) -> list:
+    """Perbaiki barang master berstatus DRIFT / TANPA HISTORY (mutasi `data` di tempat; simpan dengan save_data).
+
+    Mode "inventory" tidak menyentuh barang TANPA HISTORY (replay 0 akan mengosongkan stok yang belum pernah tercatat).
+    Mengembalikan daftar {"code", "item", "before", "after", "diff"}. Kode yang tidak ada di master hanya dilaporkan.
+    """
+    if mode not in REPAIR_MODES:
+        raise ValueError(f"Mode perbaikan tidak dikenal: {mode} (pilih {', '.join(REPAIR_MODES)})")
+    report = drift_report(data) if report is None else report
+    todo = report[report["Status"].isin([STATUS_DRIFT, STATUS_NO_HISTORY])]
+    inventory = data.get("inventory", {})
+    today = pd.Timestamp.now().strftime("%Y-%m-%d")
+    changes = []
+    for code, name, inv_qty, replay, status in todo[["Kode", "Nama Barang", "Qty Inventory", "Qty Replay", "Status"]].itertuples(index=False):
+        item = inventory[code]
+        if mode == "history":
+            before, target = int(replay), int(inv_qty)
+            qty, note = target - before, f"history disamakan ke inventory ({before} -> {target})"
+        else:
+            if status == STATUS_NO_HISTORY:
+                continue
+            if replay < 0:
+                log.warning("Replay %s negatif (%d), dilewati", code, replay)
+                continue
+            before, target = int(inv_qty), int(replay)
+            qty, note = 0, f"inventory disamakan ke history ({before} -> {target})"
+            item["qty"] = target
+        data["history"].append({
+            "action": stock_card.ADJUST_ACTION, "item": name, "qty": qty, "stock": target, "unit": item.get("unit", "-"),
+            "user": user, "event": note, "date": today, "code": code, "timestamp": core.timestamp(),
+        })
+        changes.append({"code": code, "item": name, "before": before, "after": target, "diff": target - before})
+    return changes
+
+
+def _print_report(args, report):
+    log.info("%s: %s", args.brand, summarize(report))
+    shown = report if args.all else report[report["Status"] != STATUS_OK]
+    if args.csv:
+        shown.to_csv(args.csv, index=False)
+    elif not shown.empty:
+        sys.stdout.write(shown.to_string(index=False) + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rekonsiliasi inventory vs history GLTKIMS")
+    parser.add_argument("brand", choices=list(core.DATA_FILES))
+    parser.add_argument("--all", action="store_true", help="tampilkan juga barang yang OK")
+    parser.add_argument("--csv", help="tulis laporan ke CSV")
+    parser.add_argument("--repair", choices=REPAIR_MODES, help="perbaiki drift lalu simpan")
+    parser.add_argument("--user", default="reconcile", help="user yang dicatat pada entri perbaikan")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s", stream=sys.stderr)
+
+    if args.repair:
+        # load -> perbaiki -> simpan di bawah kunci brand: tidak menimpa approve/submit yang berjalan bersamaan
+        with core.brand_lock(args.brand):
+            data = core.load_data(args.brand)
+            report = drift_report(data)
+            _print_report(args, report)
+            changes = repair(data, args.repair, args.user, report)
+            if changes:
+                core.save_data(data, args.brand)
+        log.info("%d barang diperbaiki (mode %s)", len(changes), args.repair)
+        return 0
+    report = drift_report(core.load_data(args.brand))
+    _print_report(args, report)
+    return 1 if (report["Status"] != STATUS_OK).any() else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
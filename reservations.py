@@ -0,0 +1,75 @@
+# reservations.py
+# Ledger reservasi stok: qty OUT yang masih pending per (kode item, lokasi).
+#   tersedia = stok on-hand di lokasi - qty OUT pending di lokasi itu
+# Dibangun sekali dari pending_requests (satu pass) lalu dirawat inkremental oleh tambah pending / approve / reject,
+# jadi cek stok tersedia di form, import Excel, API & approval O(1) berapa pun panjang antrean.
+# Tidak disimpan ke file (kunci diawali "_"); pending_requests tetap sumber kebenarannya.
+import locations
+
+RESERVED_KEY = "_reserved"
+
+
+def _key(req):
+    return req.get("location") or locations.DEFAULT_LOCATION
+
+
+def _name_to_code(data):
+    out = {}
+    for code, it in data.get("inventory", {}).items():
+        out.setdefault(it.get("name"), code)
+    return out
+
+
+def _empty():
+    return {"by_loc": {}, "by_code": {}}
+
+
+def _bump(ledger, code, location, delta):
+    k = (code, location)
+    ledger["by_loc"][k] = max(0, ledger["by_loc"].get(k, 0) + delta)
+    ledger["by_code"][code] = max(0, ledger["by_code"].get(code, 0) + delta)
+
+
+def rebuild(data):
+    ledger = _empty()
+    inv = data.get("inventory", {})
+    lookup = None
+    for req in data.get("pending_requests", []):
+        if req.get("type") != "OUT":
+            continue
+        code = req.get("code")
+        if code not in inv:
+            lookup = lookup if lookup is not None else _name_to_code(data)
+            code = lookup.get(req.get("item"))
+        if code:
+            _bump(ledger, code, _key(req), int(req.get("qty", 0) or 0))
+    data[RESERVED_KEY] = ledger
+    return ledger
+
+
+def ensure(data):
+    """Ledger milik data; dibangun dari antrean pending bila belum ada."""
+    ledger = data.get(RESERVED_KEY)
+    return ledger if isinstance(ledger, dict) else rebuild(data)
+
+
+# ====== Pembaruan inkremental ======
+def on_pending_added(data, req):
+    """Dipanggil SETELAH req masuk pending_requests (ledger harus sudah ada sebelumnya, lihat ensure)."""
+    if req.get("type") == "OUT" and req.get("code"):
+        _bump(ensure(data), req["code"], _key(req), int(req.get("qty", 0) or 0))
+
+
+def on_decided(data, req, code):
+    """Request OUT di-approve (stok on-hand berkurang) atau di-reject: reservasinya dilepas."""
+    if req.get("type") == "OUT" and code:
+        _bump(ensure(data), code, _key(req), -int(req.get("qty", 0) or 0))
+
+
+# ====== Query ======
+def reserved(data, code, location=None):
+    """Qty OUT pending untuk kode di satu lokasi; seluruh lokasi bila lokasi None."""
+    ledger = ensure(data)
+    if location is None:
+        return ledger["by_code"].get(code, 0)
+    return ledger["by_loc"].get((code, location), 0)
@@ -0,0 +1,148 @@
+# search.py
+# Indeks pencarian item (kode, nama, kategori): prefix per token + trigram untuk kecocokan fuzzy/substring.
+# Dibangun sekali per versi inventory (kode/nama/kategori), dipakai kotak cari stok/export dan picker item di form.
+import re
+import threading
+from bisect import bisect_left
+
+import numpy as np
+
+MIN_TRIGRAM_RATIO = 0.5      # minimal porsi trigram query yang harus ada agar dianggap cocok fuzzy
+_TOKEN_RE = re.compile(r"[0-9a-z]+")
+
+_cache = {}                  # brand -> (version, fingerprint, SearchIndex)
+_cache_lock = threading.Lock()
+
+
+def _norm(s):
+    return " ".join(_TOKEN_RE.findall(str(s or "").lower()))
+
+
+def _trigrams(s):
+    s = f"  {s} "
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+class SearchIndex:
+    """Indeks satu inventory. `search()` mengembalikan kode item terurut skor (paling relevan dulu).
+
+    Token unik (kode, bagian kode, kata nama & kategori) -> daftar item; trigram -> token. Prefix dicari
+    dengan bisect pada kosakata terurut, fuzzy dengan menghitung trigram bersama per token.
+    """
+
+    def __init__(self, inventory: dict):
+        self.codes = list(inventory.keys())
+        self.names = [str(it.get("name", "")) for it in inventory.values()]
+        self.categories = [str(it.get("category", "Uncategorized")) for it in inventory.values()]
+        n = len(self.codes)
+        self._cat_arr = np.array(self.categories, dtype=object)
+        # urutan tie-break: nama lalu kode
+        self._name_rank = np.empty(n, dtype=np.int64)
+        self._name_rank[sorted(range(n), key=lambda i: (self.names[i].lower(), self.codes[i]))] = np.arange(n)
+        self._code_key = np.array([_norm(c).replace(" ", "") for c in self.codes], dtype=object)
+        self._code_sorted = np.argsort(self._code_key, kind="stable")
+        self._code_sorted_keys = list(self._code_key[self._code_sorted])
+
+        # Pasangan (token, item) unik -> CSR terurut token: token ke-t punya item di doc[ptr[t]:ptr[t+1]]
+        tok_list, doc_list = [], []
+        for i, (c, nm, k) in enumerate(zip(self.codes, self.names, self.categories)):
+            toks = _norm(f"{c} {nm} {k}").split()
+            tok_list.extend(toks)
+            doc_list.extend([i] * len(toks))
+        vocab, tid = np.unique(np.array(tok_list, dtype=str), return_inverse=True)
+        pair = np.unique(tid.astype(np.int64) * max(n, 1) + np.array(doc_list, dtype=np.int64))
+        self._vocab = vocab.tolist()
+        self._ptr = np.searchsorted(pair // max(n, 1), np.arange(len(vocab) + 1))
+        self._doc = pair % max(n, 1)
+        vocab = self._vocab
+        self._tok_grams = np.array([len(_trigrams(t)) for t in vocab])
+
+        post = {}
+        for tid, t in enumerate(vocab):
+            for g in _trigrams(t):
+                post.setdefault(g, []).append(tid)
+        self._post = {g: np.array(ids, dtype=np.int64) for g, ids in post.items()}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _range(self, keys, prefix):
+        return bisect_left(keys, prefix), bisect_left(keys, prefix + "\uffff")
+
+    def _docs_of(self, tids):
+        """Gabungan item dari beberapa token (tanpa loop Python per token)."""
+        lens = self._ptr[tids + 1] - self._ptr[tids]
+        starts = np.repeat(self._ptr[tids] - np.cumsum(lens) + lens, lens)
+        return self._doc[starts + np.arange(lens.sum())], lens
+
+    def _token_scores(self, qt):
+        """Skor per item untuk satu token query: 1.0 bila prefix sebuah token, else kemiripan trigram (fuzzy)."""
+        out = np.zeros(len(self.codes))
+        grams = _trigrams(qt)
+        ps = [self._post[g] for g in grams if g in self._post]
+        if ps:
+            counts = np.bincount(np.concatenate(ps), minlength=len(self._vocab))
+            ratio = counts / len(grams)
+            tids = np.flatnonzero(ratio >= MIN_TRIGRAM_RATIO)
+            if len(tids):
+                # substring (semua trigram query ada) > salah ketik (Dice, menghukum beda panjang)
+                dice = 2.0 * counts[tids] / (len(grams) + self._tok_grams[tids])
+                sc = np.where(ratio[tids] >= 1, 0.9, 0.8 * dice)
+                order = np.argsort(sc, kind="stable")          # skor tertinggi ditulis terakhir
+                docs, lens = self._docs_of(tids[order])
+                out[docs] = np.repeat(sc[order], lens)
+        lo, hi = self._range(self._vocab, qt)
+        if hi > lo:
+            out[self._doc[self._ptr[lo]:self._ptr[hi]]] = 1.0
+        return out
+
+    def search(self, query, limit=None, category=None):
+        """Kode item yang cocok dengan `query` (prefix token, substring, atau fuzzy trigram), urut skor."""
+        n = len(self.codes)
+        q = _norm(query)
+        if not q or n == 0:
+            return []
+        q_tokens = q.split()
+        score = np.zeros(n)
+        matched = np.ones(n, dtype=bool)
+        for qt in q_tokens:
+            s = self._token_scores(qt)
+            score += s
+            matched &= s > 0
+        score[matched] += 1.0                     # semua token query cocok
+        # prioritas kode: prefix kode utuh, lebih tinggi lagi bila sama persis
+        q_code = q.replace(" ", "")
+        lo, hi = self._range(self._code_sorted_keys, q_code)
+        if hi > lo:
+            ids = self._code_sorted[lo:hi]
+            score[ids] += 2.0
+            exact = ids[self._code_key[ids] == q_code]
+            score[exact] += 5.0
+
+        if category:
+            score[self._cat_arr != category] = 0
+        hits = np.flatnonzero(score > 0)
+        hits = hits[np.lexsort((self._name_rank[hits], -score[hits]))]
+        if limit:
+            hits = hits[:limit]
+        return [self.codes[i] for i in hits]
+
+
+def _fingerprint(inventory):
+    return hash(tuple((c, it.get("name"), it.get("category")) for c, it in inventory.items()))
+
+
+def get_index(brand, version, inventory: dict) -> SearchIndex:
+    """Indeks untuk inventory brand; dibangun ulang hanya bila kode/nama/kategori berubah."""
+    with _cache_lock:
+        cached = _cache.get(brand)
+    if cached is not None and version is not None and cached[0] == version:
+        return cached[2]
+    fp = _fingerprint(inventory)
+    if cached is not None and cached[1] == fp:
+        idx = cached[2]
+    else:
+        idx = SearchIndex(inventory)
+    with _cache_lock:
+        _cache[brand] = (version, fp, idx)
+    return idx
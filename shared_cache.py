@@ -0,0 +1,81 @@
+# shared_cache.py
+# LRU bersama (satu per proses, lintas session & thread) dengan batas total byte dan build single-flight: build
+# bersamaan untuk kunci yang sama menunggu satu build() lalu memakai hasilnya. Dasar artifact_cache (bytes unduhan)
+# dan frame_cache (DataFrame turunan); keduanya hanya menentukan kunci & cara menghitung ukuran entri.
+import threading
+import time
+from collections import OrderedDict
+
+
+class SharedLRU:
+    """Cache LRU dibatasi `max_bytes` (ukuran entri = size(value), dihitung sekali saat masuk)."""
+
+    def __init__(self, max_bytes, size):
+        self.max_bytes = max_bytes
+        self._size = size
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()    # key -> {"value", "bytes", "hits", "built_at", "build_ms"} (urut pemakaian terakhir)
+        self._building = {}            # key -> threading.Event (build yang sedang berjalan)
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "uncached": 0, "bytes": 0}
+
+    def _evict_unlocked(self):
+        while self._stats["bytes"] > self.max_bytes and self._cache:
+            _, old = self._cache.popitem(last=False)
+            self._stats["bytes"] -= old["bytes"]
+            self._stats["evictions"] += 1
+
+    def get_or_build(self, key, build):
+        """Nilai dari cache, atau build() sekali lalu disimpan. key None -> dibangun setiap kali tanpa disimpan."""
+        if key is None:
+            with self._lock:
+                self._stats["uncached"] += 1
+            return build()
+        while True:
+            with self._lock:
+                entry = self._cache.get(key)
+                if entry is not None:
+                    self._cache.move_to_end(key)
+                    entry["hits"] += 1
+                    self._stats["hits"] += 1
+                    return entry["value"]
+                pending = self._building.get(key)
+                if pending is None:
+                    self._building[key] = threading.Event()
+                    self._stats["misses"] += 1
+                    break
+            pending.wait()
+        try:
+            t0 = time.perf_counter()
+            value = build()
+            build_ms = (time.perf_counter() - t0) * 1000
+            size = self._size(value)
+        except BaseException:
+            with self._lock:
+                self._building.pop(key).set()
+            raise
+        # entri masuk dan penanda build dilepas dalam satu kunci: penunggu yang bangun selalu menemukan entrinya
+        with self._lock:
+            if key not in self._cache and size <= self.max_bytes:
+                self._cache[key] = {"value": value, "bytes": size, "hits": 0, "built_at": time.time(), "build_ms": build_ms}
+                self._stats["bytes"] += size
+                self._evict_unlocked()
+            self._building.pop(key).set()
+        return value
+
+    def invalidate(self, match=None):
+        """Buang entri yang kuncinya cocok match(key) (None = semua)."""
+        with self._lock:
+            for key in [k for k in self._cache if match is None or match(k)]:
+                self._stats["bytes"] -= self._cache.pop(key)["bytes"]
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._stats)
+            out["entries"] = len(self._cache)
+        out["limit_bytes"] = self.max_bytes
+        return out
+
+    def items(self):
+        """[(key, entry)] terbaru dipakai dulu."""
+        with self._lock:
+            return list(self._cache.items())[::-1]
@@ -0,0 +1,274 @@
+# sheets_io.py
+# Lapisan I/O Google Sheets yang sadar kuota, dipakai bersama oleh semua session/thread dalam satu proses:
+#   - budget lokal (token bucket) terpisah untuk read & write, di bawah batas per menit Google
+#   - retry dengan backoff eksponensial + jitter penuh untuk 429 (kuota) dan 5xx / gangguan jaringan
+#   - save per brand di-coalesce: snapshot terbaru dalam satu jendela singkat ditulis sekali oleh thread flusher
+#   - load per brand single-flight: load bersamaan menunggu dan memakai hasil fetch yang sama
+#   - metrik (panel Performa admin, metrics()/prometheus_text())
+#   - penyusunan range A1 (col_letter, a1_range)
+#
+# Worksheet/spreadsheet gspread dibungkus `Throttled` sehingga setiap panggilan API lewat budget & retry.
+import logging
+import os
+import random
+import threading
+import time
+
+log = logging.getLogger("gltkims.sheets")
+
+READS_PER_MIN = int(os.environ.get("SHEETS_READS_PER_MIN", "55"))     # batas default Google: 60/menit/user
+WRITES_PER_MIN = int(os.environ.get("SHEETS_WRITES_PER_MIN", "55"))
+MAX_RETRIES = int(os.environ.get("SHEETS_MAX_RETRIES", "6"))
+BACKOFF_BASE = 1.0          # detik
+BACKOFF_MAX = 64.0
+COALESCE_WINDOW = float(os.environ.get("SHEETS_COALESCE_MS", "300")) / 1000
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+_mlock = threading.Lock()
+_metrics = {
+    "read_calls": 0, "write_calls": 0, "retries": 0, "quota_errors": 0, "failures": 0,
+    "throttle_wait_s": 0.0, "backoff_s": 0.0,
+    "saves_submitted": 0, "flushes": 0, "loads": 0, "loads_shared": 0,
+    "last_error": None,
+}
+
+
+def _inc(key, n=1):
+    with _mlock:
+        _metrics[key] += n
+
+
+# ====== Budget (token bucket) ======
+class QuotaBudget:
+    """Token bucket `per_minute` panggilan; acquire() menunggu bila habis."""
+
+    def __init__(self, per_minute):
+        self.capacity = max(1, per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Ambil satu token; mengembalikan lama menunggu (detik)."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def drain(self):
+        """Setelah 429: anggap kuota menit ini habis agar thread lain ikut menahan diri."""
+        with self._lock:
+            self.tokens = min(self.tokens, 0.0)
+
+    def available(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return self.tokens
+
+
+_budgets = {"read": QuotaBudget(READS_PER_MIN), "write": QuotaBudget(WRITES_PER_MIN)}
+
+
+# ====== Panggilan dengan budget & retry ======
+def _status(e):
+    resp = getattr(e, "response", None)
+    code = getattr(resp, "status_code", None) or getattr(e, "code", None)
+    try:
+        return int(code)
+    except (TypeError, ValueError):
+        return None
+
+
+def _retryable(e):
+    return _status(e) in RETRYABLE_STATUS or isinstance(e, (ConnectionError, TimeoutError))
+
+
+def call(kind, fn, *args, **kwargs):
+    """Jalankan satu panggilan API ("read"/"write") lewat budget; retry 429/5xx dengan backoff + jitter."""
+    budget = _budgets[kind]
+    for attempt in range(MAX_RETRIES + 1):
+        waited = budget.acquire()
+        if waited:
+            _inc("throttle_wait_s", waited)
+        try:
+            result = fn(*args, **kwargs)
+            _inc(f"{kind}_calls")
+            return result
+        except Exception as e:
+            if not _retryable(e) or attempt == MAX_RETRIES:
+                _inc("failures")
+                with _mlock:
+                    _metrics["last_error"] = f"{type(e).__name__}: {e}"
+                raise
+            if _status(e) == 429:
+                _inc("quota_errors")
+                budget.drain()
+            delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+            _inc("retries")
+            _inc("backoff_s", delay)
+            log.warning("Sheets %s gagal (%s), coba lagi dalam %.1fs (percobaan %d/%d)",
+                        kind, _status(e) or type(e).__name__, delay, attempt + 1, MAX_RETRIES)
+            time.sleep(delay)
+
+
+class Throttled:
+    """Pembungkus objek gspread: method baca/tulis dijalankan lewat call(); atribut biasa diteruskan."""
+
+    READS = {"get", "get_values", "get_all_records", "get_all_values", "worksheets", "worksheet",
+             "col_values", "row_values", "values_get", "values_batch_get", "fetch_sheet_metadata"}
+
+    def __init__(self, obj):
+        self._obj = obj
+
+    def __getattr__(self, name):
+        attr = getattr(self._obj, name)
+        if not callable(attr):
+            return attr
+        kind = "read" if name in self.READS else "write"
+        return lambda *a, **k: call(kind, attr, *a, **k)
+
+
+# ====== Range A1 ======
+def col_letter(n):
+    """Nomor kolom (1-based) -> huruf kolom A1: 1 -> A, 27 -> AA."""
+    s = ""
+    while n:
+        n, r = divmod(n - 1, 26)
+        s = chr(65 + r) + s
+    return s
+
+
+def a1_range(title, row, width=None):
+    """Range A1 mulai kolom A baris `row` pada worksheet `title`; `width` kolom -> sampai kolom itu (semua baris)."""
+    rng = f"'{title}'!A{row}"
+    return f"{rng}:{col_letter(width)}" if width else rng
+
+
+_grid_rows = {}   # id worksheet -> jumlah baris grid yang diketahui
+
+
+def ensure_rows(sh, ws, needed):
+    """Perbesar grid worksheet bila `needed` baris melebihi ukurannya (values update tidak menambah baris sendiri)."""
+    have = _grid_rows.get(ws.id, ws.row_count)
+    if needed > have:
+        extra = max(needed - have, 1000)
+        sh.batch_update({"requests": [{"appendDimension": {"sheetId": ws.id, "dimension": "ROWS", "length": extra}}]})
+        have += extra
+    _grid_rows[ws.id] = have
+
+
+# ====== Single-flight load ======
+class _Ticket:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def resolve(self, result=None, error=None):
+        self.result, self.error = result, error
+        self.done.set()
+
+    def wait(self, timeout=None):
+        """Hasil flush/fetch; raise error aslinya. TimeoutError bila belum selesai dalam `timeout`."""
+        if not self.done.wait(timeout):
+            raise TimeoutError("Operasi Google Sheets masih berjalan.")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def single_flight(key, fn):
+    """Jalankan fn() sekali untuk semua pemanggil bersamaan dengan `key` yang sama."""
+    with _flights_lock:
+        ticket = _flights.get(key)
+        leader = ticket is None
+        if leader:
+            ticket = _flights[key] = _Ticket()
+    _inc("loads" if leader else "loads_shared")
+    if not leader:
+        return ticket.wait()
+    try:
+        ticket.resolve(result=fn())
+    except Exception as e:
+        ticket.resolve(error=e)
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+    return ticket.wait()
+
+
+# ====== Coalescing save ======
+_queues = {}      # key -> {"payload", "tickets", "flush", "thread"}
+_queues_lock = threading.Lock()
+
+
+def _flusher(key):
+    while True:
+        time.sleep(COALESCE_WINDOW)
+        with _queues_lock:
+            q = _queues[key]
+            payload, tickets, flush = q["payload"], q["tickets"], q["flush"]
+            q["payload"], q["tickets"] = None, []
+        try:
+            result, error = flush(payload), None
+        except Exception as e:
+            result, error = None, e
+            log.warning("Flush Sheets %s gagal: %s", key, e)
+        _inc("flushes")
+        for t in tickets:
+            t.resolve(result, error)
+        with _queues_lock:
+            if not q["tickets"]:
+                q["thread"] = None
+                return
+
+
+def submit(key, payload, flush):
+    """Antrikan snapshot terbaru untuk `key`; snapshot lama yang belum ditulis digantikan.
+
+    Semua pemanggil dalam satu jendela berbagi satu flush(payload). Mengembalikan ticket (wait() untuk hasil).
+    """
+    ticket = _Ticket()
+    _inc("saves_submitted")
+    with _queues_lock:
+        q = _queues.setdefault(key, {"payload": None, "tickets": [], "flush": flush, "thread": None})
+        q["payload"], q["flush"] = payload, flush
+        q["tickets"].append(ticket)
+        if q["thread"] is None:
+            q["thread"] = threading.Thread(target=_flusher, args=(key,), name=f"sheets-flush-{key}", daemon=True)
+            q["thread"].start()
+    return ticket
+
+
+# ====== Metrik ======
+def metrics():
+    with _mlock:
+        out = dict(_metrics)
+    out["coalesced_saves"] = max(0, out["saves_submitted"] - out["flushes"])
+    out["read_budget"] = round(_budgets["read"].available(), 1)
+    out["write_budget"] = round(_budgets["write"].available(), 1)
+    return out
+
+
+def prometheus_text():
+    lines = []
+    for k, v in metrics().items():
+        if isinstance(v, (int, float)):
+            lines.append(f"# TYPE gltkims_sheets_{k} {'gauge' if k.endswith('_budget') else 'counter'}")
+            lines.append(f"gltkims_sheets_{k} {v}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,186 @@
+# sheets_mirror.py
+# Mirror lokal worksheet Google Sheets per brand + cursor baris, supaya load tidak menarik seluruh spreadsheet:
+#   <SHEETS_MIRROR_DIR>/<brand>/<sheet>.jsonl       satu baris sheet (list nilai, urut header) per baris file
+#   <SHEETS_MIRROR_DIR>/<brand>/<sheet>.meta.json   {"header": [...], "rows": n}   n = cursor (baris data ter-mirror)
+#
+# Sheet append-only (history): hanya baris setelah cursor yang diambil, ditambah baris terakhir yang sudah
+# di-mirror sebagai jangkar; bila jangkar tidak cocok (sheet diubah/dikosongkan di luar aplikasi) -> sinkron penuh.
+# Tabel kecil yang bisa berubah di tengah (inventory, pending): dibaca ulang dengan satu ranged read sebatas kolom header.
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+import sheets_io
+
+try:
+    import fcntl
+    _FCNTL_OK = True
+except Exception:
+    _FCNTL_OK = False
+
+log = logging.getLogger(__name__)
+
+MIRROR_DIR = os.environ.get("SHEETS_MIRROR_DIR", "sheets_mirror")
+RENDER = "UNFORMATTED_VALUE"   # angka tetap angka (setara numericise get_all_records)
+
+_lock = threading.RLock()
+_cache = {}                    # meta path -> (sig, header, rows)
+stats = {}                     # (brand, sheet) -> {"mode": "append"|"full"|"table", "fetched": n}
+
+
+# ====== File mirror ======
+def _paths(brand, title):
+    base = os.path.join(MIRROR_DIR, brand)
+    return os.path.join(base, f"{title}.jsonl"), os.path.join(base, f"{title}.meta.json")
+
+
+@contextmanager
+def _mirror_lock(brand):
+    """Kunci tulis mirror satu brand (antar thread & antar proses)."""
+    with _lock:
+        os.makedirs(os.path.join(MIRROR_DIR, brand), exist_ok=True)
+        fh = open(os.path.join(MIRROR_DIR, brand, ".lock"), "w") if _FCNTL_OK else None
+        try:
+            if fh is not None:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+            yield
+        finally:
+            if fh is not None:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+                fh.close()
+
+
+def read(brand, title):
+    """(header, rows) dari mirror; ([], []) bila belum ada. Di-cache per (mtime, size) file meta."""
+    rows_path, meta_path = _paths(brand, title)
+    try:
+        st_ = os.stat(meta_path)
+    except OSError:
+        return [], []
+    sig = (st_.st_mtime_ns, st_.st_size)
+    with _lock:
+        cached = _cache.get(meta_path)
+        if cached is None or cached[0] != sig:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            rows = []
+            with open(rows_path, "r") as f:
+                for line in f:
+                    if len(rows) >= meta["rows"]:
+                        break            # sisa tulisan yang tidak sempat tercatat di meta
+                    rows.append(json.loads(line))
+            cached = _cache[meta_path] = (sig, meta["header"], rows)
+        return cached[1], cached[2]
+
+
+def cursor(brand, title):
+    return len(read(brand, title)[1])
+
+
+def _write_meta(meta_path, header, n):
+    tmp = f"{meta_path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"header": header, "rows": n}, f)
+    os.replace(tmp, meta_path)
+
+
+def replace(brand, title, header, rows):
+    rows_path, meta_path = _paths(brand, title)
+    with _mirror_lock(brand):
+        tmp = f"{rows_path}.tmp"
+        with open(tmp, "w") as f:
+            for r in rows:
+                f.write(json.dumps(r, default=str) + "\n")
+        os.replace(tmp, rows_path)
+        _write_meta(meta_path, header, len(rows))
+
+
+def append(brand, title, header, rows):
+    """Tambah baris di belakang mirror (header harus sama; bila beda, mirror diganti)."""
+    old_header, old_rows = read(brand, title)
+    if old_header != header:
+        return replace(brand, title, header, rows)
+    if not rows:
+        return
+    rows_path, meta_path = _paths(brand, title)
+    n = len(old_rows)
+    with _mirror_lock(brand):
+        with open(rows_path, "r+" if os.path.exists(rows_path) else "w") as f:
+            # buang ekor yang tidak tercatat di meta sebelum menambah
+            for _ in range(n):
+                f.readline()
+            f.truncate(f.tell())
+            for r in rows:
+                f.write(json.dumps(r, default=str) + "\n")
+        _write_meta(meta_path, header, n + len(rows))
+
+
+def invalidate(brand, title=None):
+    """Hapus mirror (satu sheet atau seluruh brand); load berikutnya sinkron penuh."""
+    base = os.path.join(MIRROR_DIR, brand)
+    if title:
+        titles = [title]
+    else:
+        titles = [fn[:-len(".meta.json")] for fn in os.listdir(base) if fn.endswith(".meta.json")] if os.path.isdir(base) else []
+    with _mirror_lock(brand):
+        for t in titles:
+            for p in _paths(brand, t):
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+
+
+# ====== Ranged read dari worksheet ======
+def _pad(rows, width):
+    return [(list(r) + [""] * width)[:width] for r in rows]
+
+
+def _fetch(ws, header, first_row):
+    """Baris data mulai `first_row` (1-based, termasuk header di baris 1) sampai akhir, sebatas kolom header."""
+    values = ws.get(f"A{first_row}:{sheets_io.col_letter(len(header))}", value_render_option=RENDER)
+    return _pad(values, len(header))
+
+
+def sync_table(brand, title, ws, header):
+    """Baca ulang tabel kecil (satu ranged read) dan perbarui mirror. Mengembalikan baris (list nilai)."""
+    rows = [r for r in _fetch(ws, header, 2) if any(v != "" for v in r)]
+    replace(brand, title, header, rows)
+    stats[(brand, title)] = {"mode": "table", "fetched": len(rows)}
+    return rows
+
+
+def sync_append_only(brand, title, ws, header):
+    """Ambil hanya baris baru setelah cursor (+1 baris jangkar); sinkron penuh bila jangkar tidak cocok."""
+    old_header, old_rows = read(brand, title)
+    n = len(old_rows) if old_header == header else 0
+    if n:
+        fetched = _fetch(ws, header, n + 1)      # baris n+1 = baris data ke-n (jangkar)
+        if fetched and fetched[0] == _pad([old_rows[-1]], len(header))[0]:
+            new = fetched[1:]
+            append(brand, title, header, new)
+            stats[(brand, title)] = {"mode": "append", "fetched": len(new)}
+            log.debug("mirror %s/%s: +%d baris", brand, title, len(new))
+            return read(brand, title)[1]
+        log.info("mirror %s/%s: jangkar tidak cocok, sinkron penuh", brand, title)
+    rows = _fetch(ws, header, 2)
+    replace(brand, title, header, rows)
+    stats[(brand, title)] = {"mode": "full", "fetched": len(rows)}
+    return read(brand, title)[1]
+
+
+def to_records(header, rows):
+    return [dict(zip(header, r)) for r in rows]
+
+
+def _cell(v):
+    if v is None or v != v:          # None / NaN
+        return ""
+    return v.item() if hasattr(v, "item") else v   # skalar numpy -> Python
+
+
+def to_row(record, header):
+    """Record -> list nilai seperti yang akan dibaca kembali dari sheet (None/NaN -> "")."""
+    return [_cell(record.get(h)) for h in header]
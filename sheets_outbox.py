@@ -0,0 +1,272 @@
+# sheets_outbox.py
+# Outbox tahan-crash untuk penulisan ke Google Sheets. save_data selalu menulis JSON lokal lebih dulu lalu
+# mencatat penanda di outbox; worker latar memutar ulang (replay) state lokal terbaru ke Sheets:
+#   <SHEETS_OUTBOX_DIR>/<brand>/<seq>.json     penanda perubahan yang belum sampai ke Sheets (urut seq)
+#   <SHEETS_OUTBOX_DIR>/<brand>/synced.json    sidik jari state Sheets terakhir yang diketahui/ditulis aplikasi
+#   <SHEETS_OUTBOX_DIR>/<brand>/conflict.json  ada bila Sheets berubah di luar aplikasi sejak sinkron terakhir
+#
+# - Selama outbox brand tidak kosong, load_data membaca JSON lokal (lebih baru dari Sheets).
+# - Replay menulis state lokal utuh, jadi beberapa penanda digabung; penanda <= seq terakhir saat replay dimulai di-ack.
+# - Sebelum menulis, sidik jari Sheets dibandingkan dengan synced.json; bila beda -> konflik, brand berhenti
+#   di-replay sampai admin memilih (timpa Sheets dengan lokal / pakai Sheets).
+# - Gagal (kuota, jaringan) -> coba lagi dengan backoff eksponensial + jitter; penanda tetap di disk.
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+    _FCNTL_OK = True
+except Exception:
+    _FCNTL_OK = False
+
+log = logging.getLogger("gltkims.outbox")
+
+OUTBOX_DIR = os.environ.get("SHEETS_OUTBOX_DIR", "sheets_outbox")
+OUTBOX_INTERVAL = float(os.environ.get("SHEETS_OUTBOX_INTERVAL", "2"))
+RETRY_BASE = 2.0
+RETRY_MAX = 300.0
+
+_lock = threading.Lock()
+_state = {}          # brand -> {"attempts", "next_try", "last_error", "last_synced"}
+_wake = threading.Event()
+
+
+class Conflict(Exception):
+    """Sheets berubah di luar aplikasi sejak sinkron terakhir."""
+
+    def __init__(self, remote_fp, message):
+        super().__init__(message)
+        self.remote_fp = remote_fp
+
+
+# ====== File outbox ======
+def _dir(brand):
+    return os.path.join(OUTBOX_DIR, brand)
+
+
+def _write_json(path, obj):
+    """Tulis atomik + fsync agar penanda tidak hilang saat proses/mesin mati."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def enqueue(brand, reason="save"):
+    """Catat bahwa state lokal brand belum sampai ke Sheets. Mengembalikan seq."""
+    seq = f"{time.time_ns():020d}-{os.getpid()}-{threading.get_ident() % 100000:05d}"
+    _write_json(os.path.join(_dir(brand), f"{seq}.json"), {"seq": seq, "brand": brand, "reason": reason,
+                                                           "created": time.strftime("%Y-%m-%d %H:%M:%S")})
+    _wake.set()
+    return seq
+
+
+def pending(brand):
+    """Seq penanda yang belum di-ack, urut lama -> baru."""
+    try:
+        names = os.listdir(_dir(brand))
+    except OSError:
+        return []
+    return sorted(n[:-5] for n in names if n.endswith(".json") and n[0].isdigit())
+
+
+def has_pending(brand):
+    return bool(pending(brand))
+
+
+def ack(brand, upto):
+    """Hapus penanda sampai dan termasuk `upto` (state lokal per saat itu sudah di Sheets)."""
+    for seq in pending(brand):
+        if seq > upto:
+            break
+        try:
+            os.remove(os.path.join(_dir(brand), f"{seq}.json"))
+        except OSError:
+            pass
+
+
+def synced_fingerprint(brand):
+    rec = _read_json(os.path.join(_dir(brand), "synced.json"))
+    return rec.get("fingerprint") if rec else None
+
+
+def accepted_fingerprints(brand):
+    """Sidik jari Sheets yang tidak dianggap konflik: sinkron terakhir + tulisan yang sedang/terputus berjalan."""
+    rec = _read_json(os.path.join(_dir(brand), "synced.json")) or {}
+    return {fp for fp in (rec.get("fingerprint"), rec.get("writing")) if fp}
+
+
+def set_synced(brand, fp):
+    rec = _read_json(os.path.join(_dir(brand), "synced.json")) or {}
+    if fp != rec.get("fingerprint") or rec.get("writing"):
+        _write_json(os.path.join(_dir(brand), "synced.json"), {"fingerprint": fp, "at": time.strftime("%Y-%m-%d %H:%M:%S")})
+
+
+def begin_write(brand, expected_fp):
+    """Catat sidik jari hasil tulisan sebelum menulis; tulisan yang terputus tidak dianggap konflik saat replay ulang."""
+    rec = _read_json(os.path.join(_dir(brand), "synced.json")) or {}
+    rec["writing"] = expected_fp
+    _write_json(os.path.join(_dir(brand), "synced.json"), rec)
+
+
+def conflict(brand):
+    return _read_json(os.path.join(_dir(brand), "conflict.json"))
+
+
+def _set_conflict(brand, err):
+    _write_json(os.path.join(_dir(brand), "conflict.json"), {
+        "remote_fingerprint": err.remote_fp, "message": str(err), "pending": len(pending(brand)),
+        "at": time.strftime("%Y-%m-%d %H:%M:%S")})
+
+
+def resolve(brand, keep_local=True):
+    """Selesaikan konflik. keep_local=True: timpa Sheets dengan state lokal pada replay berikutnya;
+    False: buang penanda lokal, load berikutnya membaca Sheets."""
+    info = conflict(brand)
+    if info is None:
+        return False
+    set_synced(brand, info["remote_fingerprint"])
+    if not keep_local:
+        ack(brand, "~")
+    try:
+        os.remove(os.path.join(_dir(brand), "conflict.json"))
+    except OSError:
+        pass
+    with _lock:
+        _state.pop(brand, None)
+    _wake.set()
+    return True
+
+
+@contextmanager
+def _drain_lock(brand):
+    """Kunci replay per brand antar proses (non-blocking). Yield True bila didapat."""
+    os.makedirs(_dir(brand), exist_ok=True)
+    fh = open(os.path.join(_dir(brand), ".lock"), "w") if _FCNTL_OK else None
+    try:
+        if fh is not None:
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                yield False
+                return
+        yield True
+    finally:
+        if fh is not None:
+            fh.close()
+
+
+# ====== Sidik jari state Sheets ======
+def _norm(v):
+    if isinstance(v, float) and v.is_integer():
+        v = int(v)
+    return "" if v is None else str(v)
+
+
+def fingerprint(inv_rows, pending_rows, history_len, history_last=None):
+    """Hash inventory + pending + jumlah & baris terakhir history (history append-only)."""
+    h = hashlib.sha1()
+    for rows in (inv_rows, pending_rows, [history_last] if history_last else []):
+        h.update(json.dumps([[_norm(v) for v in r] for r in rows]).encode("utf-8"))
+    h.update(str(history_len).encode("utf-8"))
+    return h.hexdigest()
+
+
+# ====== Replay ======
+def drain(brand, replay):
+    """Satu percobaan replay brand. True bila outbox brand kosong sesudahnya."""
+    seqs = pending(brand)
+    if not seqs:
+        return True
+    if conflict(brand) is not None:
+        return False
+    with _drain_lock(brand) as got:
+        if not got:
+            return False
+        upto = seqs[-1]
+        try:
+            replay(brand)
+        except Conflict as e:
+            log.error("Konflik Sheets %s: %s", brand, e)
+            _set_conflict(brand, e)
+            return False
+        except Exception as e:
+            with _lock:
+                st_ = _state.setdefault(brand, {"attempts": 0})
+                st_["attempts"] += 1
+                delay = random.uniform(0, min(RETRY_MAX, RETRY_BASE * 2 ** st_["attempts"]))
+                st_["next_try"] = time.time() + delay
+                st_["last_error"] = f"{type(e).__name__}: {e}"
+            log.warning("Replay outbox %s gagal (%s); coba lagi dalam %.0fs", brand, e, delay)
+            return False
+        ack(brand, upto)
+        with _lock:
+            _state[brand] = {"attempts": 0, "last_synced": time.strftime("%Y-%m-%d %H:%M:%S")}
+    return not pending(brand)
+
+
+def status(brand):
+    with _lock:
+        st_ = dict(_state.get(brand, {}))
+    return {"pending": len(pending(brand)), "conflict": conflict(brand), "attempts": st_.get("attempts", 0),
+            "next_try": st_.get("next_try"), "last_error": st_.get("last_error"), "last_synced": st_.get("last_synced")}
+
+
+class OutboxWorker(threading.Thread):
+    """Thread latar yang mengosongkan outbox semua brand (urut seq, satu replay per brand sekaligus)."""
+
+    def __init__(self, brands, replay, interval=OUTBOX_INTERVAL):
+        super().__init__(name="sheets-outbox", daemon=True)
+        self.brands = list(brands)
+        self.replay = replay
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            _wake.clear()
+            for brand in self.brands:
+                with _lock:
+                    next_try = _state.get(brand, {}).get("next_try") or 0
+                if time.time() < next_try:
+                    continue
+                try:
+                    drain(brand, self.replay)
+                except Exception:
+                    log.exception("Outbox %s gagal", brand)
+            _wake.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        _wake.set()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def start_worker(brands, replay, interval=OUTBOX_INTERVAL):
+    """Start worker sekali per proses (aman dipanggil berulang)."""
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = OutboxWorker(brands, replay, interval)
+            _worker.start()
+        return _worker
@@ -0,0 +1,241 @@
+# stock_card.py
+# Laporan stock card semua barang sekaligus untuk periode tertentu (audit akhir bulan).
+# Mutasi (ADD_ITEM + APPROVE_IN/OUT/RETURN + ADJUST_STOCK) diambil dari history kolumnar, saldo awal = jumlah mutasi sebelum periode
+# per barang (groupby sum), saldo berjalan = saldo awal + cumsum per barang (groupby cumsum) -> tanpa loop per baris.
+# Workbook ditulis streaming (xlsxwriter constant_memory): baris langsung ke file, memori tetap kecil untuk ribuan SKU.
+#
+#   python stock_card.py gulavit --start 2026-09-01 --end 2026-09-30 -o stock_card_sep.xlsx [--per-sku]
+#
+#   import stock_card
+#   long, summary = stock_card.build_report(data, "2026-09-01", "2026-09-30")
+#   stock_card.write_workbook(long, summary, "out.xlsx")          # atau BytesIO
+import argparse
+import re
+import sys
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+import history_store
+
+ADJUST_ACTION = "ADJUST_STOCK"   # koreksi rekonsiliasi (reconcile.py); qty bertanda
+MOVE_ACTIONS = ["ADD_ITEM", "APPROVE_IN", "APPROVE_OUT", "APPROVE_RETURN", ADJUST_ACTION]
+LONG_COLS = ["Kode", "Nama Barang", "Tanggal", "Keterangan", "Masuk (IN)", "Keluar (OUT)", "Saldo Akhir"]
+SUMMARY_COLS = ["Kode", "Nama Barang", "Satuan", "Saldo Awal", "Total Masuk", "Total Keluar", "Saldo Akhir", "Jumlah Mutasi"]
+OPENING_LABEL = "Saldo Awal"
+
+
+# ====== Mutasi ======
+def _describe(df, act, is_out, is_adj):
+    def txt(col):
+        return df[col].astype(object).fillna("-").astype(str)
+
+    user, event, do_number, trans = txt("user"), txt("event"), txt("do_number"), txt("trans_type")
+    ket_in = "Request IN by " + user + np.where(do_number != "-", " (No. DO: " + do_number + ")", "")
+    return np.select(
+        [act == "ADD_ITEM", act == "APPROVE_IN", is_out, act == "APPROVE_RETURN", is_adj],
+        ["Initial Stock", ket_in,
+         "Request OUT (" + trans + ") by " + user + " for event: " + event,
+         "Retur by " + user + " for event: " + event,
+         "Koreksi rekonsiliasi by " + user + ": " + event],
+        default="N/A")
+
+
+def movements(data: dict, describe=True) -> pd.DataFrame:
+    """Mutasi stok dari history: Kode, Nama Barang, ts, Tanggal, Keterangan, in, out, delta, stock (tercatat),
+    pos (posisi di history). Urut per Kode lalu waktu (stabil).
+
+    Baris tanpa kode valid (ADD_ITEM lama) dipetakan lewat nama di master; yang tak terpetakan memakai Kode "-".
+    describe=False melewati penyusunan Keterangan (kolom kosong) bila hanya angka yang dibutuhkan.
+    """
+    cols = ["action", "item", "qty", "stock", "user", "event", "do_number", "trans_type", "code", "date", "timestamp"]
+    df = history_store.history_frame(data.get("history", []), cols)
+    if df.empty or "action" not in df.columns:
+        return pd.DataFrame(columns=["Kode", "Nama Barang", "ts", "Tanggal", "Keterangan", "in", "out", "delta", "stock", "pos"])
+    df = df.reindex(columns=cols)
+    act = df["action"].astype(str)
+    df = df[act.isin(MOVE_ACTIONS).to_numpy()]
+    pos = df.index.to_numpy()
+    df = df.reset_index(drop=True)
+    act = df["action"].astype(str).to_numpy()
+
+    inventory = data.get("inventory", {})
+    name_to_code = {}
+    for code, it in inventory.items():
+        name_to_code.setdefault(it.get("name"), code)
+    item = df["item"].astype(object).fillna("-").astype(str)
+    code = df["code"].astype(object).where(df["code"].astype(object).isin(list(inventory)), None)
+    code = code.fillna(item.map(name_to_code)).fillna("-").astype(str)
+
+    qty = pd.to_numeric(df["qty"], errors="coerce").fillna(0).astype(np.int64).to_numpy()
+    is_out = act == "APPROVE_OUT"
+    is_adj = act == ADJUST_ACTION
+    ts = pd.to_datetime(df["timestamp"], errors="coerce")
+    s_date = pd.to_datetime(df["date"], errors="coerce")
+    tanggal = s_date.fillna(ts.dt.floor("D"))
+
+    ket = _describe(df, act, is_out, is_adj) if describe else ""
+
+    out = pd.DataFrame({
+        "Kode": code.to_numpy(), "Nama Barang": item.to_numpy(), "ts": ts.fillna(tanggal).to_numpy(),
+        "Tanggal": tanggal.to_numpy(), "Keterangan": ket,
+        "in": np.where(is_out, 0, np.clip(qty, 0, None)), "out": np.where(is_out, qty, np.clip(-qty, 0, None)),
+        "stock": pd.to_numeric(df["stock"], errors="coerce").to_numpy(), "pos": pos,
+    })
+    out["delta"] = out["in"] - out["out"]
+    return out.sort_values(["Kode", "ts"], kind="stable").reset_index(drop=True)
+
+
+def item_card(mv: pd.DataFrame, code) -> pd.DataFrame:
+    """Stock card satu barang sepanjang waktu dari hasil movements(): Tanggal, Keterangan, masuk/keluar, saldo berjalan.
+
+    Koreksi ADJUST_STOCK ikut sebagai baris masuk/keluar sehingga saldo akhir sama dengan laporan semua barang.
+    """
+    card = mv[mv["Kode"] == code]
+    return pd.DataFrame({
+        "Tanggal": pd.to_datetime(card["Tanggal"]).dt.strftime("%Y-%m-%d").to_numpy(),
+        "Keterangan": card["Keterangan"].to_numpy(),
+        "Masuk (IN)": card["in"].astype(object).where(card["in"] > 0, "-").to_numpy(),
+        "Keluar (OUT)": card["out"].astype(object).where(card["out"] > 0, "-").to_numpy(),
+        "Saldo Akhir": card["delta"].cumsum().to_numpy(np.int64),
+    })
+
+
+# ====== Laporan periode ======
+def build_report(data: dict, start, end):
+    """(long, summary) untuk periode [start, end] inklusif.
+
+    long: satu baris saldo awal per barang lalu mutasi periode dengan Saldo Akhir berjalan (kolom LONG_COLS).
+    summary: satu baris per barang di master (+ kode history yang tak lagi di master) (kolom SUMMARY_COLS).
+    """
+    start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+    mv = movements(data)
+    before = mv[mv["Tanggal"] < start]
+    period = mv[(mv["Tanggal"] >= start) & (mv["Tanggal"] <= end)].copy()
+
+    opening = before.groupby("Kode", sort=False)["delta"].sum()
+    period["Saldo Akhir"] = (period["Kode"].map(opening).fillna(0).astype(np.int64)
+                             + period.groupby("Kode", sort=False)["delta"].cumsum())
+
+    inventory = data.get("inventory", {})
+    names = pd.concat([mv.groupby("Kode", sort=False)["Nama Barang"].last(),
+                       pd.Series({c: it.get("name", "") for c, it in inventory.items()}, dtype=object)])
+    names = names[~names.index.duplicated(keep="last")]
+    codes = sorted(set(inventory) | set(opening.index) | set(period["Kode"]))
+    idx = pd.Index(codes, name="Kode")
+    agg = period.groupby("Kode", sort=False).agg(masuk=("in", "sum"), keluar=("out", "sum"), n=("delta", "size"))
+    agg = agg.reindex(idx, fill_value=0)
+    saldo_awal = opening.reindex(idx, fill_value=0).astype(np.int64)
+    summary = pd.DataFrame({
+        "Kode": codes,
+        "Nama Barang": names.reindex(idx).fillna("").to_numpy(),
+        "Satuan": [inventory.get(c, {}).get("unit", "-") for c in codes],
+        "Saldo Awal": saldo_awal.to_numpy(),
+        "Total Masuk": agg["masuk"].to_numpy(np.int64),
+        "Total Keluar": agg["keluar"].to_numpy(np.int64),
+        "Saldo Akhir": (saldo_awal + agg["masuk"] - agg["keluar"]).to_numpy(np.int64),
+        "Jumlah Mutasi": agg["n"].to_numpy(np.int64),
+    })
+
+    open_rows = pd.DataFrame({
+        "Kode": codes, "Nama Barang": summary["Nama Barang"].to_numpy(), "ts": pd.NaT, "Tanggal": start,
+        "Keterangan": OPENING_LABEL, "Masuk (IN)": 0, "Keluar (OUT)": 0, "Saldo Akhir": saldo_awal.to_numpy(),
+        "_o": 0,
+    })
+    period = period.rename(columns={"in": "Masuk (IN)", "out": "Keluar (OUT)"}).assign(_o=1)
+    long = pd.concat([open_rows, period[open_rows.columns]], ignore_index=True)
+    long = long.sort_values(["Kode", "_o", "ts"], kind="stable")[LONG_COLS].reset_index(drop=True)
+    long["Tanggal"] = pd.to_datetime(long["Tanggal"]).dt.strftime("%Y-%m-%d")
+    return long, summary
+
+
+# ====== Workbook streaming ======
+def _sheet_name(code, used):
+    base = re.sub(r"[\[\]:*?/\\]", "_", str(code))[:31] or "_"
+    name, n = base, 1
+    while name.lower() in used:
+        n += 1
+        suffix = f"~{n}"
+        name = base[:31 - len(suffix)] + suffix
+    used.add(name.lower())
+    return name
+
+
+def _write_table(ws, df, header_fmt, start_row=0):
+    """Tulis header + baris per baris (constant_memory: baris harus urut, sekali tulis)."""
+    ws.write_row(start_row, 0, list(df.columns), header_fmt)
+    # writer per kolom dipilih sekali dari dtype (lebih cepat dari dispatch write() per sel)
+    writers = [ws.write_number if pd.api.types.is_numeric_dtype(df[c]) else ws.write_string for c in df.columns]
+    columns = [df[c].tolist() if pd.api.types.is_numeric_dtype(df[c]) else df[c].astype(str).tolist() for c in df.columns]
+    for r, row in enumerate(zip(*columns), start=start_row + 1):
+        for c, (write, v) in enumerate(zip(writers, row)):
+            write(r, c, v)
+    ws.freeze_panes(start_row + 1, 0)
+
+
+def write_workbook(long: pd.DataFrame, summary: pd.DataFrame, target, per_sku=False, title=None):
+    """Tulis laporan ke path atau file-like. per_sku=False: sheet "Stock Card" (long) + "Ringkasan";
+    per_sku=True: "Ringkasan" + satu sheet per barang."""
+    wb = xlsxwriter.Workbook(target, {"constant_memory": True, "strings_to_numbers": False,
+                                      "strings_to_formulas": False})
+    header = wb.add_format({"bold": True, "bg_color": "#E2E8F0"})
+    bold = wb.add_format({"bold": True})
+
+    ws = wb.add_worksheet("Ringkasan")
+    row0 = 0
+    if title:
+        ws.write(0, 0, title, bold)
+        row0 = 2
+    ws.set_column(0, 0, 16); ws.set_column(1, 1, 32); ws.set_column(2, 7, 13)
+    _write_table(ws, summary, header, row0)
+
+    if not per_sku:
+        ws = wb.add_worksheet("Stock Card")
+        ws.set_column(0, 0, 16); ws.set_column(1, 1, 32); ws.set_column(2, 2, 12); ws.set_column(3, 3, 60); ws.set_column(4, 6, 13)
+        _write_table(ws, long, header)
+    else:
+        used = {"ringkasan"}
+        cols = LONG_COLS[2:]
+        codes = long["Kode"].to_numpy()
+        bounds = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1], True])
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            part = long.iloc[a:b]
+            ws = wb.add_worksheet(_sheet_name(codes[a], used))
+            ws.write(0, 0, f"{codes[a]} — {part['Nama Barang'].iat[0]}", bold)
+            ws.set_column(0, 0, 12); ws.set_column(1, 1, 60); ws.set_column(2, 4, 13)
+            _write_table(ws, part[cols], header, 2)
+    wb.close()
+    return target
+
+
+def report_bytes(data: dict, start, end, per_sku=False, brand_label="") -> bytes:
+    long, summary = build_report(data, start, end)
+    title = f"Stock Card {brand_label} {pd.Timestamp(start):%Y-%m-%d} s/d {pd.Timestamp(end):%Y-%m-%d}".replace("  ", " ")
+    buf = BytesIO()
+    write_workbook(long, summary, buf, per_sku=per_sku, title=title)
+    return buf.getvalue()
+
+
+def main(argv=None):
+    import inventory_core as core
+
+    parser = argparse.ArgumentParser(description="Laporan stock card semua barang GLTKIMS (Excel)")
+    parser.add_argument("brand", choices=list(core.DATA_FILES))
+    parser.add_argument("--start", required=True, help="YYYY-MM-DD")
+    parser.add_argument("--end", required=True, help="YYYY-MM-DD")
+    parser.add_argument("-o", "--output", help="default stock_card_<brand>_<start>_<end>.xlsx")
+    parser.add_argument("--per-sku", action="store_true", help="satu sheet per barang (default: satu sheet long)")
+    args = parser.parse_args(argv)
+
+    data = core.load_data(args.brand)
+    long, summary = build_report(data, args.start, args.end)
+    path = args.output or f"stock_card_{args.brand}_{args.start}_{args.end}.xlsx"
+    write_workbook(long, summary, path, per_sku=args.per_sku,
+                   title=f"Stock Card {args.brand.capitalize()} {args.start} s/d {args.end}")
+    sys.stderr.write(f"{len(summary)} barang, {int(summary['Jumlah Mutasi'].sum())} mutasi -> {path}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# Pindah format history (HISTORY_FORMAT) bolak-balik json <-> arrow tanpa kehilangan baris.
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import history_store
+import inventory_core as core
+
+BRAND = "gulavit"
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)          # DATA_FILES, store history & shard relatif ke direktori kerja
+    monkeypatch.setattr(core, "USE_SHEETS", False)
+    return tmp_path
+
+
+def _use(monkeypatch, fmt):
+    monkeypatch.setattr(history_store, "HISTORY_FORMAT", fmt)
+
+
+def _append(item):
+    core.mutate(BRAND, lambda d: d["history"].append(
+        {"action": "ADD_ITEM", "item": item, "qty": 1, "stock": 1, "user": "t", "timestamp": core.timestamp()}))
+
+
+def _items():
+    return [h["item"] for h in core.load_data(BRAND)["history"]]
+
+
+def test_arrow_json_arrow_keeps_all_rows(workdir, monkeypatch):
+    _use(monkeypatch, "arrow")
+    _append("A")
+    _use(monkeypatch, "json")
+    assert _items() == ["A"]
+    _append("B")
+    _append("C")
+    _use(monkeypatch, "arrow")
+    assert _items() == ["A", "B", "C"]      # JSON (B, C) lebih baru dari store Arrow lama
+    _append("D")
+    assert _items() == ["A", "B", "C", "D"]
+    assert history_store.history_len(core.history_path(BRAND)) == 4
+
+
+def test_migration_runs_once_per_json_file(workdir, monkeypatch):
+    _use(monkeypatch, "json")
+    _append("A")
+    _use(monkeypatch, "arrow")
+    hpath = core.history_path(BRAND)
+    assert _items() == ["A"]
+    manifest = history_store._read_manifest(hpath)
+    assert _items() == ["A"]                 # load kedua tanpa save: store tidak ditulis ulang
+    assert history_store._read_manifest(hpath)["segments"] == manifest["segments"]
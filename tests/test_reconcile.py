@@ -0,0 +1,84 @@
+# reconcile: deteksi drift inventory vs history dan perbaikan dua mode.
+import pytest
+
+import reconcile
+import stock_card
+
+
+def _row(action, code, item, qty, stock, ts):
+    return {"action": action, "code": code, "item": item, "qty": qty, "stock": stock, "unit": "pcs", "user": "t",
+            "event": "-", "timestamp": f"2026-09-0{ts} 10:00:00"}
+
+
+@pytest.fixture
+def data():
+    return {
+        "inventory": {
+            "A-1": {"name": "Kaos", "qty": 20, "unit": "pcs"},      # replay 15, stock tercatat melompat ke 20
+            "B-1": {"name": "Topi", "qty": 4, "unit": "pcs"},       # tanpa history
+            "C-1": {"name": "Tas", "qty": 3, "unit": "pcs"},        # sinkron
+        },
+        "pending_requests": [],
+        "history": [
+            _row("ADD_ITEM", "A-1", "Kaos", 10, 10, 1),
+            _row("APPROVE_IN", "A-1", "Kaos", 5, 20, 2),          # seharusnya stock 15 -> lompatan
+            _row("ADD_ITEM", "C-1", "Tas", 5, 5, 1),
+            _row("APPROVE_OUT", "C-1", "Tas", 2, 3, 3),
+        ],
+    }
+
+
+def _by_code(report):
+    return report.set_index("Kode")
+
+
+def test_drift_report_flags_jump_and_missing_history(data):
+    report = _by_code(reconcile.drift_report(data))
+
+    a = report.loc["A-1"]
+    assert a["Status"] == reconcile.STATUS_DRIFT
+    assert (a["Qty Inventory"], a["Qty Replay"], a["Selisih"]) == (20, 15, 5)
+    assert a["Selisih Tercatat"] == 0
+    assert a["Lompatan"] == 1 and a["Seq Lompatan Pertama"] == 2
+
+    b = report.loc["B-1"]
+    assert b["Status"] == reconcile.STATUS_NO_HISTORY
+    assert b["Qty Replay"] == 0
+
+    assert report.loc["C-1", "Status"] == reconcile.STATUS_OK
+    assert reconcile.summarize(reconcile.drift_report(data))["abs_selisih"] == 5 + 4
+
+
+def test_repair_history_mode_leaves_clean_report(data):
+    changes = reconcile.repair(data, "history", user="audit")
+
+    assert {c["code"]: c["diff"] for c in changes} == {"A-1": 5, "B-1": 4}
+    assert data["inventory"]["A-1"]["qty"] == 20                     # inventory tidak disentuh
+    adjust = [h for h in data["history"] if h["action"] == stock_card.ADJUST_ACTION]
+    assert [(h["code"], h["qty"], h["stock"]) for h in adjust] == [("A-1", 5, 20), ("B-1", 4, 4)]
+    assert (reconcile.drift_report(data)["Status"] == reconcile.STATUS_OK).all()
+    assert reconcile.repair(data, "history") == []                   # idempoten
+
+
+def test_repair_inventory_mode_leaves_clean_report_except_no_history(data):
+    changes = reconcile.repair(data, "inventory", user="audit")
+
+    assert [(c["code"], c["before"], c["after"]) for c in changes] == [("A-1", 20, 15)]
+    assert data["inventory"]["A-1"]["qty"] == 15
+    report = _by_code(reconcile.drift_report(data))
+    assert report.loc["A-1", "Status"] == reconcile.STATUS_OK
+    assert report.loc["A-1", "Selisih Tercatat"] == 0
+    # barang tanpa history tidak dikosongkan oleh mode inventory
+    assert report.loc["B-1", "Status"] == reconcile.STATUS_NO_HISTORY
+    assert data["inventory"]["B-1"]["qty"] == 4
+
+
+def test_item_card_includes_adjustments(data):
+    reconcile.repair(data, "history")
+    card = stock_card.item_card(stock_card.movements(data), "A-1")
+    assert card["Saldo Akhir"].iloc[-1] == data["inventory"]["A-1"]["qty"]
+
+
+def test_repair_rejects_unknown_mode(data):
+    with pytest.raises(ValueError):
+        reconcile.repair(data, "everything")
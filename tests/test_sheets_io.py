@@ -0,0 +1,134 @@
+# Uji sheets_io dengan klien worksheet palsu (tanpa jaringan): retry 429, batas token bucket, coalescing save.
+import threading
+import types
+
+import pytest
+
+import sheets_io
+
+
+class FakeClock:
+    """Pengganti modul `time` untuk sheets_io: sleep() memajukan jam, tidak benar-benar menunggu."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class QuotaError(Exception):
+    """Bentuk error gspread: status HTTP di e.response.status_code."""
+
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.response = types.SimpleNamespace(status_code=status)
+
+
+class FakeSpreadsheet:
+    """Spreadsheet palsu: mencatat setiap panggilan API beserta waktu jam palsu; bisa gagal 429 sekian kali."""
+
+    def __init__(self, clock=None, fail_429=0):
+        self.clock = clock
+        self.fail_429 = fail_429
+        self.calls = []
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def _hit(self, name):
+        with self._lock:
+            self.calls.append((name, self.clock.now if self.clock else None))
+            if self.fail_429:
+                self.fail_429 -= 1
+                raise QuotaError(429)
+
+    def get(self, rng):
+        self._hit("get")
+        return [[self.values.get(rng, "")]]
+
+    def values_batch_update(self, body):
+        self._hit("values_batch_update")
+        for d in body["data"]:
+            self.values[d["range"]] = d["values"]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(sheets_io, "time", clock)
+    return clock
+
+
+def _budgets(monkeypatch, reads=60, writes=60):
+    monkeypatch.setattr(sheets_io, "_budgets", {"read": sheets_io.QuotaBudget(reads), "write": sheets_io.QuotaBudget(writes)})
+
+
+def test_429_backoff_then_retry(clock, monkeypatch):
+    _budgets(monkeypatch)
+    monkeypatch.setattr(sheets_io.random, "uniform", lambda lo, hi: hi)   # jitter penuh -> batas atas
+    before = sheets_io.metrics()
+    sh = sheets_io.Throttled(FakeSpreadsheet(clock, fail_429=2))
+
+    sh.values_batch_update({"data": [{"range": "A1", "values": [["x"]]}]})
+
+    after = sheets_io.metrics()
+    assert [name for name, _ in sh._obj.calls] == ["values_batch_update"] * 3
+    assert sh._obj.values["A1"] == [["x"]]
+    assert after["quota_errors"] - before["quota_errors"] == 2
+    assert after["retries"] - before["retries"] == 2
+    # backoff eksponensial 1s lalu 2s; setelah 429 budget dikuras sehingga percobaan berikutnya ikut menunggu token
+    assert sheets_io.BACKOFF_BASE in clock.sleeps and sheets_io.BACKOFF_BASE * 2 in clock.sleeps
+    assert clock.now - 1000.0 >= sheets_io.BACKOFF_BASE * 3
+
+
+def test_429_gives_up_after_max_retries(clock, monkeypatch):
+    _budgets(monkeypatch)
+    monkeypatch.setattr(sheets_io, "MAX_RETRIES", 2)
+    sh = sheets_io.Throttled(FakeSpreadsheet(clock, fail_429=10))
+
+    with pytest.raises(QuotaError):
+        sh.get("A1")
+    assert len(sh._obj.calls) == 3
+
+
+def test_token_bucket_caps_calls_per_minute(clock, monkeypatch):
+    per_minute = 10
+    _budgets(monkeypatch, reads=per_minute)
+    sh = sheets_io.Throttled(FakeSpreadsheet(clock))
+
+    for _ in range(35):
+        sh.get("A1")
+
+    times = [t for _, t in sh._obj.calls]
+    # tidak ada jendela 60 detik yang memuat lebih dari burst awal + isi ulang satu menit
+    for i, start in enumerate(times):
+        in_window = sum(1 for t in times[i:] if t < start + 60)
+        assert in_window <= 2 * per_minute
+    # setelah burst awal habis, laju tetap = per_minute / 60 detik
+    steady = times[per_minute:]
+    gaps = [b - a for a, b in zip(steady, steady[1:])]
+    assert gaps and all(g == pytest.approx(60 / per_minute) for g in gaps)
+    assert times[-1] - times[0] >= (len(times) - per_minute) * 60 / per_minute - 1e-6
+
+
+def test_queued_writes_coalesce_into_one_batch_update(monkeypatch):
+    _budgets(monkeypatch)
+    monkeypatch.setattr(sheets_io, "COALESCE_WINDOW", 0.2)
+    fake = FakeSpreadsheet()
+    sh = sheets_io.Throttled(fake)
+
+    def flush(payload):
+        sh.values_batch_update({"data": [{"range": "inventory!A2", "values": payload}]})
+        return len(payload)
+
+    tickets = [sheets_io.submit("test-coalesce", [[f"snapshot {i}"]], flush) for i in range(20)]
+    results = [t.wait(timeout=5) for t in tickets]
+
+    assert [name for name, _ in fake.calls] == ["values_batch_update"]
+    assert fake.values["inventory!A2"] == [["snapshot 19"]]   # snapshot terbaru yang ditulis
+    assert results == [1] * 20
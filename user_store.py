@@ -0,0 +1,212 @@
+# user_store.py
+# Penyimpanan user bersama untuk semua brand (terpisah dari data inventory):
+#   {"users": {username: {"password_hash": "pbkdf2_sha256$<iterasi>$<salt hex>$<hash hex>",
+#                         "role": "admin" | "user", "brands": ["gulavit", ...] | ["*"]}}}
+# Dibaca sekali dan di-cache per (mtime, size) file, jadi login = lookup dict + verifikasi hash.
+# Verifikasi yang berhasil di-cache per proses (API memakai Basic auth di setiap request).
+#
+#   python user_store.py list
+#   python user_store.py set <username> [--role admin] [--brands gulavit,takokak]   (password ditanya)
+#   python user_store.py delete <username>
+import argparse
+import getpass
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+    _FCNTL_OK = True
+except Exception:
+    _FCNTL_OK = False
+
+USERS_FILE = os.environ.get("USERS_FILE", "users.json")
+PBKDF2_ITERATIONS = int(os.environ.get("PBKDF2_ITERATIONS", "200000"))
+ALL_BRANDS = "*"
+ROLES = ["admin", "user"]
+_VERIFIED_MAX = 1024
+
+_lock = threading.RLock()
+_cache = {"sig": None, "users": {}}
+_verified = {}                          # hmac(kredensial) -> username; dikosongkan saat file berubah
+_process_key = secrets.token_bytes(32)
+
+
+# ====== Hash password ======
+def hash_password(password, salt=None, iterations=PBKDF2_ITERATIONS):
+    salt = salt or secrets.token_hex(16)
+    dk = hashlib.pbkdf2_hmac("sha256", str(password).encode("utf-8"), bytes.fromhex(salt), iterations)
+    return f"pbkdf2_sha256${iterations}${salt}${dk.hex()}"
+
+
+def verify_password(password, encoded):
+    try:
+        algo, iterations, salt, _ = str(encoded).split("$")
+        iterations = int(iterations)
+    except ValueError:
+        return False
+    if algo != "pbkdf2_sha256":
+        return False
+    return hmac.compare_digest(hash_password(password, salt, iterations), encoded)
+
+
+# ====== Baca/tulis file ======
+@contextmanager
+def _file_lock():
+    """Kunci tulis antar thread & antar proses (UI/API/CLI)."""
+    with _lock:
+        fh = open(f"{USERS_FILE}.lock", "w") if _FCNTL_OK else None
+        try:
+            if fh is not None:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+            yield
+        finally:
+            if fh is not None:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+                fh.close()
+
+
+def exists():
+    return os.path.exists(USERS_FILE)
+
+
+def load_users():
+    """Dict username -> record; dibaca ulang hanya bila file berubah."""
+    try:
+        st_ = os.stat(USERS_FILE)
+        sig = (st_.st_mtime_ns, st_.st_size)
+    except OSError:
+        return {}
+    with _lock:
+        if _cache["sig"] != sig:
+            with open(USERS_FILE, "r") as f:
+                _cache["users"] = json.load(f).get("users", {})
+            _cache["sig"] = sig
+            _verified.clear()
+        return _cache["users"]
+
+
+def _write(users):
+    tmp = f"{USERS_FILE}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"users": users}, f, indent=4)
+    os.replace(tmp, USERS_FILE)
+
+
+def migrate_legacy(brand_users):
+    """Buat store dari user lama per brand ({brand: {username: {"password", "role"}}}); password di-hash.
+
+    Hak brand = brand tempat user itu tercatat ("*" bila ada di semua brand). Tidak melakukan apa pun bila store sudah ada.
+    """
+    with _file_lock():
+        if exists():
+            return load_users()
+        users = {}
+        for brand, recs in brand_users.items():
+            for uname, info in (recs or {}).items():
+                if not info or not info.get("password"):
+                    continue
+                u = users.setdefault(uname, {"password_hash": hash_password(info["password"]),
+                                             "role": info.get("role", "user"), "brands": []})
+                u["brands"].append(brand)
+        for u in users.values():
+            if set(u["brands"]) >= set(brand_users):
+                u["brands"] = [ALL_BRANDS]
+        _write(users)
+    return load_users()
+
+
+# ====== Query ======
+def public(username, rec):
+    """Record user tanpa hash password."""
+    return {"username": username, "role": rec.get("role", "user"), "brands": list(rec.get("brands") or [])}
+
+
+def get_user(username):
+    rec = load_users().get(username)
+    return public(username, rec) if rec else None
+
+
+def authenticate(username, password):
+    """Record user (tanpa hash) bila kredensial cocok, else None."""
+    users = load_users()
+    rec = users.get(username)
+    if not rec:
+        return None
+    key = hmac.new(_process_key, f"{username}\0{password}\0{rec.get('password_hash')}".encode("utf-8"), "sha256").digest()
+    if _verified.get(key) != username:
+        if not verify_password(password, rec.get("password_hash")):
+            return None
+        with _lock:
+            if len(_verified) >= _VERIFIED_MAX:
+                _verified.clear()
+            _verified[key] = username
+    return public(username, rec)
+
+
+def allowed_brands(user, brands):
+    """Brand (urutan `brands`) yang boleh diakses user."""
+    granted = set((user or {}).get("brands") or [])
+    return [b for b in brands if ALL_BRANDS in granted or b in granted]
+
+
+# ====== Pengelolaan ======
+def set_user(username, password=None, role=None, brands=None):
+    """Tambah/ubah user. Password wajib untuk user baru."""
+    with _file_lock():
+        users = dict(load_users())
+        rec = dict(users.get(username) or {"role": "user", "brands": [ALL_BRANDS]})
+        if password is None and "password_hash" not in rec:
+            raise ValueError("Password wajib untuk user baru.")
+        if password is not None:
+            rec["password_hash"] = hash_password(password)
+        if role is not None:
+            if role not in ROLES:
+                raise ValueError(f"Role harus salah satu dari {ROLES}.")
+            rec["role"] = role
+        if brands is not None:
+            rec["brands"] = list(brands)
+        users[username] = rec
+        _write(users)
+    return public(username, rec)
+
+
+def delete_user(username):
+    with _file_lock():
+        users = dict(load_users())
+        if users.pop(username, None) is None:
+            return False
+        _write(users)
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kelola user GLTKIMS")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list")
+    p_set = sub.add_parser("set")
+    p_set.add_argument("username")
+    p_set.add_argument("--role", choices=ROLES)
+    p_set.add_argument("--brands", help="daftar brand dipisah koma, atau * untuk semua")
+    p_set.add_argument("--keep-password", action="store_true", help="ubah role/brand saja")
+    p_del = sub.add_parser("delete")
+    p_del.add_argument("username")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "list":
+        for uname, rec in sorted(load_users().items()):
+            print(f"{uname:20} {rec.get('role', 'user'):6} {','.join(rec.get('brands') or [])}")
+    elif args.cmd == "set":
+        password = None if args.keep_password else getpass.getpass(f"Password untuk {args.username}: ")
+        brands = [b.strip() for b in args.brands.split(",") if b.strip()] if args.brands else None
+        print(set_user(args.username, password, args.role, brands))
+    elif args.cmd == "delete":
+        print("Dihapus." if delete_user(args.username) else "User tidak ditemukan.")
+
+
+if __name__ == "__main__":
+    main()